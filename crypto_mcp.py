@@ -1,6 +1,11 @@
 from fastmcp import FastMCP
 import requests
+from requests.adapters import HTTPAdapter
 import logging
+import atexit
+from email.utils import parsedate_to_datetime
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import time
 from typing import Optional, Dict, Any
 from datetime import datetime
@@ -18,9 +23,22 @@ from rich.text import Text
 from rich.progress import Progress, SpinnerColumn, TextColumn
 import argparse
 import sys
+import os
 from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
 import threading
+import heapq
+from abc import ABC, abstractmethod
+import queue
+import math
+import re
+import weakref
+from collections import OrderedDict, deque
+
+try:
+    import websockets
+except ImportError:  # Ticker streaming is optional; the REST tools work without it
+    websockets = None
 
 # Global variables
 alerts = []
@@ -37,40 +55,374 @@ logging.basicConfig(
 logger = logging.getLogger('Crypto_MCP')
 
 # Cache configuration
-CACHE_EXPIRY_SECONDS = 300  # 5 minutes
-price_cache: Dict[str, Dict[str, Any]] = {}
+CACHE_EXPIRY_SECONDS = 300  # 5 minutes (default TTL)
+CACHE_MAX_ENTRIES = 1000
+CACHE_MAX_BYTES = 50 * 1024 * 1024  # 50 MB of cached response payloads
+
+# Endpoint sınıfına göre TTL politikaları.
+# ttl: taze kabul edilme süresi; stale: süresi dolduktan sonra arka planda yenilenirken eski verinin sunulabileceği ek süre
+CACHE_TTL_POLICIES: Dict[str, Dict[str, float]] = {
+    'spot': {'ttl': 30, 'stale': 120},
+    'market': {'ttl': 120, 'stale': 300},
+    'history': {'ttl': 3600, 'stale': 6 * 3600},
+    'news': {'ttl': 900, 'stale': 3600},
+    'uniswap': {'ttl': 60, 'stale': 300},
+    'reference': {'ttl': 24 * 3600, 'stale': 24 * 3600},
+    'fx': {'ttl': 300, 'stale': 900},
+    'default': {'ttl': CACHE_EXPIRY_SECONDS, 'stale': 0},
+}
+
+# First matching class wins, so more specific URL fragments come first
+_ENDPOINT_CLASS_PATTERNS = [
+    ('history', ('/market_chart',)),
+    ('market', ('/coins/markets',)),
+    ('news', ('/news/',)),
+    ('uniswap', ('thegraph.com',)),
+    ('reference', ('/AssetPairs',)),
+    ('fx', ('/exchange_rates',)),
+    ('spot', ('/simple/price', '/ticker', '/tickers', '/Ticker', '/allTickers', '/orderbook/level1', 'coinstats.app/public/v1/coins/')),
+]
+
+def classify_endpoint(url: str) -> str:
+    """Map a request URL (or cache key) to its TTL policy class."""
+    for endpoint_class, fragments in _ENDPOINT_CLASS_PATTERNS:
+        if any(fragment in url for fragment in fragments):
+            return endpoint_class
+    return 'default'
+
+def get_cache_policy(url: str) -> Dict[str, float]:
+    return CACHE_TTL_POLICIES.get(classify_endpoint(url), CACHE_TTL_POLICIES['default'])
+
+
+class _CacheEntry:
+    """One cached response with its own TTL, stale window and payload size."""
+    __slots__ = ('data', 'timestamp', 'ttl', 'stale_ttl', 'size')
+
+    def __init__(self, data: Any, timestamp: float, ttl: float, stale_ttl: float, size: int):
+        self.data = data
+        self.timestamp = timestamp
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.size = size
+
+
+def estimate_payload_size(data: Any) -> int:
+    """Size of a response payload in bytes (compact JSON encoding)."""
+    try:
+        return len(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+    except (TypeError, ValueError):
+        return sys.getsizeof(data)
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache with per-entry TTL, bounded by entry count and payload bytes.
+
+    Lookups and inserts are O(1); the least recently used entries are evicted when
+    either budget is exceeded. Hit/miss/eviction/expiration counters are kept for
+    get_cache_status.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 default_ttl: float = CACHE_EXPIRY_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _remove(self, key: str) -> _CacheEntry:
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+        return entry
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return cached data, or None if missing or expired."""
+        data, is_stale = self.lookup(key, allow_stale=False)
+        return data
+
+    def peek(self, key: str) -> Optional[_CacheEntry]:
+        """Return the raw entry (with its timestamp/ttl) without touching LRU order or counters."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def lookup(self, key: str, allow_stale: bool = True):
+        """
+        Return (data, is_stale). Entries past their TTL but inside their stale window are
+        kept and, if allow_stale is set, returned with is_stale=True.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+
+            age = time.time() - entry.timestamp
+            if age < entry.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.data, False
+
+            if age < entry.ttl + entry.stale_ttl:
+                if allow_stale:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    return entry.data, True
+            else:
+                self._remove(key)
+                self.expirations += 1
+                logger.info(f"Cache expired for {key}")
+            self.misses += 1
+            return None, False
+
+    def set(self, key: str, data: Any, ttl: Optional[float] = None, size: Optional[int] = None,
+            stale_ttl: float = 0, timestamp: Optional[float] = None) -> bool:
+        """Store data; returns False if the payload alone exceeds the byte budget."""
+        if size is None:
+            size = estimate_payload_size(data)
+        if size > self.max_bytes:
+            logger.warning(f"Not caching {key}: {size} bytes exceeds cache budget")
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(data, time.time() if timestamp is None else timestamp,
+                                             self.default_ttl if ttl is None else ttl, stale_ttl, size)
+            self.total_bytes += size
+
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                evicted_key, _ = next(iter(self._entries.items()))
+                self._remove(evicted_key)
+                self.evictions += 1
+                logger.info(f"Evicted cache entry: {evicted_key}")
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> int:
+        """Remove every entry and return how many were removed."""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self.total_bytes = 0
+            return removed
+
+    def purge_expired(self) -> list:
+        """Remove entries that are past their TTL and stale window; return their keys."""
+        current_time = time.time()
+        with self._lock:
+            expired_keys = [
+                key for key, entry in self._entries.items()
+                if current_time - entry.timestamp >= entry.ttl + entry.stale_ttl
+            ]
+            for key in expired_keys:
+                self._remove(key)
+            self.expirations += len(expired_keys)
+        return expired_keys
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'stale_hits': self.stale_hits,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+# Disk cache tier: process yeniden başlatıldığında cache sıcak kalsın diye crypto_data.db'nin yanında tutulur
+CACHE_DB_PATH = 'crypto_cache.db'
+DISK_CACHE_ENABLED = True
+# Yalnızca uzun TTL'li sınıflar diske yazılır; 30 sn'lik spot fiyatlar ve büyük ticker tabloları
+# istek yolunda SQLite yazımına değmez ve yeniden başlatmadan sonra zaten bayat olur.
+DISK_CACHE_CLASSES = frozenset({'history', 'market', 'reference', 'fx'})
+DISK_CACHE_SWEEP_SECONDS = 600  # Süresi dolmuş satırlar en fazla bu aralıkla, yazma sırasında silinir
+
+
+class DiskCache:
+    """
+    SQLite-backed second cache tier that survives restarts.
+
+    The database is opened lazily on first use (one connection per thread) and
+    entries are loaded one key at a time on memory misses. Entries keep their
+    original store time, TTL and stale window, so the in-memory TTL rules apply
+    unchanged after a restart. Reads never write: expired rows are skipped and
+    removed by a periodic sweep piggybacked on set().
+    """
+
+    def __init__(self, path: str = CACHE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS api_cache (
+                    key TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    ttl REAL NOT NULL,
+                    stale_ttl REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[_CacheEntry]:
+        """Return the stored entry, or None if missing or past its stale window."""
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT data, stored_at, ttl, stale_ttl FROM api_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        payload, stored_at, ttl, stale_ttl = row
+        if time.time() - stored_at >= ttl + stale_ttl:
+            return None  # Left for the sweep
+        return _CacheEntry(json.loads(payload), stored_at, ttl, stale_ttl, len(payload))
+
+    def set(self, key: str, payload: str, stored_at: float, ttl: float, stale_ttl: float) -> None:
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO api_cache (key, data, stored_at, ttl, stale_ttl) VALUES (?, ?, ?, ?, ?)',
+            (key, payload, stored_at, ttl, stale_ttl)
+        )
+        conn.commit()
+        self._maybe_sweep()
+
+    def _maybe_sweep(self) -> None:
+        with self._sweep_lock:
+            if time.time() - self._last_sweep < DISK_CACHE_SWEEP_SECONDS:
+                return
+            self._last_sweep = time.time()
+        self.purge_expired()
+
+    def clear(self) -> int:
+        conn = self._connection()
+        removed = conn.execute('DELETE FROM api_cache').rowcount
+        conn.commit()
+        return removed
+
+    def purge_expired(self) -> int:
+        conn = self._connection()
+        removed = conn.execute(
+            'DELETE FROM api_cache WHERE stored_at + ttl + stale_ttl <= ?', (time.time(),)
+        ).rowcount
+        conn.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        count, total_bytes = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM api_cache'
+        ).fetchone()
+        return {'entries': count, 'bytes': total_bytes, 'path': self.path}
+
+
+price_cache = ResponseCache()
+disk_cache = DiskCache(CACHE_DB_PATH)
+
+def _disk_cacheable(key: str) -> bool:
+    return DISK_CACHE_ENABLED and classify_endpoint(key) in DISK_CACHE_CLASSES
+
+def _load_from_disk(key: str) -> bool:
+    """Promote a disk entry into the memory tier; returns True if one was found."""
+    if not _disk_cacheable(key):
+        return False
+    try:
+        entry = disk_cache.get(key)
+    except sqlite3.Error as e:
+        logger.warning(f"Disk cache read failed for {key}: {e}")
+        return False
+    if entry is None:
+        return False
+
+    price_cache.set(key, entry.data, ttl=entry.ttl, size=entry.size,
+                    stale_ttl=entry.stale_ttl, timestamp=entry.timestamp)
+    logger.info(f"Loaded {key} from disk cache")
+    return True
+
+def lookup_cached_data(key: str, allow_stale: bool = True):
+    """Memory first, then disk. Returns (data, is_stale) like ResponseCache.lookup."""
+    if key not in price_cache:
+        _load_from_disk(key)
+    return price_cache.lookup(key, allow_stale=allow_stale)
 
 def get_cached_data(key: str) -> Optional[Any]:
     """Get data from cache if not expired."""
-    if key in price_cache:
-        cached_item = price_cache[key]
-        if time.time() - cached_item['timestamp'] < CACHE_EXPIRY_SECONDS:
-            logger.info(f"Cache hit for {key}")
-            return cached_item['data']
-        else:
-            # Remove expired cache entry
-            del price_cache[key]
-            logger.info(f"Cache expired for {key}")
-    return None
+    data, _ = lookup_cached_data(key, allow_stale=False)
+    if data is not None:
+        logger.info(f"Cache hit for {key}")
+    return data
+
+def set_cached_data(key: str, data: Any, ttl: Optional[float] = None, stale_ttl: Optional[float] = None) -> None:
+    """Store data in the memory tier (and on disk for DISK_CACHE_CLASSES). TTL defaults to the key's endpoint policy."""
+    policy = get_cache_policy(key)
+    if ttl is None:
+        ttl = policy['ttl']
+    if stale_ttl is None:
+        stale_ttl = policy['stale']
 
-def set_cached_data(key: str, data: Any) -> None:
-    """Store data in cache with timestamp."""
-    price_cache[key] = {
-        'data': data,
-        'timestamp': time.time()
-    }
+    try:
+        payload = json.dumps(data, separators=(',', ':'))
+    except (TypeError, ValueError):
+        payload = None
+    size = len(payload.encode('utf-8')) if payload is not None else None
+
+    stored_at = time.time()
+    if not price_cache.set(key, data, ttl=ttl, size=size, stale_ttl=stale_ttl, timestamp=stored_at):
+        return
     logger.info(f"Cached data for {key}")
 
-def clear_expired_cache() -> None:
+    if payload is not None and _disk_cacheable(key):
+        try:
+            disk_cache.set(key, payload, stored_at, ttl, stale_ttl)
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache write failed for {key}: {e}")
+
+def clear_expired_cache() -> int:
     """Remove all expired cache entries."""
-    current_time = time.time()
-    expired_keys = [
-        key for key, item in price_cache.items()
-        if current_time - item['timestamp'] >= CACHE_EXPIRY_SECONDS
-    ]
+    expired_keys = price_cache.purge_expired()
     for key in expired_keys:
-        del price_cache[key]
         logger.info(f"Removed expired cache entry: {key}")
+    if DISK_CACHE_ENABLED:
+        try:
+            disk_cache.purge_expired()
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache purge failed: {e}")
+    return len(expired_keys)
 
 # Özel exception sınıfları
 class CryptoAPIError(Exception):
@@ -82,7 +434,7 @@ class CryptoAPIError(Exception):
 
 class APIRateLimitError(CryptoAPIError):
     """API rate limit hatası"""
-    pass
+    retry_after: Optional[float] = None  # Saniye cinsinden, biliniyorsa
 
 class APINetworkError(CryptoAPIError):
     """API network hatası"""
@@ -92,18 +444,457 @@ class APIDataError(CryptoAPIError):
     """API veri hatası"""
     pass
 
+class APICircuitOpenError(APINetworkError):
+    """Provider circuit breaker açık; istek gönderilmedi"""
+    pass
+
 mcp = FastMCP("Crypto_MCP")
 
+# HTTP connection pool configuration
+HTTP_POOL_CONNECTIONS = 10  # Number of per-host pools kept by each provider session
+HTTP_POOL_MAXSIZE = 20  # Max keep-alive connections per host (concurrent MCP/REST/monitor callers)
+HTTP_KEEP_ALIVE = True
+HTTP_POOL_OVERRIDES: Dict[str, Dict[str, int]] = {}  # e.g. {"CoinGecko": {"pool_maxsize": 40}}
+http_sessions: Dict[str, requests.Session] = {}
+_http_sessions_lock = threading.Lock()
+
+def get_http_session(api_name: str) -> requests.Session:
+    """
+    Provider başına paylaşılan, keep-alive destekli HTTP session'ını döndürür.
+
+    Aynı provider'a giden tüm çağrılar (MCP araçları, REST API, alert monitor thread'i)
+    tek bir connection pool kullanır; böylece DNS + TCP + TLS handshake her istekte tekrarlanmaz.
+    """
+    session = http_sessions.get(api_name)
+    if session is not None:
+        return session
+
+    with _http_sessions_lock:
+        session = http_sessions.get(api_name)
+        if session is None:
+            pool_settings = HTTP_POOL_OVERRIDES.get(api_name, {})
+            adapter = HTTPAdapter(
+                pool_connections=pool_settings.get('pool_connections', HTTP_POOL_CONNECTIONS),
+                pool_maxsize=pool_settings.get('pool_maxsize', HTTP_POOL_MAXSIZE)
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({
+                'Accept': 'application/json',
+                'Connection': 'keep-alive' if HTTP_KEEP_ALIVE else 'close'
+            })
+            http_sessions[api_name] = session
+            logger.info(f"Created HTTP session for {api_name}")
+    return session
+
+def configure_http_pool(pool_connections: Optional[int] = None, pool_maxsize: Optional[int] = None,
+                        keep_alive: Optional[bool] = None, api_name: Optional[str] = None) -> None:
+    """
+    Connection pool ayarlarını değiştirir. api_name verilirse sadece o provider için override yapılır.
+    Mevcut session'lar kapatılır; yeni ayarlar bir sonraki çağrıda uygulanır.
+    """
+    global HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_KEEP_ALIVE
+
+    if api_name:
+        overrides = HTTP_POOL_OVERRIDES.setdefault(api_name, {})
+        if pool_connections is not None:
+            overrides['pool_connections'] = pool_connections
+        if pool_maxsize is not None:
+            overrides['pool_maxsize'] = pool_maxsize
+    else:
+        if pool_connections is not None:
+            HTTP_POOL_CONNECTIONS = pool_connections
+        if pool_maxsize is not None:
+            HTTP_POOL_MAXSIZE = pool_maxsize
+    if keep_alive is not None:
+        HTTP_KEEP_ALIVE = keep_alive
+
+    close_http_sessions(api_name)
+
+def close_http_sessions(api_name: Optional[str] = None) -> None:
+    """Close pooled sessions (all providers, or only the given one)."""
+    with _http_sessions_lock:
+        names = [api_name] if api_name else list(http_sessions.keys())
+        for name in names:
+            session = http_sessions.pop(name, None)
+            if session is not None:
+                session.close()
+
+atexit.register(close_http_sessions)
+
+# Client-side rate limiting
+# Provider başına token bucket; bütçeler API'lerin yayınlanmış public limitlerine göre ayarlandı.
+# rate: saniyede istek, burst: art arda gönderilebilecek en fazla istek
+PROVIDER_RATE_LIMITS: Dict[str, Dict[str, float]] = {
+    'CoinGecko': {'rate': 30 / 60, 'burst': 5},  # Free/demo tier: ~30 calls/min
+    'CoinStats': {'rate': 1.0, 'burst': 5},
+    'CoinPaprika': {'rate': 10.0, 'burst': 10},
+    'Binance': {'rate': 20.0, 'burst': 50},  # 1200 request weight/min per IP
+    'Kraken': {'rate': 1.0, 'burst': 15},  # Public counter: max 15, decays 1/s
+    'Bybit': {'rate': 20.0, 'burst': 50},
+    'KuCoin': {'rate': 10.0, 'burst': 30},
+    'CryptoCompare': {'rate': 20.0, 'burst': 50},
+    'Uniswap': {'rate': 5.0, 'burst': 10},
+}
+RATE_LIMIT_MAX_WAIT_SECONDS = 5.0  # Queue up to this long for a token, then shed the request
+RATE_LIMIT_DEFAULT_BACKOFF_SECONDS = 10.0  # Backoff after a 429 without Retry-After
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter for one provider.
+
+    Requests wait for a token up to a bounded time and are shed with APIRateLimitError
+    when the wait would be longer. A 429 response blocks the bucket until Retry-After
+    (or a default backoff) and halves the refill rate; successes restore it gradually.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.delayed = 0
+        self.shed = 0
+        self.throttled = 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait: Optional[float] = None) -> float:
+        """Take one token, sleeping if needed. Returns the time waited."""
+        if max_wait is None:
+            max_wait = RATE_LIMIT_MAX_WAIT_SECONDS
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait_time = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.acquired += 1
+                    if waited:
+                        self.delayed += 1
+                    return waited
+                else:
+                    wait_time = (1 - self.tokens) / self.rate
+
+                if waited + wait_time > max_wait:
+                    self.shed += 1
+                    error = APIRateLimitError(
+                        f"Client-side rate limit reached, retry in {wait_time:.1f}s", self.name
+                    )
+                    error.retry_after = wait_time
+                    raise error
+
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """Back off after the provider answered 429."""
+        with self._lock:
+            backoff = retry_after if retry_after is not None else RATE_LIMIT_DEFAULT_BACKOFF_SECONDS
+            self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+            self.rate = max(self.base_rate * 0.1, self.rate * 0.5)
+            self.tokens = 0.0
+            self.throttled += 1
+
+    def on_success(self) -> None:
+        """Additively recover the refill rate after a backoff."""
+        if self.rate < self.base_rate:
+            with self._lock:
+                self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+
+    def headroom(self) -> float:
+        """Fraction of the burst currently available (0.0 - 1.0)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return 0.0
+            return self.tokens / self.capacity
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'rate': self.rate,
+            'base_rate': self.base_rate,
+            'headroom': self.headroom(),
+            'blocked_for': max(0.0, self.blocked_until - time.monotonic()),
+            'acquired': self.acquired,
+            'delayed': self.delayed,
+            'shed': self.shed,
+            'throttled': self.throttled
+        }
+
+
+rate_limiters: Dict[str, TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(api_name: str) -> Optional[TokenBucket]:
+    """Return the provider's token bucket, or None if it has no configured budget."""
+    limiter = rate_limiters.get(api_name)
+    if limiter is None and api_name in PROVIDER_RATE_LIMITS:
+        with _rate_limiters_lock:
+            limiter = rate_limiters.get(api_name)
+            if limiter is None:
+                budget = PROVIDER_RATE_LIMITS[api_name]
+                limiter = TokenBucket(api_name, budget['rate'], budget['burst'])
+                rate_limiters[api_name] = limiter
+    return limiter
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+# Circuit breaker: sürekli hata veren provider'lar timeout beklenmeden atlanır
+CIRCUIT_FAILURE_THRESHOLD = 3  # Consecutive failures before the circuit opens
+CIRCUIT_RECOVERY_SECONDS = 30.0  # Time open before a half-open probe is allowed
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    closed: requests flow normally. After CIRCUIT_FAILURE_THRESHOLD consecutive
+    failures it opens and requests are rejected at once. After the recovery time it
+    turns half-open and lets a single probe through; the probe's result closes or
+    re-opens the circuit.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = CIRCUIT_RECOVERY_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def is_open(self) -> bool:
+        """True while requests should be skipped without trying (no state change)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.recovery_timeout
+            return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def allow_request(self) -> bool:
+        """Admit a request, moving open -> half-open when the recovery time has passed."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                logger.info(f"Circuit half-open for {self.name}, sending probe")
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def reject(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit closed for {self.name}")
+            self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit opened for {self.name} after {self.consecutive_failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'successes': self.successes,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'retry_in': retry_in
+            }
+
+
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(api_name: str) -> CircuitBreaker:
+    breaker = circuit_breakers.get(api_name)
+    if breaker is None:
+        with _circuit_breakers_lock:
+            breaker = circuit_breakers.setdefault(api_name, CircuitBreaker(api_name))
+    return breaker
+
+def _is_provider_failure(error: CryptoAPIError) -> bool:
+    """Errors that say the provider itself is unhealthy (not a bad symbol or a throttle)."""
+    if isinstance(error, (APIRateLimitError, APICircuitOpenError)):
+        return False
+    if error.status_code is not None:
+        return error.status_code >= 500
+    return True  # Timeouts, connection failures, unparseable responses
+
+# Provider istatistikleri: gecikme EWMA'sı, başarı oranı ve rate limit payı ile adaptif sıralama
+ADAPTIVE_ROUTING = True  # Reorder fallback chains by expected time-to-answer
+PROVIDER_STATS_EWMA_ALPHA = 0.2  # Weight of the newest sample
+PROVIDER_STATS_DEFAULT_LATENCY = 0.5  # Seconds assumed for providers with no samples yet
+PROVIDER_STATS_MIN_SUCCESS = 0.05  # Floor so a failing provider sinks to the end but keeps a finite score
+PROVIDER_STATS_MIN_HEADROOM = 0.1
+
+class ProviderStats:
+    """Bir provider'ın gecikme ve başarı oranının üstel hareketli ortalamaları."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latency_ewma: Optional[float] = None
+        self.success_ewma = 1.0
+        self.requests = 0
+        self.failures = 0
+        self.last_latency: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, success: bool) -> None:
+        alpha = PROVIDER_STATS_EWMA_ALPHA
+        with self._lock:
+            self.requests += 1
+            self.last_latency = latency
+            if not success:
+                self.failures += 1
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += alpha * (latency - self.latency_ewma)
+            self.success_ewma += alpha * ((1.0 if success else 0.0) - self.success_ewma)
+
+    def expected_latency(self) -> float:
+        """
+        Beklenen cevap süresi: ortalama gecikme / başarı oranı, rate limit payı azaldıkça artar.
+        Düşük olan önce denenir.
+        """
+        latency = PROVIDER_STATS_DEFAULT_LATENCY if self.latency_ewma is None else self.latency_ewma
+        score = latency / max(self.success_ewma, PROVIDER_STATS_MIN_SUCCESS)
+        limiter = rate_limiters.get(self.name)
+        if limiter is not None:
+            score /= max(limiter.headroom(), PROVIDER_STATS_MIN_HEADROOM)
+        return score
+
+    def status(self) -> Dict[str, Any]:
+        limiter = rate_limiters.get(self.name)
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'latency_ewma_ms': None if self.latency_ewma is None else round(self.latency_ewma * 1000, 1),
+            'last_latency_ms': None if self.last_latency is None else round(self.last_latency * 1000, 1),
+            'success_rate': round(self.success_ewma, 3),
+            'headroom': None if limiter is None else round(limiter.headroom(), 3),
+            'score_ms': round(self.expected_latency() * 1000, 1)
+        }
+
+provider_stats: Dict[str, ProviderStats] = {}
+_provider_stats_lock = threading.Lock()
+
+def get_provider_stats(api_name: str) -> ProviderStats:
+    with _provider_stats_lock:
+        if api_name not in provider_stats:
+            provider_stats[api_name] = ProviderStats(api_name)
+        return provider_stats[api_name]
+
+def rank_providers(names: list, key=None) -> list:
+    """
+    Provider'ları beklenen cevap süresine göre sıralar (stabil: eşitlikte verilen sıra korunur).
+
+    Args:
+        names: Sıralanacak öğeler
+        key: Öğeden provider adını çıkaran fonksiyon (varsayılan: öğenin kendisi)
+    """
+    if not ADAPTIVE_ROUTING:
+        return list(names)
+    key = key or (lambda item: item)
+    return sorted(names, key=lambda item: get_provider_stats(key(item)).expected_latency())
+
+# Single-flight: aynı anda yapılan özdeş istekler tek bir upstream çağrısını paylaşır
+SINGLE_FLIGHT_WAIT_SECONDS = 60  # Upper bound for followers waiting on a leader's fetch
+
+class _InFlightRequest:
+    """Shared state for one in-flight upstream request."""
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+_inflight_requests: Dict[str, _InFlightRequest] = {}
+_inflight_lock = threading.Lock()
+single_flight_stats = {'upstream_calls': 0, 'coalesced_calls': 0}
+
+def make_request_key(url: str, json_body: Optional[Dict[str, Any]] = None) -> str:
+    """Cache / single-flight anahtarı: GET için URL, POST için URL + gövde."""
+    if json_body is None:
+        return url
+    return f"{url}|{json.dumps(json_body, sort_keys=True, separators=(',', ':'))}"
+
 # API çağrısı için güvenli wrapper
-def safe_api_call(url: str, api_name: str, timeout: int = 10, use_cache: bool = True) -> Dict[str, Any]:
+def safe_api_call(url: str, api_name: str, timeout: int = 10, use_cache: bool = True,
+                  json_body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     API çağrısı yapan güvenli wrapper fonksiyon.
 
+    Aynı anahtar için zaten devam eden bir istek varsa yeni istek gönderilmez; çağıran
+    thread o isteğin sonucunu (veya hatasını) bekler.
+
     Args:
         url: API endpoint URL'i
         api_name: API adı (logging için)
         timeout: Timeout süresi (saniye)
         use_cache: Cache kullanılıp kullanılmayacağı
+        json_body: Verilirse istek POST olarak bu JSON gövdesiyle gönderilir
 
     Returns:
         API response JSON
@@ -111,28 +902,146 @@ def safe_api_call(url: str, api_name: str, timeout: int = 10, use_cache: bool =
     Raises:
         CryptoAPIError: API hatası durumunda
     """
+    key = make_request_key(url, json_body)
+
     # Check cache first if enabled
     if use_cache:
-        cached_data = get_cached_data(url)
+        cached_data, is_stale = lookup_cached_data(key)
         if cached_data is not None:
+            if is_stale:
+                logger.info(f"Serving stale cache for {key} while refreshing")
+                _schedule_background_refresh(key, url, api_name, timeout, json_body)
+            else:
+                logger.info(f"Cache hit for {key}")
             return cached_data
 
+    return _single_flight_fetch(key, url, api_name, timeout, use_cache, json_body)
+
+def _single_flight_fetch(key: str, url: str, api_name: str, timeout: int, use_cache: bool,
+                         json_body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fetch from upstream, sharing the request with concurrent callers for the same key."""
+    with _inflight_lock:
+        call = _inflight_requests.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _InFlightRequest()
+            _inflight_requests[key] = call
+            single_flight_stats['upstream_calls'] += 1
+        else:
+            single_flight_stats['coalesced_calls'] += 1
+
+    if not is_leader:
+        logger.info(f"Joining in-flight {api_name} request: {url}")
+        if not call.event.wait(SINGLE_FLIGHT_WAIT_SECONDS):
+            raise APINetworkError("Timed out waiting for in-flight request", api_name)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        data = _fetch_api_response(url, api_name, timeout, json_body)
+
+        # Cache the successful response
+        if use_cache:
+            set_cached_data(key, data)
+
+        call.result = data
+        return data
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight_requests.pop(key, None)
+        call.event.set()
+
+# Stale-while-revalidate: süresi geçmiş veri hemen döner, yenileme arka planda yapılır
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='crypto-refresh')
+_refreshing_keys: set = set()
+_refreshing_lock = threading.Lock()
+refresh_stats = {'scheduled': 0, 'failed': 0}
+
+def _schedule_background_refresh(key: str, url: str, api_name: str, timeout: int,
+                                 json_body: Optional[Dict[str, Any]] = None) -> bool:
+    """Queue one background refresh per key; returns False if one is already pending."""
+    with _refreshing_lock:
+        if key in _refreshing_keys:
+            return False
+        _refreshing_keys.add(key)
+        refresh_stats['scheduled'] += 1
+
+    def refresh():
+        try:
+            _single_flight_fetch(key, url, api_name, timeout, True, json_body)
+        except CryptoAPIError as e:
+            refresh_stats['failed'] += 1
+            logger.warning(f"Background refresh failed for {key}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing_keys.discard(key)
+
+    _refresh_executor.submit(refresh)
+    return True
+
+def _fetch_api_response(url: str, api_name: str, timeout: int,
+                        json_body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run one upstream request through the provider's circuit breaker and rate limiter."""
+    breaker = get_circuit_breaker(api_name)
+    if breaker.is_open():
+        breaker.reject()
+        raise APICircuitOpenError("Circuit open, provider temporarily skipped", api_name)
+
+    limiter = get_rate_limiter(api_name)
+    if limiter is not None:
+        limiter.acquire()
+
+    if not breaker.allow_request():
+        raise APICircuitOpenError("Circuit open, provider temporarily skipped", api_name)
+
+    stats = get_provider_stats(api_name)
+    started = time.monotonic()
+    try:
+        data = _send_api_request(url, api_name, timeout, json_body, limiter)
+    except CryptoAPIError as e:
+        provider_failed = _is_provider_failure(e)
+        if provider_failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        # A 4xx for an unknown symbol is still a prompt answer; throttles and outages are not
+        stats.record(time.monotonic() - started, success=not (provider_failed or isinstance(e, APIRateLimitError)))
+        raise
+
+    stats.record(time.monotonic() - started, success=True)
+    breaker.record_success()
+    return data
+
+def _send_api_request(url: str, api_name: str, timeout: int, json_body: Optional[Dict[str, Any]] = None,
+                      limiter: Optional[TokenBucket] = None) -> Dict[str, Any]:
+    """Perform the upstream HTTP request and map failures to CryptoAPIError subclasses."""
     try:
         logger.info(f"Calling {api_name} API: {url}")
-        response = requests.get(url, timeout=timeout)
+        session = get_http_session(api_name)
+        if json_body is None:
+            response = session.get(url, timeout=timeout)
+        else:
+            response = session.post(url, json=json_body, timeout=timeout)
 
         if response.status_code == 429:
-            logger.warning(f"Rate limit exceeded for {api_name}")
-            raise APIRateLimitError("Rate limit exceeded", api_name, response.status_code)
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            logger.warning(f"Rate limit exceeded for {api_name} (Retry-After: {retry_after})")
+            if limiter is not None:
+                limiter.on_rate_limited(retry_after)
+            error = APIRateLimitError("Rate limit exceeded", api_name, response.status_code)
+            error.retry_after = retry_after
+            raise error
 
         response.raise_for_status()  # HTTP hatalarını yakala
 
         data = response.json()
         logger.info(f"Successfully received data from {api_name}")
-
-        # Cache the successful response
-        if use_cache:
-            set_cached_data(url, data)
+        if limiter is not None:
+            limiter.on_success()
 
         return data
 
@@ -168,153 +1077,1478 @@ def safe_api_call(url: str, api_name: str, timeout: int = 10, use_cache: bool =
         logger.error(f"Unexpected error for {api_name}: {e}")
         raise CryptoAPIError(f"Unexpected error: {str(e)}", api_name)
 
+# Async HTTP core
+ASYNC_HTTP_WORKERS = 32  # Concurrent blocking HTTP calls the event loop can have in flight
+_async_http_executor = ThreadPoolExecutor(max_workers=ASYNC_HTTP_WORKERS, thread_name_prefix='crypto-http')
+
+async def async_safe_api_call(url: str, api_name: str, timeout: int = 10, use_cache: bool = True,
+                              json_body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    safe_api_call'ın asyncio varyantı.
+
+    Bellek cache'i hit'leri event loop üzerinde anında döner (disk katmanına burada bakılmaz;
+    o da worker thread'deki safe_api_call'da okunur). Cache miss durumunda istek, pooled
+    session'ları kullanan safe_api_call ile ayrı bir worker thread'de yapılır; böylece
+    aynı event loop'taki diğer tool çağrıları beklemeden devam eder. Hata sınıfları
+    (CryptoAPIError, APIRateLimitError, ...) ve cache davranışı safe_api_call ile aynıdır.
+    """
+    if use_cache:
+        cached_data, _ = price_cache.lookup(make_request_key(url, json_body), allow_stale=False)
+        if cached_data is not None:
+            return cached_data
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _async_http_executor,
+        lambda: safe_api_call(url, api_name, timeout=timeout, use_cache=use_cache, json_body=json_body)
+    )
+
 # Graceful degradation için alternatif API'ler
-def get_crypto_price_with_fallback(coin_name: str) -> str:
+def resolve_coin_ids(coin_name: str) -> Optional[tuple]:
     """
-    Birden fazla API'yi deneyerek kripto para fiyatını alır.
-    İlk çalışan API'yi kullanır.
+    Kullanıcı girdisini (CoinGecko id, CoinPaprika id) ikilisine çevirir.
+
+    Sembol indeksi hazırsa ve coin hiçbir sağlayıcıda yoksa None döner (istek atılmamalı).
+    İndeks yoksa girdi CoinGecko id'si kabul edilir; CoinPaprika id'si sadece bilinen coin'ler için verilir.
     """
-    apis = [
+    ids = symbol_index.resolve(coin_name)
+    if ids is not None:
+        return ids['coingecko'], ids['coinpaprika']
+    if symbol_index.is_ready():
+        return None
+    coin_id = coin_name.strip().lower()
+    for coingecko_id, paprika_id in _COMMON_ASSETS.values():
+        if coingecko_id == coin_id:
+            return coin_id, paprika_id
+    return coin_id, None
+
+def _price_providers(coin_name: str) -> list:
+    """Fallback zincirindeki fiyat API'lerini sırasıyla döndürür; coin'i çözemeyen sağlayıcılar atlanır."""
+    ids = resolve_coin_ids(coin_name)
+    if ids is None:
+        return []
+    coingecko_id, paprika_id = ids
+
+    providers = [
         {
             "name": "CoinGecko",
-            "url": f"https://api.coingecko.com/api/v3/simple/price?ids={coin_name}&vs_currencies=usd",
-            "parser": lambda data: data.get(coin_name, {}).get('usd')
+            "coin": coin_name,
+            "url": f"https://api.coingecko.com/api/v3/simple/price?ids={coingecko_id}&vs_currencies=usd",
+            "parser": lambda data: data.get(coingecko_id, {}).get('usd')
         },
         {
             "name": "CoinStats",
-            "url": f"https://api.coinstats.app/public/v1/coins/{coin_name}",
+            "coin": coin_name,
+            "url": f"https://api.coinstats.app/public/v1/coins/{coingecko_id}",
             "parser": lambda data: data.get('coin', {}).get('price')
-        },
-        {
-            "name": "CoinPaprika",
-            "url": f"https://api.coinpaprika.com/v1/tickers/{coin_name}-bitcoin",
-            "parser": lambda data: data.get('quotes', {}).get('USD', {}).get('price')
         }
     ]
+    if paprika_id:
+        providers.append({
+            "name": "CoinPaprika",
+            "coin": coin_name,
+            "url": f"https://api.coinpaprika.com/v1/tickers/{paprika_id}",
+            "parser": lambda data: data.get('quotes', {}).get('USD', {}).get('price')
+        })
+    return providers
 
-    last_error = None
+# Hedged fallback configuration
+FALLBACK_HEDGED = True  # Launch the next provider if the current one is slow instead of waiting out its timeout
+FALLBACK_HEDGE_DELAY_SECONDS = 0.5  # Stagger between provider launches (0 = fire all at once)
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='crypto-hedge')
 
+def _available_providers(apis: list) -> list:
+    """Drop providers whose circuit is open so the chain does not wait on them."""
+    available = []
     for api in apis:
-        try:
-            data = safe_api_call(api["url"], api["name"])
-            price = api["parser"](data)
+        if get_circuit_breaker(api["name"]).is_open():
+            logger.info(f"Skipping {api['name']}: circuit open")
+            continue
+        available.append(api)
+    return available
 
-            if price is not None:
-                logger.info(f"Successfully got price from {api['name']}: ${price}")
-                return f"{coin_name.capitalize()} price: ${price} (via {api['name']})"
+def format_price(price: float) -> str:
+    """Fiyatı bilimsel gösterim olmadan yazar (1e-05 yerine 0.00001); kur çevrimi gürültüsü 12 anlamlı haneye yuvarlanır."""
+    return np.format_float_positional(float(f"{float(price):.12g}"), trim='-')
 
-        except CryptoAPIError as e:
-            logger.warning(f"Failed to get price from {api['name']}: {e}")
-            last_error = e
-            continue
+class PriceQuote:
+    """
+    Tek bir fiyat sonucu: coin, fiyat (USD), kaynak provider, verinin alındığı zaman
+    ve bayat (stale-while-revalidate) olup olmadığı.
+
+    İç API bu nesneyi döndürür; metne çevirme sadece MCP tool sınırında format() ile yapılır.
+    """
+    __slots__ = ('coin', 'price', 'source', 'timestamp', 'stale', 'currency')
+
+    def __init__(self, coin: str, price: float, source: str, timestamp: Optional[float] = None,
+                 stale: bool = False, currency: str = 'USD'):
+        self.coin = coin
+        self.price = float(price)
+        self.source = source
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.stale = stale
+        self.currency = currency
+
+    @property
+    def age(self) -> float:
+        """Verinin yaşı (saniye)"""
+        return max(0.0, time.time() - self.timestamp)
+
+    def convert(self, currency: str) -> 'PriceQuote':
+        """Aynı fiyatı başka bir para biriminde döndürür (kur matrisinden, yerel hesap)."""
+        currency = normalize_currency(currency)
+        if currency == self.currency:
+            return self
+        return PriceQuote(self.coin, self.price * fx_rate(self.currency, currency), self.source,
+                          timestamp=self.timestamp, stale=self.stale, currency=currency)
+
+    def format(self) -> str:
+        return f"{self.coin.capitalize()} price: {format_money(self.price, self.currency)} (via {self.source})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'coin': self.coin,
+            'price': self.price,
+            'currency': self.currency,
+            'source': self.source,
+            'timestamp': datetime.fromtimestamp(self.timestamp).isoformat(),
+            'age_seconds': round(self.age, 3),
+            'stale': self.stale
+        }
+
+    def __repr__(self) -> str:
+        return f"PriceQuote({self.coin!r}, {self.price!r} {self.currency}, source={self.source!r}, stale={self.stale})"
+
+class PriceUnavailableError(CryptoAPIError):
+    """Fallback zincirindeki hiçbir provider fiyat döndüremedi"""
+    def __init__(self, coin_name: str, message: str):
+        self.coin_name = coin_name
+        self.message = message
+        super().__init__(message, "PriceFallback")
+
+# Döviz/çapraz kur matrisi: CoinGecko exchange_rates TTL başına bir kez çekilir,
+# tüm çeviriler yerelde numpy ile yapılır (fiyat endpoint'leri hep USD ile çağrılır).
+FX_RATES_URL = "https://api.coingecko.com/api/v3/exchange_rates"
+BASE_CURRENCY = 'USD'
 
+class FxMatrix:
+    """
+    exchange_rates yanıtından kurulan kur tablosu.
+
+    per_usd[i]: 1 USD karşılığı i para biriminden kaç birim. Çapraz kur matrisi
+    matrix[i, j] = 1 birim i'nin j cinsinden değeri; ilk kullanımda hesaplanır.
+    """
+
+    def __init__(self, rates: Dict[str, Dict[str, Any]]):
+        self.currencies = sorted(code.upper() for code in rates)
+        self.index = {code: i for i, code in enumerate(self.currencies)}
+        if BASE_CURRENCY not in self.index:
+            raise APIDataError("USD rate missing from exchange_rates", "CoinGecko")
+        per_btc = np.array([float(rates[code.lower()]['value']) for code in self.currencies], dtype=np.float64)
+        self.per_usd = per_btc / per_btc[self.index[BASE_CURRENCY]]
+        self.kinds = {code.upper(): info.get('type', '') for code, info in rates.items()}
+        self._matrix: Optional[np.ndarray] = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = self.per_usd[np.newaxis, :] / self.per_usd[:, np.newaxis]
+        return self._matrix
+
+    def _position(self, currency: str) -> int:
+        try:
+            return self.index[currency.upper()]
+        except KeyError:
+            raise ValueError(f"Unsupported currency: {currency}") from None
+
+    def rate(self, from_currency: str, to_currency: str) -> float:
+        return float(self.matrix[self._position(from_currency), self._position(to_currency)])
+
+_fx_state: tuple = (None, None)  # (exchange_rates yanıt nesnesi, FxMatrix)
+_fx_lock = threading.Lock()
+
+def get_fx_matrix() -> FxMatrix:
+    """Güncel kur matrisi; cache'teki yanıt değişmedikçe yeniden kurulmaz."""
+    global _fx_state
+    data = safe_api_call(FX_RATES_URL, "CoinGecko")
+    with _fx_lock:
+        source, matrix = _fx_state
+        if source is data:
+            return matrix
+    rates = data.get('rates')
+    if not rates:
+        raise APIDataError("No exchange rates in response", "CoinGecko")
+    matrix = FxMatrix(rates)
+    with _fx_lock:
+        _fx_state = (data, matrix)
+    return matrix
+
+def normalize_currency(currency: Optional[str]) -> str:
+    return (currency or BASE_CURRENCY).strip().upper()
+
+def fx_rate(from_currency: str, to_currency: str) -> float:
+    """from_currency'nin 1 biriminin to_currency karşılığı. Aynı para biriminde istek atılmaz."""
+    from_currency, to_currency = normalize_currency(from_currency), normalize_currency(to_currency)
+    if from_currency == to_currency:
+        return 1.0
+    return get_fx_matrix().rate(from_currency, to_currency)
+
+def convert_from_usd(amounts: Any, currency: str) -> np.ndarray:
+    """USD tutarlarını (skaler ya da dizi) tek çarpımla currency'ye çevirir; NaN'lar korunur."""
+    return np.asarray(amounts, dtype=np.float64) * fx_rate(BASE_CURRENCY, currency)
+
+def format_money(amount: float, currency: str = BASE_CURRENCY, spec: Optional[str] = None) -> str:
+    """USD için '$1.5', diğerleri için '1.5 EUR'. spec verilirse sayı format(amount, spec) ile yazılır."""
+    currency = normalize_currency(currency)
+    number = format_price(amount) if spec is None else format(amount, spec)
+    if currency == BASE_CURRENCY:
+        return f"${number}"
+    return f"{number} {currency}"
+
+def _make_quote(coin_name: str, price: Any, source: str, cache_key: str) -> Optional[PriceQuote]:
+    """Parse edilmiş fiyatı, cache kaydının zamanı ve bayatlığı ile PriceQuote'a çevirir."""
+    if price is None:
+        return None
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring non-numeric price from {source}: {price!r}")
+        return None
+
+    entry = price_cache.peek(cache_key)
+    if entry is None:
+        return PriceQuote(coin_name, price, source)
+    return PriceQuote(coin_name, price, source, timestamp=entry.timestamp,
+                      stale=time.time() - entry.timestamp >= entry.ttl)
+
+def _query_price_provider(api: dict) -> Optional[PriceQuote]:
+    """Fetch and parse a quote from one fallback provider."""
+    data = safe_api_call(api["url"], api["name"])
+    return _make_quote(api["coin"], api["parser"](data), api["name"], api["url"])
+
+def _fallback_error_message(coin_name: str, last_error: Optional[Exception], circuits_open: bool = False) -> str:
     # Tüm API'ler başarısız olursa
     error_msg = f"Unable to fetch price for {coin_name}. All APIs failed."
+    if circuits_open:
+        error_msg += " All provider circuits are open."
     if last_error:
         error_msg += f" Last error: {last_error}"
     logger.error(error_msg)
     return error_msg
 
-@mcp.tool()
-def list_available_tools():
-    """Lists all available cryptocurrency tools and their descriptions."""
-    tools = {
-        "get_crypto_price": "Get price from CoinGecko API (default)",
-        "get_price_binance": "Get price from Binance exchange",
-        "get_price_kraken": "Get price from Kraken exchange",
-        "get_price_coinpaprika": "Get detailed price from CoinPaprika",
-        "get_price_coinstats": "Get price from CoinStats",
-        "get_crypto_news_cryptocompare": "Get latest crypto news",
-        "market_analysis": "Get top 10 cryptocurrencies overview",
-        "get_latest_news": "Get basic news placeholder",
-        "clear_cache": "Clear all cached API responses",
-        "get_cache_status": "Show current cache status and statistics",
-        "technical_analysis": "Comprehensive technical analysis (RSI, MACD, BB, trend)",
-        "rsi_indicator": "RSI analysis with buy/sell signals",
-        "macd_analysis": "MACD analysis with crossover signals",
-        "bollinger_bands_analysis": "Bollinger Bands analysis for volatility",
-        "trend_analysis": "Trend analysis with moving averages and S/R levels",
-        "portfolio_tracker": "Track portfolio performance and P&L",
-        "risk_analysis": "Analyze risk metrics (volatility, Sharpe ratio, drawdown)",
-        "correlation_analysis": "Analyze correlations between cryptocurrencies"
-    }
-    result = "Available Crypto_MCP Tools:\n"
-    for name, desc in tools.items():
-        result += f"- {name}: {desc}\n"
-    return result
+def _unknown_coin_message(coin_name: str) -> str:
+    error_msg = f"Unable to fetch price for {coin_name}. No provider lists this coin."
+    logger.warning(error_msg)
+    return error_msg
 
-@mcp.tool()
-def get_crypto_price(coin_name: str = "bitcoin"):
-    """Gets the current price of a specific cryptocurrency in USD from CoinGecko."""
-    try:
-        return get_crypto_price_with_fallback(coin_name)
-    except Exception as e:
-        logger.error(f"Unexpected error in get_crypto_price: {e}")
-        return f"Error fetching price for {coin_name}: {str(e)}"
+def _hedged_price_lookup(apis: list, hedge_delay: float):
+    """
+    Provider'ları kademeli olarak paralel başlatır ve ilk geçerli fiyatı döndürür.
 
-@mcp.tool()
-def get_price_binance(symbol: str = "BTCUSDT"):
-    """Gets real-time cryptocurrency price from Binance exchange. Use symbols like BTCUSDT, ETHUSDT."""
-    try:
-        url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}"
-        data = safe_api_call(url, "Binance")
-        price = data.get('price')
+    İlk provider hemen çağrılır; hedge_delay içinde cevap gelmezse ya da provider hata
+    verirse sıradaki başlatılır. Geçerli bir fiyat gelince bekleyen çağrılar iptal edilir.
 
-        if price is None:
-            raise APIDataError("Price not found in response", "Binance")
+    Returns:
+        (quote, last_error) - fiyat bulunamazsa quote None olur
+    """
+    remaining = list(apis)
+    in_flight = {}
+    last_error = None
 
-        return f"{symbol} price (Binance): ${price}"
+    def launch_next():
+        api = remaining.pop(0)
+        in_flight[_hedge_executor.submit(_query_price_provider, api)] = api
 
-    except CryptoAPIError as e:
-        logger.error(f"Binance API error: {e}")
-        return f"Error fetching {symbol} from Binance: {e}"
-    except Exception as e:
-        logger.error(f"Unexpected error in get_price_binance: {e}")
-        return f"Unexpected error fetching {symbol} from Binance: {str(e)}"
+    while in_flight or remaining:
+        if not in_flight:
+            launch_next()
 
-@mcp.tool()
-def get_price_kraken(pair: str = "XBTUSD"):
-    """Gets cryptocurrency price from Kraken exchange. Use pairs like XBTUSD (BTC), ETHUSD."""
-    try:
-        url = f"https://api.kraken.com/0/public/Ticker?pair={pair}"
-        data = safe_api_call(url, "Kraken")
+        done, _ = wait(list(in_flight), timeout=hedge_delay if remaining else None, return_when=FIRST_COMPLETED)
+        for future in done:
+            api = in_flight.pop(future)
+            try:
+                quote = future.result()
+            except CryptoAPIError as e:
+                logger.warning(f"Failed to get price from {api['name']}: {e}")
+                last_error = e
+                continue
 
-        result = data.get('result', {})
-        if pair not in result:
-            raise APIDataError(f"Pair {pair} not found in response", "Kraken")
+            if quote is not None:
+                for pending in in_flight:
+                    pending.cancel()
+                return quote, last_error
 
-        price_data = result[pair].get('c', [])
-        if not price_data:
-            raise APIDataError("Price data not available", "Kraken")
+        if remaining:
+            launch_next()
 
-        price = price_data[0]
-        return f"{pair} price (Kraken): ${price}"
+    return None, last_error
 
-    except CryptoAPIError as e:
-        logger.error(f"Kraken API error: {e}")
-        return f"Error fetching {pair} from Kraken: {e}"
-    except Exception as e:
-        logger.error(f"Unexpected error in get_price_kraken: {e}")
-        return f"Unexpected error fetching {pair} from Kraken: {str(e)}"
+def get_price_quote(coin_name: str, hedged: Optional[bool] = None,
+                    hedge_delay: Optional[float] = None) -> PriceQuote:
+    """
+    Birden fazla API'yi deneyerek kripto para fiyatını PriceQuote olarak alır.
+    İlk çalışan API'yi kullanır.
 
-@mcp.tool()
-def get_price_coinpaprika(coin_id: str = "btc-bitcoin"):
-    """Gets detailed cryptocurrency information from CoinPaprika. Use coin IDs like btc-bitcoin, eth-ethereum."""
-    try:
-        url = f"https://api.coinpaprika.com/v1/tickers/{coin_id}"
-        data = safe_api_call(url, "CoinPaprika")
+    Args:
+        coin_name: CoinGecko coin ID
+        hedged: True ise yavaş provider beklenmeden sıradaki paralel başlatılır (varsayılan FALLBACK_HEDGED)
+        hedge_delay: Provider başlatmaları arasındaki bekleme (varsayılan FALLBACK_HEDGE_DELAY_SECONDS)
 
-        quotes = data.get('quotes', {})
-        usd_data = quotes.get('USD', {})
-        price = usd_data.get('price')
+    Raises:
+        PriceUnavailableError: Hiçbir provider fiyat döndüremezse
+    """
+    providers = _price_providers(coin_name)
+    if not providers:
+        raise PriceUnavailableError(coin_name, _unknown_coin_message(coin_name))
+    apis = rank_providers(_available_providers(providers), key=lambda api: api["name"])
+    if not apis:
+        raise PriceUnavailableError(coin_name, _fallback_error_message(coin_name, None, circuits_open=True))
+    if hedged is None:
+        hedged = FALLBACK_HEDGED
+
+    if hedged:
+        delay = FALLBACK_HEDGE_DELAY_SECONDS if hedge_delay is None else hedge_delay
+        quote, last_error = _hedged_price_lookup(apis, delay)
+        if quote is not None:
+            logger.info(f"Successfully got price from {quote.source}: ${format_price(quote.price)}")
+            return quote
+        raise PriceUnavailableError(coin_name, _fallback_error_message(coin_name, last_error))
 
-        if price is None:
-            raise APIDataError("Price not found in USD quotes", "CoinPaprika")
+    last_error = None
 
-        return f"{coin_id} price (CoinPaprika): ${price}"
+    for api in apis:
+        try:
+            quote = _query_price_provider(api)
 
-    except CryptoAPIError as e:
-        logger.error(f"CoinPaprika API error: {e}")
+            if quote is not None:
+                logger.info(f"Successfully got price from {api['name']}: ${format_price(quote.price)}")
+                return quote
+
+        except CryptoAPIError as e:
+            logger.warning(f"Failed to get price from {api['name']}: {e}")
+            last_error = e
+            continue
+
+    raise PriceUnavailableError(coin_name, _fallback_error_message(coin_name, last_error))
+
+def get_crypto_price_with_fallback(coin_name: str, hedged: Optional[bool] = None,
+                                   hedge_delay: Optional[float] = None, vs_currency: str = BASE_CURRENCY) -> str:
+    """get_price_quote'un metin döndüren sürümü (MCP tool'ları için)."""
+    try:
+        return get_price_quote(coin_name, hedged=hedged, hedge_delay=hedge_delay).convert(vs_currency).format()
+    except PriceUnavailableError as e:
+        return e.message
+
+async def _async_query_price_provider(api: dict) -> Optional[PriceQuote]:
+    data = await async_safe_api_call(api["url"], api["name"])
+    return _make_quote(api["coin"], api["parser"](data), api["name"], api["url"])
+
+async def async_get_price_quote(coin_name: str, hedged: Optional[bool] = None,
+                                hedge_delay: Optional[float] = None) -> PriceQuote:
+    """get_price_quote'un async varyantı; hedged modda kaybeden task'lar iptal edilir."""
+    providers = _price_providers(coin_name)
+    if not providers:
+        raise PriceUnavailableError(coin_name, _unknown_coin_message(coin_name))
+    apis = rank_providers(_available_providers(providers), key=lambda api: api["name"])
+    if not apis:
+        raise PriceUnavailableError(coin_name, _fallback_error_message(coin_name, None, circuits_open=True))
+    if hedged is None:
+        hedged = FALLBACK_HEDGED
+    delay = FALLBACK_HEDGE_DELAY_SECONDS if hedge_delay is None else hedge_delay
+    if not hedged:
+        delay = None  # Sequential: wait for each provider before trying the next
+
+    remaining = list(apis)
+    in_flight = {}
+    last_error = None
+
+    def launch_next():
+        api = remaining.pop(0)
+        in_flight[asyncio.ensure_future(_async_query_price_provider(api))] = api
+
+    try:
+        while in_flight or remaining:
+            if not in_flight:
+                launch_next()
+
+            done, _ = await asyncio.wait(list(in_flight), timeout=delay if remaining else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                api = in_flight.pop(task)
+                try:
+                    quote = task.result()
+                except CryptoAPIError as e:
+                    logger.warning(f"Failed to get price from {api['name']}: {e}")
+                    last_error = e
+                    continue
+
+                if quote is not None:
+                    logger.info(f"Successfully got price from {api['name']}: ${format_price(quote.price)}")
+                    return quote
+
+            if remaining and (done or hedged):
+                launch_next()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+    raise PriceUnavailableError(coin_name, _fallback_error_message(coin_name, last_error))
+
+async def async_get_crypto_price_with_fallback(coin_name: str, hedged: Optional[bool] = None,
+                                               hedge_delay: Optional[float] = None,
+                                               vs_currency: str = BASE_CURRENCY) -> str:
+    """async_get_price_quote'un metin döndüren sürümü."""
+    try:
+        quote = await async_get_price_quote(coin_name, hedged=hedged, hedge_delay=hedge_delay)
+        if normalize_currency(vs_currency) != quote.currency:
+            # Kur matrisi cache'te değilse fetch event loop'u bloklamasın
+            quote = await asyncio.get_running_loop().run_in_executor(_async_http_executor, quote.convert, vs_currency)
+        return quote.format()
+    except PriceUnavailableError as e:
+        return e.message
+
+# Toplu fiyat sorgusu: CoinGecko simple/price tek istekte birden fazla id kabul eder
+BULK_PRICE_CHUNK_SIZE = 250  # ids per simple/price request
+
+def _simple_price_url(coin_ids: list) -> str:
+    return f"https://api.coingecko.com/api/v3/simple/price?ids={','.join(coin_ids)}&vs_currencies=usd"
+
+def get_price_quotes_bulk(coin_names: list) -> Dict[str, Optional[PriceQuote]]:
+    """
+    Birden fazla coin'in fiyatını CoinGecko'nun çoklu id endpoint'i ile tek seferde alır.
+
+    Liste BULK_PRICE_CHUNK_SIZE'lık parçalara bölünür; her parça tek upstream isteğidir.
+    Gelen fiyatlar tekil simple/price cache anahtarlarına da yazılır, böylece sonraki
+    get_price_quote çağrıları cache'ten döner. Toplu yanıtta bulunmayan coin'ler için
+    normal fallback zinciri kullanılır.
+
+    Returns:
+        {coin_name: PriceQuote, hiçbir provider fiyat veremezse None}
+    """
+    coin_ids = {}
+    for name in coin_names:
+        name = name.strip()
+        if name:
+            ids = resolve_coin_ids(name)
+            coin_ids[name] = ids[0] if ids is not None else None
+
+    results = {None: None}  # Coins no provider lists are answered without a request
+
+    to_fetch = []
+    for coin_id in dict.fromkeys(coin_ids.values()):
+        if coin_id is None:
+            continue
+        url = _simple_price_url([coin_id])
+        cached = get_cached_data(url)
+        quote = _make_quote(coin_id, cached.get(coin_id, {}).get('usd'), "CoinGecko", url) if cached else None
+        if quote is not None:
+            results[coin_id] = quote
+        else:
+            to_fetch.append(coin_id)
+
+    missing = []
+    for start in range(0, len(to_fetch), BULK_PRICE_CHUNK_SIZE):
+        chunk = to_fetch[start:start + BULK_PRICE_CHUNK_SIZE]
+        chunk_url = _simple_price_url(chunk)
+        try:
+            data = safe_api_call(chunk_url, "CoinGecko")
+        except CryptoAPIError as e:
+            logger.warning(f"Bulk price request failed for {len(chunk)} coins: {e}")
+            data = {}
+
+        for coin_id in chunk:
+            quote = _make_quote(coin_id, data.get(coin_id, {}).get('usd'), "CoinGecko", chunk_url)
+            if quote is None:
+                missing.append(coin_id)
+                continue
+            if len(chunk) > 1:
+                set_cached_data(_simple_price_url([coin_id]), {coin_id: data[coin_id]})
+            results[coin_id] = quote
+
+    for coin_id in missing:
+        try:
+            results[coin_id] = get_price_quote(coin_id)
+        except PriceUnavailableError:
+            results[coin_id] = None
+
+    return {name: results[coin_id] for name, coin_id in coin_ids.items()}
+
+def get_crypto_prices_bulk(coin_names: list, vs_currency: str = BASE_CURRENCY) -> Dict[str, str]:
+    """get_price_quotes_bulk'un metin döndüren sürümü (MCP tool'ları için)."""
+    return {
+        name: quote.convert(vs_currency).format() if quote is not None
+        else f"Unable to fetch price for {name}. All APIs failed."
+        for name, quote in get_price_quotes_bulk(coin_names).items()
+    }
+
+# WebSocket ticker akışı: borsaların public ticker stream'leri arka planda dinlenir,
+# son fiyatlar bellekte tutulur ve get_price_* tool'ları ağa çıkmadan buradan okur.
+TICK_MAX_AGE_SECONDS = 15  # Older ticks are ignored and the tools fall back to REST
+STREAM_RECONNECT_MIN_SECONDS = 1.0
+STREAM_RECONNECT_MAX_SECONDS = 60.0
+STREAM_HEARTBEAT_SECONDS = 18  # Application-level ping for venues that require one (Bybit, KuCoin)
+STREAM_OPEN_TIMEOUT_SECONDS = 10
+
+class Tick:
+    """Bir borsadan gelen son fiyat"""
+    __slots__ = ('exchange', 'symbol', 'price', 'timestamp')
+
+    def __init__(self, exchange: str, symbol: str, price: float, timestamp: float):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.price = price
+        self.timestamp = timestamp
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.timestamp)
+
+class TickStore:
+    """Thread-safe (exchange, symbol) -> son Tick deposu."""
+
+    def __init__(self):
+        self._ticks: Dict[tuple, Tick] = {}
+        self._lock = threading.Lock()
+        self.updates = 0
+
+    def update(self, exchange: str, symbol: str, price: float, timestamp: Optional[float] = None) -> None:
+        tick = Tick(exchange, symbol, float(price), time.time() if timestamp is None else timestamp)
+        with self._lock:
+            self._ticks[(exchange, symbol)] = tick
+            self.updates += 1
+
+    def get(self, exchange: str, symbol: str, max_age: Optional[float] = None) -> Optional[Tick]:
+        """Return the latest tick, or None if missing or older than max_age (default TICK_MAX_AGE_SECONDS)."""
+        with self._lock:
+            tick = self._ticks.get((exchange, symbol))
+        if tick is None:
+            return None
+        if tick.age > (TICK_MAX_AGE_SECONDS if max_age is None else max_age):
+            return None
+        return tick
+
+    def symbols(self, exchange: str) -> list:
+        with self._lock:
+            return sorted(symbol for venue, symbol in self._ticks if venue == exchange)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ticks.clear()
+
+    def __len__(self) -> int:
+        return len(self._ticks)
+
+_KRAKEN_QUOTES = ('USDT', 'USDC', 'USD', 'EUR', 'GBP', 'CAD', 'JPY', 'CHF', 'AUD', 'XBT', 'BTC', 'ETH')
+
+def _kraken_ws_pair(pair: str) -> str:
+    """XBTUSD / BTCUSD / XBT/USD -> Kraken WebSocket formatı XBT/USD."""
+    pair = pair.upper()
+    if '/' in pair:
+        base, quote = pair.split('/', 1)
+    else:
+        base, quote = pair, ''
+        for candidate in _KRAKEN_QUOTES:
+            if pair.endswith(candidate) and len(pair) > len(candidate):
+                base, quote = pair[:-len(candidate)], candidate
+                break
+    base = 'XBT' if base == 'BTC' else base
+    return f"{base}/{quote}" if quote else base
+
+class _StreamAdapter(ABC):
+    """Bir borsanın WebSocket ticker protokolü: URL, abonelik mesajları ve mesaj ayrıştırma."""
+    exchange = ""
+    url = ""
+    heartbeat: Optional[str] = None  # JSON ping message, if the venue needs one
+
+    def normalize(self, symbol: str) -> str:
+        """Tick deposunda kullanılan sembol anahtarı"""
+        return symbol.upper()
+
+    def resolve_url(self) -> str:
+        return self.url
+
+    @abstractmethod
+    def subscribe_messages(self, symbols: list) -> list:
+        """JSON subscribe messages to send after connecting."""
+
+    @abstractmethod
+    def parse(self, message: Any) -> list:
+        """Return [(symbol_key, price), ...] for ticker messages, [] for anything else."""
+
+class _BinanceStream(_StreamAdapter):
+    exchange = "Binance"
+    url = "wss://stream.binance.com:9443/ws"
+
+    def subscribe_messages(self, symbols):
+        return [json.dumps({"method": "SUBSCRIBE", "params": [f"{s.lower()}@ticker" for s in symbols], "id": 1})]
+
+    def parse(self, message):
+        if isinstance(message, dict) and message.get('e') in ('24hrTicker', '24hrMiniTicker'):
+            return [(message['s'].upper(), message['c'])]
+        return []
+
+class _KrakenStream(_StreamAdapter):
+    exchange = "Kraken"
+    url = "wss://ws.kraken.com"
+
+    def normalize(self, symbol):
+        return _kraken_ws_pair(symbol).replace('/', '')
+
+    def subscribe_messages(self, symbols):
+        pairs = [_kraken_ws_pair(s) for s in symbols]
+        return [json.dumps({"event": "subscribe", "pair": pairs, "subscription": {"name": "ticker"}})]
+
+    def parse(self, message):
+        # [channelID, {"c": [price, lot_volume], ...}, "ticker", "XBT/USD"]
+        if isinstance(message, list) and len(message) >= 4 and message[-2] == 'ticker':
+            close = message[1].get('c') if isinstance(message[1], dict) else None
+            if close:
+                return [(self.normalize(message[-1]), close[0])]
+        return []
+
+class _BybitStream(_StreamAdapter):
+    exchange = "Bybit"
+    url = "wss://stream.bybit.com/v5/public/spot"
+    heartbeat = json.dumps({"op": "ping"})
+
+    def subscribe_messages(self, symbols):
+        return [json.dumps({"op": "subscribe", "args": [f"tickers.{s.upper()}" for s in symbols]})]
+
+    def parse(self, message):
+        if isinstance(message, dict) and str(message.get('topic', '')).startswith('tickers.'):
+            data = message.get('data') or {}
+            if data.get('lastPrice') is not None:
+                return [(data.get('symbol', message['topic'][8:]).upper(), data['lastPrice'])]
+        return []
+
+class _KuCoinStream(_StreamAdapter):
+    exchange = "KuCoin"
+    token_url = "https://api.kucoin.com/api/v1/bullet-public"
+    heartbeat = json.dumps({"id": "ping", "type": "ping"})
+
+    def resolve_url(self):
+        # KuCoin WebSocket adresi ve token'ı REST üzerinden alınır
+        response = get_http_session("KuCoin").post(self.token_url, timeout=10)
+        response.raise_for_status()
+        data = response.json().get('data', {})
+        server = data['instanceServers'][0]
+        return f"{server['endpoint']}?token={data['token']}&connectId={int(time.time() * 1000)}"
+
+    def subscribe_messages(self, symbols):
+        topic = "/market/ticker:" + ",".join(s.upper() for s in symbols)
+        return [json.dumps({"id": str(int(time.time() * 1000)), "type": "subscribe", "topic": topic,
+                            "privateChannel": False, "response": True})]
+
+    def parse(self, message):
+        if isinstance(message, dict) and message.get('type') == 'message' \
+                and str(message.get('topic', '')).startswith('/market/ticker:'):
+            price = (message.get('data') or {}).get('price')
+            if price is not None:
+                return [(message['topic'].split(':', 1)[1].upper(), price)]
+        return []
+
+STREAM_ADAPTERS = {adapter.exchange: adapter for adapter in
+                   (_BinanceStream(), _KrakenStream(), _BybitStream(), _KuCoinStream())}
+
+class TickerStreamService:
+    """
+    Borsaların public WebSocket ticker stream'lerini arka plandaki bir asyncio
+    loop'unda dinler ve gelen fiyatları TickStore'a yazar.
+
+    Her borsa için tek bağlantı açılır; bağlantı koparsa üstel backoff ile yeniden
+    bağlanılır ve tüm semboller yeniden abone edilir. urls ile borsa adresleri
+    (ör. testlerde yerel bir sunucu) geçersiz kılınabilir.
+    """
+
+    def __init__(self, store: TickStore, urls: Optional[Dict[str, str]] = None):
+        self.store = store
+        self.urls = dict(urls or {})
+        self._symbols: Dict[str, set] = {}
+        self._connections: Dict[str, Any] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if websockets is None:
+            raise RuntimeError("websockets package is not installed")
+        with self._lock:
+            if self.is_running():
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='crypto-ticker-stream', daemon=True)
+            self._thread.start()
+
+    def subscribe(self, exchange: str, symbols: list) -> None:
+        """Sembolleri aboneliğe ekler; servis çalışmıyorsa başlatır."""
+        adapter = STREAM_ADAPTERS.get(exchange)
+        if adapter is None:
+            raise ValueError(f"No ticker stream for {exchange}")
+        self.start()
+        with self._lock:
+            known = self._symbols.setdefault(exchange, set())
+            new_symbols = [s.upper() for s in symbols if s.strip() and s.upper() not in known]
+            known.update(new_symbols)
+        if new_symbols:
+            asyncio.run_coroutine_threadsafe(self._add_symbols(exchange, new_symbols), self._loop)
+
+    def stop(self, timeout: float = 5) -> None:
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+
+        async def shutdown():
+            for task in list(self._tasks.values()):
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+            self._tasks.clear()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Ticker stream shutdown did not complete cleanly: {e!r}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            if thread.is_alive():
+                # Loop hâlâ çalışırken kapatmak RuntimeError verir; daemon thread süreçle birlikte biter
+                logger.warning(f"Ticker stream thread did not stop within {timeout}s; leaving its loop open")
+            else:
+                loop.close()
+            self._connections.clear()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:  # subscribe() aynı anda sözlüğü büyütebilir
+            subscriptions = {exchange: set(symbols) for exchange, symbols in self._symbols.items()}
+        result = {}
+        for exchange, symbols in subscriptions.items():
+            state = self._state.get(exchange, {})
+            result[exchange] = {
+                'connected': exchange in self._connections,
+                'symbols': sorted(symbols),
+                'messages': state.get('messages', 0),
+                'reconnects': state.get('reconnects', 0),
+                'last_error': state.get('last_error')
+            }
+        return result
+
+    async def _add_symbols(self, exchange: str, symbols: list) -> None:
+        connection = self._connections.get(exchange)
+        if connection is not None:
+            try:
+                for message in STREAM_ADAPTERS[exchange].subscribe_messages(symbols):
+                    await connection.send(message)
+            except Exception as e:
+                logger.warning(f"{exchange} stream subscribe failed, will resubscribe on reconnect: {e}")
+        if exchange not in self._tasks or self._tasks[exchange].done():
+            self._tasks[exchange] = asyncio.ensure_future(self._run(exchange))
+
+    async def _run(self, exchange: str) -> None:
+        adapter = STREAM_ADAPTERS[exchange]
+        state = self._state.setdefault(exchange, {'messages': 0, 'reconnects': 0, 'last_error': None})
+        backoff = STREAM_RECONNECT_MIN_SECONDS
+        loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                url = self.urls.get(exchange) or await loop.run_in_executor(None, adapter.resolve_url)
+                async with websockets.connect(url, open_timeout=STREAM_OPEN_TIMEOUT_SECONDS) as connection:
+                    self._connections[exchange] = connection
+                    with self._lock:
+                        symbols = sorted(self._symbols[exchange])
+                    for message in adapter.subscribe_messages(symbols):
+                        await connection.send(message)
+                    logger.info(f"{exchange} ticker stream connected ({len(symbols)} symbols)")
+
+                    while True:
+                        try:
+                            raw = await asyncio.wait_for(connection.recv(), timeout=STREAM_HEARTBEAT_SECONDS)
+                        except asyncio.TimeoutError:
+                            if adapter.heartbeat:
+                                await connection.send(adapter.heartbeat)
+                            continue
+                        try:
+                            message = json.loads(raw)
+                        except (TypeError, ValueError):
+                            continue
+                        for symbol, price in adapter.parse(message):
+                            self.store.update(exchange, symbol, price)
+                            state['messages'] += 1
+                            backoff = STREAM_RECONNECT_MIN_SECONDS
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                state['last_error'] = str(e)
+                state['reconnects'] += 1
+                logger.warning(f"{exchange} ticker stream disconnected: {e}; reconnecting in {backoff:.1f}s")
+            finally:
+                self._connections.pop(exchange, None)
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, STREAM_RECONNECT_MAX_SECONDS)
+
+tick_store = TickStore()
+ticker_stream = TickerStreamService(tick_store)
+atexit.register(ticker_stream.stop)
+
+def get_streamed_price(exchange: str, symbol: str) -> Optional[float]:
+    """
+    Stream'den gelen taze fiyatı döndürür (ağ çağrısı yok).
+
+    Servis çalışıyor ama sembol henüz abone değilse aboneliğe eklenir; bu çağrı None
+    döner ve çağıran REST'e düşer, sonraki çağrılar stream'den cevaplanır.
+    """
+    adapter = STREAM_ADAPTERS[exchange]
+    tick = tick_store.get(exchange, adapter.normalize(symbol))
+    if tick is not None:
+        return tick.price
+    if ticker_stream.is_running():
+        ticker_stream.subscribe(exchange, [symbol])
+    return None
+
+# Tam tablo ticker snapshot'ları: tek upstream isteği bir borsanın tüm sembollerini getirir,
+# sembol sorguları snapshot'tan kurulan bellek içi dict üzerinden O(1) cevaplanır.
+KRAKEN_ASSET_PAIRS_URL = "https://api.kraken.com/0/public/AssetPairs"
+
+def _binance_snapshot_index(data: Any) -> Dict[str, Any]:
+    return {item['symbol'].upper(): item['price'] for item in data if item.get('price') is not None}
+
+def _bybit_snapshot_index(data: Any) -> Dict[str, Any]:
+    tickers = (data.get('result') or {}).get('list') or []
+    return {item['symbol'].upper(): item['lastPrice'] for item in tickers if item.get('lastPrice')}
+
+def _kucoin_snapshot_index(data: Any) -> Dict[str, Any]:
+    tickers = (data.get('data') or {}).get('ticker') or []
+    return {item['symbol'].upper(): item['last'] for item in tickers if item.get('last')}
+
+def _kraken_snapshot_index(data: Any) -> Dict[str, Any]:
+    """
+    Kraken sonuç anahtarları XXBTZUSD gibi iç isimlerdir; AssetPairs ile altname (XBTUSD)
+    ve wsname (XBT/USD) da aynı fiyata eşlenir, böylece XBTUSD / BTCUSD sorguları da bulunur.
+    """
+    index = {}
+    for key, ticker in (data.get('result') or {}).items():
+        close = ticker.get('c') or []
+        if close:
+            index[key.upper()] = close[0]
+
+    try:
+        pairs = safe_api_call(KRAKEN_ASSET_PAIRS_URL, "Kraken").get('result') or {}
+    except CryptoAPIError as e:
+        logger.warning(f"Kraken AssetPairs unavailable, only internal pair names indexed: {e}")
+        pairs = {}
+    for key, info in pairs.items():
+        price = index.get(key.upper())
+        if price is None:
+            continue
+        for alias in (info.get('altname'), info.get('wsname')):
+            if alias:
+                index.setdefault(_kraken_ws_pair(alias).replace('/', ''), price)
+    return index
+
+EXCHANGE_SNAPSHOTS = {
+    "Binance": {"url": "https://api.binance.com/api/v3/ticker/price", "index": _binance_snapshot_index},
+    "Kraken": {"url": "https://api.kraken.com/0/public/Ticker", "index": _kraken_snapshot_index},
+    "Bybit": {"url": "https://api.bybit.com/v5/market/tickers?category=spot", "index": _bybit_snapshot_index},
+    "KuCoin": {"url": "https://api.kucoin.com/api/v1/market/allTickers", "index": _kucoin_snapshot_index},
+}
+
+# exchange -> (snapshot yanıt nesnesi, index); index sadece cache'teki yanıt değişince yeniden kurulur
+_snapshot_indexes: Dict[str, tuple] = {}
+_snapshot_lock = threading.Lock()
+snapshot_stats = {'rebuilds': 0, 'lookups': 0}
+
+def get_exchange_snapshot(exchange: str) -> Dict[str, Any]:
+    """Borsanın tüm ticker tablosunu {SEMBOL: fiyat} olarak döndürür (TTL boyunca tek upstream isteği)."""
+    config = EXCHANGE_SNAPSHOTS[exchange]
+    data = safe_api_call(config["url"], exchange)
+    with _snapshot_lock:
+        source, index = _snapshot_indexes.get(exchange, (None, None))
+        if source is data:
+            return index
+    index = config["index"](data)
+    with _snapshot_lock:
+        _snapshot_indexes[exchange] = (data, index)
+        snapshot_stats['rebuilds'] += 1
+    logger.info(f"Rebuilt {exchange} ticker index ({len(index)} symbols)")
+    return index
+
+def get_exchange_quote(exchange: str, symbol: str) -> Optional[PriceQuote]:
+    """
+    Bir borsadaki sembolün fiyatı: önce WebSocket tick'i, yoksa tam tablo snapshot'ı.
+
+    Returns:
+        PriceQuote, sembol borsada yoksa None
+    """
+    key = STREAM_ADAPTERS[exchange].normalize(symbol)
+    price = get_streamed_price(exchange, symbol)
+    if price is not None:
+        return PriceQuote(symbol, price, exchange)
+
+    snapshot_stats['lookups'] += 1
+    index = get_exchange_snapshot(exchange)
+    price = index.get(key)
+    if price is None:
+        price = index.get(symbol.upper())
+    return _make_quote(symbol, price, exchange, EXCHANGE_SNAPSHOTS[exchange]["url"])
+
+# Sağlayıcılar arası sembol/ID çözümleme indeksi.
+# CoinGecko coins/list, CoinPaprika coins ve borsa ticker tablolarından bir kez kurulur,
+# diske yazılır ve sonraki açılışlarda dosyadan yüklenir.
+SYMBOL_INDEX_PATH = 'symbol_index.json'
+SYMBOL_INDEX_MAX_AGE_SECONDS = 7 * 24 * 3600  # Rebuild from the providers after a week
+SYMBOL_INDEX_RETRY_SECONDS = 300  # After a failed build, wait this long before trying again
+SYMBOL_INDEX_AUTO_BUILD = True
+SYMBOL_INDEX_VERSION = 1
+
+COINGECKO_COINS_LIST_URL = "https://api.coingecko.com/api/v3/coins/list"
+COINPAPRIKA_COINS_URL = "https://api.coinpaprika.com/v1/coins"
+
+# Borsada sembol -> işlem çifti adı (hepsi USD/USDT bazlı)
+_EXCHANGE_PAIR_FORMATS = {
+    "Binance": "{}USDT",
+    "Kraken": "{}USD",
+    "Bybit": "{}USDT",
+    "KuCoin": "{}-USDT",
+}
+
+class SymbolIndex:
+    """
+    Kullanıcı girdisini (bitcoin, BTC, btc-bitcoin, Bitcoin) her sağlayıcının kimliğine O(1) eşler.
+
+    Aynı sembolü kullanan birden fazla coin varsa (ör. onlarca 'BTC' tokenı) CoinPaprika
+    sıralamasında en üstteki coin, o sembolün sahibi kabul edilir. İndeks hazır değilken
+    resolve() None döner ve çağıranlar eski davranışa düşer.
+
+    Eksik ya da eski indeks istek yolunda kurulmaz: tek bir arka plan thread'i (single-flight)
+    yeniden kurar, bu sırada aramalar diskteki indeks veya eski eşleme ile yanıtlanır.
+    """
+
+    def __init__(self, path: str = SYMBOL_INDEX_PATH, auto_build: Optional[bool] = None):
+        self.path = path
+        self.auto_build = SYMBOL_INDEX_AUTO_BUILD if auto_build is None else auto_build
+        self._records: Dict[str, tuple] = {}  # coingecko id -> (symbol, name, coinpaprika id)
+        self._aliases: Dict[str, str] = {}  # lowercase id / symbol / name -> coingecko id
+        self._listings: Dict[str, set] = {}  # exchange -> listed pair names
+        self._preferred: Dict[str, str] = {}  # symbol -> coingecko id of the coin that owns it
+        self.built_at: Optional[float] = None
+        self._loaded = False
+        self._failed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._build_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def is_ready(self) -> bool:
+        """True if resolve() answers are authoritative (a miss means no provider lists the coin)."""
+        self.ensure_loaded()
+        return bool(self._records)
+
+    def _is_fresh(self) -> bool:
+        return self.built_at is not None and time.time() - self.built_at <= SYMBOL_INDEX_MAX_AGE_SECONDS
+
+    def ensure_loaded(self) -> None:
+        if self._loaded and (self._is_fresh() or not self.auto_build):
+            return
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                self._load_file()
+            retry_ok = self._failed_at is None or time.time() - self._failed_at > SYMBOL_INDEX_RETRY_SECONDS
+        if not self._is_fresh() and self.auto_build and retry_ok:
+            self.start_rebuild()
+
+    @property
+    def last_build_ok(self) -> bool:
+        return self.built_at is not None and self._failed_at is None
+
+    def is_building(self) -> bool:
+        thread = self._build_thread
+        return thread is not None and thread.is_alive()
+
+    def start_rebuild(self) -> bool:
+        """Arka planda yeniden kurulumu başlatır; zaten bir kurulum sürüyorsa bir şey yapmaz."""
+        with self._lock:
+            if self.is_building():
+                return False
+            self._build_thread = threading.Thread(target=self.rebuild, name='crypto-symbol-index', daemon=True)
+            self._build_thread.start()
+            return True
+
+    def wait_for_build(self, timeout: Optional[float] = None) -> bool:
+        """Süren kurulumun bitmesini bekler; kurulum yoksa hemen True döner."""
+        thread = self._build_thread
+        if thread is not None:
+            thread.join(timeout)
+        return not self.is_building()
+
+    def _load_file(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable symbol index {self.path}: {e}")
+            return
+        if payload.get('version') != SYMBOL_INDEX_VERSION:
+            return
+        self._install(payload)
+        logger.info(f"Loaded symbol index with {len(self._records)} coins from {self.path}")
+
+    def _install(self, payload: Dict[str, Any]) -> None:
+        records = {coin_id: tuple(values) for coin_id, values in payload['records'].items()}
+        aliases = {}
+        # Lowest priority first so stronger identifiers overwrite weaker ones
+        for coin_id, (symbol, name, paprika_id) in records.items():
+            aliases.setdefault(name.lower(), coin_id)
+        aliases.update({symbol.lower(): coin_id for symbol, coin_id in payload['preferred'].items()})
+        for coin_id, (symbol, name, paprika_id) in records.items():
+            if paprika_id:
+                aliases[paprika_id] = coin_id
+            aliases[coin_id] = coin_id
+        self._records = records
+        self._aliases = aliases
+        self._preferred = payload['preferred']
+        self._listings = {exchange: set(pairs) for exchange, pairs in payload.get('listings', {}).items()}
+        self.built_at = payload.get('built_at')
+
+    def rebuild(self) -> bool:
+        """Sağlayıcı listelerinden indeksi yeniden kurar ve diske yazar (bloklar; istek yolunda start_rebuild kullanılır)."""
+        try:
+            coingecko = safe_api_call(COINGECKO_COINS_LIST_URL, "CoinGecko", timeout=30, use_cache=False)
+            paprika = safe_api_call(COINPAPRIKA_COINS_URL, "CoinPaprika", timeout=30, use_cache=False)
+        except CryptoAPIError as e:
+            self._failed_at = time.time()
+            logger.warning(f"Symbol index build failed: {e}")
+            return False
+
+        listings = {}
+        for exchange in _EXCHANGE_PAIR_FORMATS:
+            try:
+                listings[exchange] = sorted(get_exchange_snapshot(exchange))
+            except CryptoAPIError as e:
+                logger.warning(f"Symbol index: {exchange} listings unavailable: {e}")
+
+        payload = self.build_payload(coingecko, paprika, listings)
+        with self._lock:
+            self._install(payload)
+            self._failed_at = None
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist symbol index to {self.path}: {e}")
+        logger.info(f"Built symbol index: {len(self._records)} coins")
+        return True
+
+    @staticmethod
+    def build_payload(coingecko: list, paprika: list, listings: Dict[str, list]) -> Dict[str, Any]:
+        paprika_by_name = {}
+        paprika_rank = {}
+        for coin in paprika:
+            symbol = str(coin.get('symbol', '')).upper()
+            paprika_by_name[(symbol, str(coin.get('name', '')).lower())] = coin['id']
+            paprika_rank[coin['id']] = coin.get('rank') or float('inf')  # rank 0 = unranked
+
+        records = {}
+        preferred = {}
+        preferred_rank = {}
+        for coin in coingecko:
+            symbol = str(coin.get('symbol', '')).upper()
+            name = str(coin.get('name', ''))
+            paprika_id = paprika_by_name.get((symbol, name.lower()))
+            records[coin['id']] = (symbol, name, paprika_id)
+
+            rank = paprika_rank.get(paprika_id, float('inf'))
+            if symbol not in preferred or rank < preferred_rank[symbol]:
+                preferred[symbol] = coin['id']
+                preferred_rank[symbol] = rank
+
+        return {
+            'version': SYMBOL_INDEX_VERSION,
+            'built_at': time.time(),
+            'records': records,
+            'preferred': preferred,
+            'listings': listings,
+        }
+
+    def resolve(self, identifier: str) -> Optional[Dict[str, Optional[str]]]:
+        """
+        Returns {'symbol', 'name', 'coingecko', 'coinpaprika', 'Binance', 'Kraken', 'Bybit', 'KuCoin'}
+        with None for providers that do not list the coin, or None if the identifier is unknown.
+        """
+        self.ensure_loaded()
+        coin_id = self._aliases.get(identifier.strip().lower())
+        if coin_id is None:
+            return None
+        symbol, name, paprika_id = self._records[coin_id]
+        result = {'symbol': symbol, 'name': name, 'coingecko': coin_id, 'coinpaprika': paprika_id}
+        # Exchange pairs belong to the coin that owns the ticker symbol
+        owns_symbol = self._preferred.get(symbol) == coin_id
+        for exchange in _EXCHANGE_PAIR_FORMATS:
+            result[exchange] = self.listed_pair(exchange, symbol) if owns_symbol else None
+        return result
+
+    def listed_pair(self, exchange: str, symbol: str) -> Optional[str]:
+        """The exchange's USD/USDT pair name for a ticker symbol, or None if the exchange does not list it."""
+        pair = STREAM_ADAPTERS[exchange].normalize(_EXCHANGE_PAIR_FORMATS[exchange].format(symbol.upper()))
+        return pair if pair in self._listings.get(exchange, ()) else None
+
+symbol_index = SymbolIndex()
+
+# Çapraz borsa konsolide fiyat: tüm venue'lar paralel sorgulanır, deadline'a yetişenler birleştirilir
+CONSOLIDATED_QUOTE_DEADLINE_SECONDS = 3.0
+CONSOLIDATED_QUOTE_DEADLINE_RANGE = (0.1, 30.0)  # Accepted deadline bounds (seconds)
+CONSOLIDATED_QUOTE_VENUES = ("Binance", "Kraken", "Bybit", "KuCoin", "CoinPaprika", "CoinGecko")
+_consolidated_executor = ThreadPoolExecutor(max_workers=24, thread_name_prefix='crypto-quote')
+
+# Sembol -> (CoinGecko id, CoinPaprika id) başlangıç eşlemesi
+_COMMON_ASSETS = {
+    'BTC': ('bitcoin', 'btc-bitcoin'),
+    'ETH': ('ethereum', 'eth-ethereum'),
+    'SOL': ('solana', 'sol-solana'),
+    'XRP': ('ripple', 'xrp-xrp'),
+    'ADA': ('cardano', 'ada-cardano'),
+    'DOGE': ('dogecoin', 'doge-dogecoin'),
+    'DOT': ('polkadot', 'dot-polkadot'),
+    'LTC': ('litecoin', 'ltc-litecoin'),
+    'LINK': ('chainlink', 'link-chainlink'),
+    'AVAX': ('avalanche-2', 'avax-avalanche'),
+    'TRX': ('tron', 'trx-tron'),
+    'UNI': ('uniswap', 'uni-uniswap'),
+}
+
+def resolve_asset(asset: str) -> Dict[str, Optional[str]]:
+    """
+    'BTC' ya da 'bitcoin' -> her venue'nun kimliği (symbol_index.resolve formatında).
+
+    Sembol indeksi yoksa _COMMON_ASSETS ve borsa isimlendirme kalıpları kullanılır.
+    Çözülemeyen venue'ların değeri None olur ve bu venue'lara istek atılmaz.
+    """
+    ids = symbol_index.resolve(asset)
+    if ids is not None:
+        return ids
+
+    symbol = asset.strip().upper()
+    if symbol_index.is_ready():
+        # Not a known coin; it may still trade on an exchange under this ticker
+        ids = {'symbol': symbol, 'name': None, 'coingecko': None, 'coinpaprika': None}
+        ids.update({exchange: symbol_index.listed_pair(exchange, symbol) for exchange in _EXCHANGE_PAIR_FORMATS})
+        return ids
+
+    coingecko_id = paprika_id = None
+    if symbol in _COMMON_ASSETS:
+        coingecko_id, paprika_id = _COMMON_ASSETS[symbol]
+    else:
+        for known_symbol, (known_coingecko_id, known_paprika_id) in _COMMON_ASSETS.items():
+            if asset.strip().lower() == known_coingecko_id:
+                symbol, coingecko_id, paprika_id = known_symbol, known_coingecko_id, known_paprika_id
+                break
+    ids = {'symbol': symbol, 'name': None, 'coingecko': coingecko_id, 'coinpaprika': paprika_id}
+    ids.update({exchange: pair_format.format(symbol) for exchange, pair_format in _EXCHANGE_PAIR_FORMATS.items()})
+    return ids
+
+def _venue_fetchers(ids: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    fetchers = {}
+    for exchange in _EXCHANGE_PAIR_FORMATS:
+        if ids.get(exchange):
+            fetchers[exchange] = (lambda exchange=exchange: get_exchange_quote(exchange, ids[exchange]))
+    if ids.get('coinpaprika'):
+        fetchers["CoinPaprika"] = lambda: _query_price_provider({
+            "name": "CoinPaprika",
+            "coin": ids['symbol'],
+            "url": f"https://api.coinpaprika.com/v1/tickers/{ids['coinpaprika']}",
+            "parser": lambda data: data.get('quotes', {}).get('USD', {}).get('price')
+        })
+    if ids.get('coingecko'):
+        fetchers["CoinGecko"] = lambda: _query_price_provider(_price_providers(ids['coingecko'])[0])
+    return fetchers
+
+def _timed_venue_call(fetch) -> tuple:
+    started = time.perf_counter()
+    try:
+        return fetch(), None, time.perf_counter() - started
+    except CryptoAPIError as e:
+        return None, str(e), time.perf_counter() - started
+    except Exception as e:
+        # Beklenmeyen payload (hata dict'i, şema değişikliği) yalnızca bu venue'yu düşürür
+        logger.warning(f"Venue fetch failed unexpectedly: {e!r}")
+        return None, f"unexpected response: {type(e).__name__}: {e}", time.perf_counter() - started
+
+def clamp_quote_deadline(deadline: Optional[float]) -> float:
+    """Deadline'ı CONSOLIDATED_QUOTE_DEADLINE_RANGE içine sıkıştırır; geçersiz değerde varsayılanı kullanır."""
+    if deadline is None or not math.isfinite(deadline):
+        return CONSOLIDATED_QUOTE_DEADLINE_SECONDS
+    low, high = CONSOLIDATED_QUOTE_DEADLINE_RANGE
+    return min(max(deadline, low), high)
+
+def get_consolidated_quote(asset: str, deadline: Optional[float] = None,
+                           vs_currency: str = BASE_CURRENCY) -> Dict[str, Any]:
+    """
+    Bir varlığın fiyatını tüm venue'lardan aynı anda ister ve sonuçları birleştirir.
+
+    deadline (varsayılan CONSOLIDATED_QUOTE_DEADLINE_SECONDS) dolduğunda cevap vermeyen
+    venue'lar 'timeout' olarak işaretlenir; toplam süre en yavaş venue'ya değil deadline'a bağlıdır.
+    Venue fiyatları USD(T) cinsindendir; vs_currency verilirse kur venue'larla birlikte aynı deadline
+    içinde istenir ve hepsi tek kurla çevrilir. Kur zamanında alınamazsa fiyatlar USD kalır ve
+    'fx_error' doldurulur.
+
+    Returns:
+        {'asset', 'currency', 'median', 'spread', 'spread_pct', 'min', 'max', 'responded', 'fx_error',
+         'venues': {ad: {...}}}
+    """
+    deadline = clamp_quote_deadline(deadline)
+    currency = normalize_currency(vs_currency)
+    ids = resolve_asset(asset)
+    symbol = ids['symbol']
+    fetchers = _venue_fetchers(ids)
+
+    started = time.perf_counter()
+    fx_future = None
+    if currency != BASE_CURRENCY:
+        fx_future = _consolidated_executor.submit(fx_rate, BASE_CURRENCY, currency)
+    futures = {_consolidated_executor.submit(_timed_venue_call, fetch): venue for venue, fetch in fetchers.items()}
+    done, _ = wait(list(futures) + ([fx_future] if fx_future is not None else []), timeout=deadline)
+
+    rate, fx_error = 1.0, None
+    if fx_future is not None:
+        if fx_future not in done:
+            fx_future.cancel()
+            fx_error = f'exchange rate timeout after {deadline:.1f}s'
+        else:
+            try:
+                rate = fx_future.result()
+            except ValueError:
+                raise  # Unsupported currency: caller's input error, not a venue problem
+            except Exception as e:
+                fx_error = f'exchange rate unavailable: {e}'
+        if fx_error is not None:
+            logger.warning(f"Consolidated {symbol} quote left in {BASE_CURRENCY}: {fx_error}")
+            currency = BASE_CURRENCY
+
+    venues = {}
+    for venue in CONSOLIDATED_QUOTE_VENUES:
+        if venue not in fetchers:
+            venues[venue] = {'price': None, 'latency_ms': None, 'error': 'asset not listed on this venue'}
+    for future, venue in futures.items():
+        if future not in done:
+            future.cancel()
+            venues[venue] = {'price': None, 'latency_ms': None, 'error': f'timeout after {deadline:.1f}s'}
+            continue
+        quote, error, latency = future.result()
+        if quote is None and error is None:
+            error = 'symbol not listed'
+        venues[venue] = {
+            'price': quote.price * rate if quote is not None else None,
+            'latency_ms': round(latency * 1000, 1),
+            'error': error
+        }
+
+    prices = np.array([v['price'] for v in venues.values() if v['price'] is not None], dtype=float)
+    result = {
+        'asset': symbol,
+        'currency': currency,
+        'responded': int(prices.size),
+        'fx_error': fx_error,
+        'venues': {venue: venues[venue] for venue in CONSOLIDATED_QUOTE_VENUES if venue in venues},
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'median': None, 'min': None, 'max': None, 'spread': None, 'spread_pct': None
+    }
+    if prices.size:
+        median = float(np.median(prices))
+        result.update({
+            'median': median,
+            'min': float(prices.min()),
+            'max': float(prices.max()),
+            'spread': float(prices.max() - prices.min()),
+            'spread_pct': float((prices.max() - prices.min()) / median * 100) if median else None
+        })
+    return result
+
+def get_best_exchange_quote(asset: str) -> Optional[PriceQuote]:
+    """
+    Varlığı listeleyen borsaları beklenen cevap süresine göre sırayla dener ve ilk fiyatı döndürür.
+
+    Stream'de taze tick'i olan borsa ağ çağrısı gerektirmediği için önce kullanılır.
+    """
+    ids = resolve_asset(asset)
+    venues = [exchange for exchange in _EXCHANGE_PAIR_FORMATS if ids.get(exchange)]
+    for exchange in venues:
+        tick = tick_store.get(exchange, STREAM_ADAPTERS[exchange].normalize(ids[exchange]))
+        if tick is not None:
+            return PriceQuote(ids['symbol'], tick.price, exchange, timestamp=tick.timestamp)
+
+    for exchange in rank_providers(venues):
+        try:
+            quote = get_exchange_quote(exchange, ids[exchange])
+        except CryptoAPIError as e:
+            logger.warning(f"Failed to get {ids['symbol']} from {exchange}: {e}")
+            continue
+        if quote is not None:
+            return quote
+    return None
+
+@mcp.tool()
+def list_available_tools():
+    """Lists all available cryptocurrency tools and their descriptions."""
+    tools = {
+        "get_crypto_price": "Get price from CoinGecko API (default)",
+        "get_bulk_crypto_prices": "Get prices for many coins in one request",
+        "get_exchange_rate": "Convert between fiat/crypto quote currencies (cached FX matrix)",
+        "get_price_binance": "Get price from Binance exchange",
+        "get_price_kraken": "Get price from Kraken exchange",
+        "get_price_coinpaprika": "Get detailed price from CoinPaprika",
+        "get_price_coinstats": "Get price from CoinStats",
+        "get_crypto_news_cryptocompare": "Get latest crypto news",
+        "market_analysis": "Get top 10 cryptocurrencies overview",
+        "screen_market": "Sort/filter/paginate the top 1000 coins from memory",
+        "get_market_universe_status": "Show the in-memory market table state",
+        "get_top_gainers": "Top 24h gainers across the top 1000 coins",
+        "get_top_losers": "Top 24h losers across the top 1000 coins",
+        "get_volume_spikes": "Largest volume increases over about the last hour",
+        "get_rank_changes": "Largest market-cap rank moves over about the last hour",
+        "get_crypto_price_async": "Non-blocking price lookup with fallback",
+        "get_multiple_prices_async": "Fetch several coin prices concurrently",
+        "market_analysis_async": "Non-blocking top 10 market overview",
+        "get_price_history_async": "Non-blocking daily price history summary",
+        "get_latest_news": "Get basic news placeholder",
+        "clear_cache": "Clear all cached API responses",
+        "get_cache_status": "Show current cache status and statistics",
+        "get_price_writer_status": "Show write-behind price writer queue depth and flush latency",
+        "get_rate_limit_status": "Show per-provider client-side rate limiter state",
+        "get_provider_health": "Show per-provider circuit breaker state",
+        "start_ticker_stream": "Stream exchange tickers over WebSocket into memory",
+        "get_ticker_stream_status": "Show WebSocket ticker stream state and latest ticks",
+        "get_uniswap_token_prices_batch": "Price many Uniswap v3 tokens in one subgraph query",
+        "get_consolidated_price": "Concurrent cross-exchange quote with median, spread and latency",
+        "get_best_exchange_price": "Price from the exchange expected to answer fastest",
+        "get_provider_routing_stats": "Show provider latency/success stats used for routing",
+        "resolve_symbol": "Map a coin identifier to every provider's ID/pair",
+        "rebuild_symbol_index": "Rebuild the persisted cross-provider symbol index",
+        "technical_analysis": "Comprehensive technical analysis (RSI, MACD, BB, trend)",
+        "rsi_indicator": "RSI analysis with buy/sell signals",
+        "macd_analysis": "MACD analysis with crossover signals",
+        "bollinger_bands_analysis": "Bollinger Bands analysis for volatility",
+        "trend_analysis": "Trend analysis with moving averages and S/R levels",
+        "portfolio_tracker": "Track portfolio performance and P&L",
+        "risk_analysis": "Analyze risk metrics (volatility, Sharpe ratio, drawdown)",
+        "correlation_analysis": "Analyze correlations between cryptocurrencies"
+    }
+    result = "Available Crypto_MCP Tools:\n"
+    for name, desc in tools.items():
+        result += f"- {name}: {desc}\n"
+    return result
+
+@mcp.tool()
+def get_crypto_price(coin_name: str = "bitcoin", vs_currency: str = "usd"):
+    """Gets the current price of a specific cryptocurrency, in USD or another quote currency (eur, try, gbp, jpy, btc...)."""
+    try:
+        return get_crypto_price_with_fallback(coin_name, vs_currency=vs_currency)
+    except Exception as e:
+        logger.error(f"Unexpected error in get_crypto_price: {e}")
+        return f"Error fetching price for {coin_name}: {str(e)}"
+
+@mcp.tool()
+def get_bulk_crypto_prices(coin_names: str = "bitcoin,ethereum", vs_currency: str = "usd"):
+    """Gets prices for many cryptocurrencies in one CoinGecko request, in USD or vs_currency. Input format: 'bitcoin,ethereum,cardano'"""
+    try:
+        coin_list = [coin.strip() for coin in coin_names.split(',') if coin.strip()]
+        if not coin_list:
+            return "No valid coin names provided. Use format: 'bitcoin,ethereum,cardano'"
+
+        prices = get_crypto_prices_bulk(coin_list, vs_currency=vs_currency)
+        return "\n".join(prices[coin] for coin in coin_list)
+    except Exception as e:
+        logger.error(f"Unexpected error in get_bulk_crypto_prices: {e}")
+        return f"Error fetching prices: {str(e)}"
+
+@mcp.tool()
+def get_exchange_rate(from_currency: str = "usd", to_currency: str = "eur", amount: float = 1.0):
+    """Converts an amount between quote currencies (usd, eur, try, gbp, jpy, btc, eth...) using the cached CoinGecko FX matrix."""
+    matrix = None
+    try:
+        from_currency, to_currency = normalize_currency(from_currency), normalize_currency(to_currency)
+        if from_currency == to_currency:
+            rate = 1.0
+        else:
+            matrix = get_fx_matrix()
+            rate = matrix.rate(from_currency, to_currency)
+        return (f"{format_money(amount, from_currency)} = {format_money(amount * rate, to_currency)} "
+                f"(1 {from_currency} = {format_price(rate)} {to_currency})")
+    except ValueError as e:
+        if matrix is None:
+            return f"Invalid currency: {e}"
+        return f"{e}. Supported: {', '.join(matrix.currencies)}"
+    except CryptoAPIError as e:
+        logger.error(f"CoinGecko API error in get_exchange_rate: {e}")
+        return f"Error fetching exchange rates: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in get_exchange_rate: {e}")
+        return f"Error converting currency: {str(e)}"
+
+@mcp.tool()
+def get_price_binance(symbol: str = "BTCUSDT"):
+    """Gets real-time cryptocurrency price from Binance exchange. Use symbols like BTCUSDT, ETHUSDT."""
+    try:
+        quote = get_exchange_quote("Binance", symbol)
+        if quote is None:
+            raise APIDataError(f"{symbol} not found in ticker snapshot", "Binance")
+
+        return f"{symbol} price (Binance): ${format_price(quote.price)}"
+
+    except CryptoAPIError as e:
+        logger.error(f"Binance API error: {e}")
+        return f"Error fetching {symbol} from Binance: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in get_price_binance: {e}")
+        return f"Unexpected error fetching {symbol} from Binance: {str(e)}"
+
+@mcp.tool()
+def get_price_kraken(pair: str = "XBTUSD"):
+    """Gets cryptocurrency price from Kraken exchange. Use pairs like XBTUSD (BTC), ETHUSD."""
+    try:
+        quote = get_exchange_quote("Kraken", pair)
+        if quote is None:
+            raise APIDataError(f"{pair} not found in ticker snapshot", "Kraken")
+
+        return f"{pair} price (Kraken): ${format_price(quote.price)}"
+
+    except CryptoAPIError as e:
+        logger.error(f"Kraken API error: {e}")
+        return f"Error fetching {pair} from Kraken: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in get_price_kraken: {e}")
+        return f"Unexpected error fetching {pair} from Kraken: {str(e)}"
+
+@mcp.tool()
+def get_price_coinpaprika(coin_id: str = "btc-bitcoin"):
+    """Gets detailed cryptocurrency information from CoinPaprika. Use coin IDs like btc-bitcoin, eth-ethereum."""
+    try:
+        url = f"https://api.coinpaprika.com/v1/tickers/{coin_id}"
+        data = safe_api_call(url, "CoinPaprika")
+
+        quotes = data.get('quotes', {})
+        usd_data = quotes.get('USD', {})
+        price = usd_data.get('price')
+
+        if price is None:
+            raise APIDataError("Price not found in USD quotes", "CoinPaprika")
+
+        return f"{coin_id} price (CoinPaprika): ${price}"
+
+    except CryptoAPIError as e:
+        logger.error(f"CoinPaprika API error: {e}")
         return f"Error fetching {coin_id} from CoinPaprika: {e}"
     except Exception as e:
         logger.error(f"Unexpected error in get_price_coinpaprika: {e}")
@@ -346,9 +2580,9 @@ def get_price_coinstats(coin: str = "bitcoin"):
 def clear_cache():
     """Clears all cached API responses. Useful if you want fresh data."""
     try:
-        global price_cache
-        cache_size = len(price_cache)
-        price_cache.clear()
+        cache_size = price_cache.clear()
+        if DISK_CACHE_ENABLED:
+            disk_cache.clear()
         logger.info(f"Cache cleared. Removed {cache_size} entries.")
         return f"Cache cleared successfully. Removed {cache_size} cached entries."
     except Exception as e:
@@ -359,179 +2593,1120 @@ def clear_cache():
 def get_price_bybit(symbol: str = "BTCUSDT"):
     """Gets cryptocurrency price from Bybit exchange. Use symbols like BTCUSDT, ETHUSDT."""
     try:
-        url = f"https://api.bybit.com/v5/market/tickers?category=spot&symbol={symbol}"
-        data = safe_api_call(url, "Bybit")
+        quote = get_exchange_quote("Bybit", symbol)
+        if quote is None:
+            raise APIDataError(f"{symbol} not found in ticker snapshot", "Bybit")
 
-        if not data.get('result') or not data['result'].get('list'):
-            raise APIDataError("No ticker data found", "Bybit")
+        return f"{symbol} price (Bybit): ${format_price(quote.price)}"
 
-        ticker = data['result']['list'][0]
-        price = ticker.get('lastPrice')
+    except CryptoAPIError as e:
+        logger.error(f"Bybit API error: {e}")
+        return f"Error fetching {symbol} from Bybit: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in get_price_bybit: {e}")
+        return f"Unexpected error fetching {symbol} from Bybit: {str(e)}"
 
-        if price is None:
-            raise APIDataError("Price not found in ticker data", "Bybit")
+@mcp.tool()
+def get_price_kucoin(symbol: str = "BTC-USDT"):
+    """Gets cryptocurrency price from KuCoin exchange. Use symbols like BTC-USDT, ETH-USDT."""
+    try:
+        quote = get_exchange_quote("KuCoin", symbol)
+        if quote is None:
+            raise APIDataError(f"{symbol} not found in ticker snapshot", "KuCoin")
+
+        return f"{symbol} price (KuCoin): ${format_price(quote.price)}"
+
+    except CryptoAPIError as e:
+        logger.error(f"KuCoin API error: {e}")
+        return f"Error fetching {symbol} from KuCoin: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in get_price_kucoin: {e}")
+        return f"Unexpected error fetching {symbol} from KuCoin: {str(e)}"
+
+# Uniswap v3 subgraph: birden fazla token GraphQL alias'larıyla tek sorguda fiyatlanır
+UNISWAP_SUBGRAPH_URL = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3"
+UNISWAP_BATCH_SIZE = 100  # Token aliases per GraphQL query
+UNISWAP_ADDRESS_PATTERN = re.compile(r'0x[0-9a-f]{40}')  # Küçük harfe çevrilmiş kontrat adresi; sorguya yalnızca bu girer
+
+def _uniswap_token_cache_key(address: str) -> str:
+    return f"{UNISWAP_SUBGRAPH_URL}#token={address}"
+
+def _uniswap_batch_query(addresses: list) -> str:
+    fields = "\n".join(
+        f'  t{i}: token(id: "{address}") {{ id symbol name derivedETH }}' for i, address in enumerate(addresses)
+    )
+    return f'{{\n{fields}\n  bundle(id: "1") {{ ethPriceUSD }}\n}}'
+
+def get_uniswap_token_prices(token_addresses: list) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Uniswap v3 token fiyatlarını toplu alır.
+
+    Tokenlar UNISWAP_BATCH_SIZE'lık gruplar halinde tek GraphQL sorgusuyla istenir; bundle.ethPriceUSD
+    her sorguda bir kez gelir ve gruptaki tüm tokenlar için kullanılır. Sorgular safe_api_call
+    üzerinden gider (cache, rate limit, hata eşleme); her token ayrıca kendi cache anahtarına
+    yazılır, böylece farklı token kombinasyonları aynı veriyi tekrar istemez.
+
+    Adresler sorguya yazılmadan önce UNISWAP_ADDRESS_PATTERN ile doğrulanır. Bir grup hata verirse
+    (ağ, GraphQL hatası, eksik bundle) o gruptaki tokenlar {'error': ...} olarak işaretlenir;
+    diğer grupların sonuçları korunur.
+
+    Returns:
+        {adres: {'symbol', 'name', 'derived_eth', 'eth_price_usd', 'price_usd'}, subgraph'ta yoksa None,
+         grubu başarısız olduysa {'error': mesaj}}
+    """
+    addresses = {}
+    for address in token_addresses:
+        normalized = address.strip().lower()
+        if normalized:
+            addresses[address.strip()] = normalized
+
+    tokens = {}
+    to_fetch = []
+    for address in dict.fromkeys(addresses.values()):
+        if not UNISWAP_ADDRESS_PATTERN.fullmatch(address):
+            tokens[address] = None  # Not a contract address; nothing to ask the subgraph
+            continue
+        cached = get_cached_data(_uniswap_token_cache_key(address))
+        if cached is not None:
+            tokens[address] = cached
+        else:
+            to_fetch.append(address)
+
+    for start in range(0, len(to_fetch), UNISWAP_BATCH_SIZE):
+        chunk = sorted(to_fetch[start:start + UNISWAP_BATCH_SIZE])
+        try:
+            data = safe_api_call(UNISWAP_SUBGRAPH_URL, "Uniswap", json_body={'query': _uniswap_batch_query(chunk)})
+            if data.get('errors'):
+                raise APIDataError(f"GraphQL errors: {data['errors']}", "Uniswap")
+
+            result = data.get('data') or {}
+            bundle = result.get('bundle')
+            if not bundle:
+                raise APIDataError("Bundle data not found", "Uniswap")
+        except CryptoAPIError as e:
+            logger.warning(f"Uniswap batch of {len(chunk)} tokens failed: {e}")
+            for address in chunk:
+                tokens[address] = {'error': str(e)}
+            continue
+        for i, address in enumerate(chunk):
+            token = result.get(f"t{i}")
+            if not token:
+                tokens[address] = None
+                continue
+            entry = {'symbol': token['symbol'], 'name': token['name'],
+                     'derivedETH': token['derivedETH'], 'ethPriceUSD': bundle['ethPriceUSD']}
+            set_cached_data(_uniswap_token_cache_key(address), entry)
+            tokens[address] = entry
+
+    results = {}
+    for address, normalized in addresses.items():
+        entry = tokens[normalized]
+        if entry is None or 'error' in entry:
+            results[address] = entry
+            continue
+        eth_price = float(entry['ethPriceUSD'])
+        derived_eth = float(entry['derivedETH'])
+        results[address] = {
+            'symbol': entry['symbol'],
+            'name': entry['name'],
+            'derived_eth': derived_eth,
+            'eth_price_usd': eth_price,
+            'price_usd': eth_price * derived_eth
+        }
+    return results
+
+@mcp.tool()
+def get_uniswap_token_price(token_address: str = "0x1f9840a85d5af5bf1d1762f925bdaddc4201f984"):  # UNI token
+    """Gets token price from Uniswap v3. Use token contract addresses."""
+    try:
+        token_data = get_uniswap_token_prices([token_address])[token_address.strip()]
+
+        if token_data and 'error' in token_data:
+            logger.error(f"Uniswap API error: {token_data['error']}")
+            return f"Error fetching token {token_address} from Uniswap: {token_data['error']}"
+        if not token_data:
+            raise APIDataError("Token or bundle data not found", "Uniswap")
+
+        return f"{token_data['symbol']} ({token_data['name']}) price (Uniswap): ${token_data['price_usd']:.4f}"
+
+    except CryptoAPIError as e:
+        logger.error(f"Uniswap API error: {e}")
+        return f"Error fetching token {token_address} from Uniswap: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in get_uniswap_token_price: {e}")
+        return f"Unexpected error fetching token {token_address} from Uniswap: {str(e)}"
+
+@mcp.tool()
+def get_uniswap_token_prices_batch(token_addresses: str = "0x1f9840a85d5af5bf1d1762f925bdaddc4201f984,0x6b175474e89094c44da98b954eedeac495271d0f"):
+    """Gets Uniswap v3 prices for many comma-separated token contract addresses in a single subgraph query."""
+    try:
+        addresses = [address.strip() for address in token_addresses.split(',') if address.strip()]
+        if not addresses:
+            return "No token addresses given"
+
+        prices = get_uniswap_token_prices(addresses)
+        result = f"Uniswap v3 prices ({len(addresses)} tokens):\n"
+        for address in addresses:
+            token_data = prices.get(address)
+            if token_data and 'error' in token_data:
+                result += f"- {address}: error ({token_data['error']})\n"
+            elif token_data:
+                result += f"- {token_data['symbol']} ({token_data['name']}): ${token_data['price_usd']:.4f}\n"
+            else:
+                result += f"- {address}: not found on Uniswap v3\n"
+        return result
 
-        return f"{symbol} price (Bybit): ${price}"
+    except CryptoAPIError as e:
+        logger.error(f"Uniswap API error: {e}")
+        return f"Error fetching tokens from Uniswap: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in get_uniswap_token_prices_batch: {e}")
+        return f"Unexpected error fetching tokens from Uniswap: {str(e)}"
+
+@mcp.tool()
+def get_cache_status():
+    """Shows current cache status including number of entries and memory usage."""
+    try:
+        # Clear expired entries
+        expired_count = clear_expired_cache()
+        stats = price_cache.stats()
+        disk_status = "disabled"
+        if DISK_CACHE_ENABLED:
+            disk_stats = disk_cache.stats()
+            disk_status = f"{disk_stats['entries']} entries, {disk_stats['bytes']} bytes ({disk_stats['path']})"
+        history_status = "disabled"
+        if HISTORY_STORE_ENABLED:
+            history_stats = history_store.stats()
+            history_status = f"{history_stats['coins']} coins, {history_stats['points']} daily points ({history_stats['path']})"
+        policies = ", ".join(f"{name} {int(p['ttl'])}s(+{int(p['stale'])}s stale)"
+                             for name, p in CACHE_TTL_POLICIES.items())
+
+        return (f"Cache Status:\n- Active entries: {stats['entries']} / {stats['max_entries']}\n"
+                f"- Expired entries cleared: {expired_count}\n"
+                f"- Memory usage: {stats['bytes']} / {stats['max_bytes']} bytes\n"
+                f"- Disk tier: {disk_status}\n"
+                f"- History store: {history_status}\n"
+                f"- Hits: {stats['hits']} | Misses: {stats['misses']} | Hit rate: {stats['hit_rate']:.1%}\n"
+                f"- Stale hits (served while refreshing): {stats['stale_hits']} | "
+                f"Background refreshes: {refresh_stats['scheduled']} ({refresh_stats['failed']} failed)\n"
+                f"- Evictions: {stats['evictions']} | Expirations: {stats['expirations']}\n"
+                f"- TTL policies: {policies}\n"
+                f"- Upstream calls: {single_flight_stats['upstream_calls']}\n"
+                f"- Coalesced duplicate calls: {single_flight_stats['coalesced_calls']}")
+
+    except Exception as e:
+        logger.error(f"Error getting cache status: {e}")
+        return f"Error getting cache status: {str(e)}"
+
+def get_provider_health_data() -> Dict[str, Dict[str, Any]]:
+    """Circuit breaker and rate limiter state for every known provider."""
+    names = list(PROVIDER_RATE_LIMITS.keys()) + [name for name in circuit_breakers if name not in PROVIDER_RATE_LIMITS]
+    health = {}
+    for name in names:
+        breaker = circuit_breakers.get(name)
+        limiter = rate_limiters.get(name)
+        health[name] = {
+            'circuit': breaker.status() if breaker else {'state': CircuitBreaker.CLOSED},
+            'rate_limit_headroom': limiter.headroom() if limiter else 1.0
+        }
+    return health
+
+@mcp.tool()
+def get_provider_health():
+    """Shows per-provider health: circuit breaker state (closed/open/half_open), failures and rate limit headroom."""
+    try:
+        result = "Provider Health:\n"
+        for name, info in get_provider_health_data().items():
+            circuit = info['circuit']
+            line = f"- {name}: circuit {circuit['state']}"
+            if 'failures' in circuit:
+                line += f" | ok {circuit['successes']} | failed {circuit['failures']} | skipped {circuit['rejected']}"
+            if circuit.get('retry_in'):
+                line += f" | probe in {circuit['retry_in']:.0f}s"
+            line += f" | rate headroom {info['rate_limit_headroom']:.0%}"
+            result += line + "\n"
+        return result
+    except Exception as e:
+        logger.error(f"Error getting provider health: {e}")
+        return f"Error getting provider health: {str(e)}"
+
+@mcp.tool()
+def get_rate_limit_status():
+    """Shows client-side rate limiter state per provider (budget, headroom, delayed/shed requests, backoffs)."""
+    try:
+        result = "Rate Limit Status:\n"
+        for api_name, budget in PROVIDER_RATE_LIMITS.items():
+            limiter = rate_limiters.get(api_name)
+            if limiter is None:
+                result += f"- {api_name}: {budget['rate'] * 60:.0f} req/min, burst {budget['burst']:.0f} (unused)\n"
+                continue
+            status = limiter.status()
+            result += (f"- {api_name}: {status['rate'] * 60:.0f}/{status['base_rate'] * 60:.0f} req/min | "
+                       f"headroom {status['headroom']:.0%} | sent {status['acquired']} | delayed {status['delayed']} | "
+                       f"shed {status['shed']} | 429s {status['throttled']}")
+            if status['blocked_for'] > 0:
+                result += f" | backing off {status['blocked_for']:.1f}s"
+            result += "\n"
+        return result
+    except Exception as e:
+        logger.error(f"Error getting rate limit status: {e}")
+        return f"Error getting rate limit status: {str(e)}"
+
+@mcp.tool()
+def start_ticker_stream(exchange: str = "Binance", symbols: str = "BTCUSDT,ETHUSDT"):
+    """Starts background WebSocket ticker streaming for an exchange (Binance, Kraken, Bybit, KuCoin). The get_price_* tools then answer from memory."""
+    try:
+        if exchange not in STREAM_ADAPTERS:
+            return f"Unsupported exchange {exchange}. Choose one of: {', '.join(STREAM_ADAPTERS)}"
+        symbol_list = [s.strip() for s in symbols.split(',') if s.strip()]
+        if not symbol_list:
+            return "No symbols given"
+        ticker_stream.subscribe(exchange, symbol_list)
+        return f"Streaming {exchange} tickers for {', '.join(symbol_list)}"
+    except Exception as e:
+        logger.error(f"Error starting ticker stream: {e}")
+        return f"Error starting ticker stream: {str(e)}"
+
+@mcp.tool()
+def get_ticker_stream_status():
+    """Shows WebSocket ticker stream connections, subscribed symbols and latest streamed prices."""
+    try:
+        status = ticker_stream.status()
+        if not status:
+            return "Ticker stream is not running. Use start_ticker_stream to begin."
+        result = "Ticker Stream Status:\n"
+        for exchange, state in status.items():
+            result += (f"- {exchange}: {'connected' if state['connected'] else 'disconnected'} | "
+                       f"{len(state['symbols'])} symbols | {state['messages']} ticks | "
+                       f"{state['reconnects']} reconnects")
+            if state['last_error'] and not state['connected']:
+                result += f" | last error: {state['last_error']}"
+            result += "\n"
+            for symbol in tick_store.symbols(exchange):
+                tick = tick_store.get(exchange, symbol, max_age=float('inf'))
+                result += f"    {symbol}: ${format_price(tick.price)} ({tick.age:.1f}s ago)\n"
+        return result
+    except Exception as e:
+        logger.error(f"Error getting ticker stream status: {e}")
+        return f"Error getting ticker stream status: {str(e)}"
+
+@mcp.tool()
+def get_consolidated_price(asset: str = "BTC", deadline_seconds: float = CONSOLIDATED_QUOTE_DEADLINE_SECONDS,
+                           vs_currency: str = "usd"):
+    """Queries Binance, Kraken, Bybit, KuCoin, CoinPaprika and CoinGecko concurrently for one asset (BTC, ETH, bitcoin...) and reports median, spread, per-venue prices and latency, in USD or vs_currency."""
+    try:
+        quote = get_consolidated_quote(asset, deadline=deadline_seconds, vs_currency=vs_currency)
+        currency = quote['currency']
+        result = f"Consolidated {quote['asset']} price ({quote['responded']}/{len(quote['venues'])} venues, {quote['elapsed_ms']:.0f} ms):\n"
+        if quote['fx_error']:
+            result += f"Prices shown in {currency} ({quote['fx_error']})\n"
+        if quote['median'] is None:
+            result += "No venue returned a price.\n"
+        else:
+            result += f"Median: {format_money(quote['median'], currency)}\n"
+            result += (f"Spread: {format_money(round(quote['spread'], 8), currency)} ({quote['spread_pct']:.3f}%) | "
+                       f"Low {format_money(quote['min'], currency)} | High {format_money(quote['max'], currency)}\n")
+        result += "\nVenues:\n"
+        for venue, info in quote['venues'].items():
+            if info['price'] is not None:
+                result += f"- {venue}: {format_money(info['price'], currency)} ({info['latency_ms']:.0f} ms)\n"
+            else:
+                latency = f" after {info['latency_ms']:.0f} ms" if info['latency_ms'] is not None else ""
+                result += f"- {venue}: unavailable{latency} ({info['error']})\n"
+        return result
+    except Exception as e:
+        logger.error(f"Error in get_consolidated_price: {e}")
+        return f"Error getting consolidated price for {asset}: {str(e)}"
+
+@mcp.tool()
+def get_best_exchange_price(asset: str = "BTC", vs_currency: str = "usd"):
+    """Gets an asset's price from whichever exchange (Binance, Kraken, Bybit, KuCoin) is currently answering fastest, in USD or vs_currency."""
+    try:
+        quote = get_best_exchange_quote(asset)
+        if quote is None:
+            return f"No exchange returned a price for {asset}"
+        quote = quote.convert(vs_currency)
+        return f"{asset.upper()} price ({quote.source}): {format_money(quote.price, quote.currency)}"
+    except Exception as e:
+        logger.error(f"Error in get_best_exchange_price: {e}")
+        return f"Error getting best exchange price for {asset}: {str(e)}"
+
+@mcp.tool()
+def get_provider_routing_stats():
+    """Shows per-provider latency EWMA, success rate, rate-limit headroom and the resulting routing order."""
+    try:
+        if not provider_stats:
+            return "No provider requests recorded yet."
+        result = "Provider Routing Stats (fastest expected first):\n"
+        for name in rank_providers(list(provider_stats)):
+            status = provider_stats[name].status()
+            headroom = "n/a" if status['headroom'] is None else f"{status['headroom']:.0%}"
+            result += (f"- {name}: score {status['score_ms']:.0f} ms | latency {status['latency_ewma_ms']} ms | "
+                       f"success {status['success_rate']:.0%} | headroom {headroom} | "
+                       f"{status['requests']} requests, {status['failures']} failed\n")
+        return result
+    except Exception as e:
+        logger.error(f"Error getting provider routing stats: {e}")
+        return f"Error getting provider routing stats: {str(e)}"
+
+@mcp.tool()
+def resolve_symbol(identifier: str = "BTC"):
+    """Shows how a coin identifier (bitcoin, BTC, btc-bitcoin, Bitcoin) maps to each provider's ID or trading pair."""
+    try:
+        ids = resolve_asset(identifier)
+        result = f"Symbol resolution for '{identifier}':\n"
+        if ids.get('name'):
+            result += f"Name: {ids['name']} ({ids['symbol']})\n"
+        for provider in ('coingecko', 'coinpaprika') + tuple(_EXCHANGE_PAIR_FORMATS):
+            result += f"- {provider}: {ids.get(provider) or 'not listed'}\n"
+        if not symbol_index.is_ready():
+            result += "(symbol index not built yet; showing naming-convention guesses)\n"
+        return result
+    except Exception as e:
+        logger.error(f"Error resolving symbol: {e}")
+        return f"Error resolving {identifier}: {str(e)}"
+
+@mcp.tool()
+def rebuild_symbol_index():
+    """Rebuilds the cross-provider symbol index from CoinGecko, CoinPaprika and exchange listings."""
+    try:
+        symbol_index.start_rebuild()  # Zaten süren bir kurulum varsa ikincisi başlatılmaz, onu bekleriz
+        symbol_index.wait_for_build()
+        if symbol_index.last_build_ok:
+            return f"Symbol index rebuilt: {len(symbol_index)} coins."
+        return "Symbol index rebuild failed; see logs. The previous index (if any) is still in use."
+    except Exception as e:
+        logger.error(f"Error rebuilding symbol index: {e}")
+        return f"Error rebuilding symbol index: {str(e)}"
+
+@mcp.tool()
+def get_crypto_news_cryptocompare(coin: str = "BTC"):
+    """Gets latest crypto news from CryptoCompare. Use coin symbols like BTC, ETH."""
+    try:
+        url = f"https://min-api.cryptocompare.com/data/v2/news/?categories={coin}"
+        data = safe_api_call(url, "CryptoCompare")
+
+        news_list = data.get('Data', [])
+        if not news_list:
+            return f"No news found for {coin}"
+
+        # Get first 3 news items
+        news_items = []
+        for item in news_list[:3]:
+            title = item.get('title', 'No title')
+            url = item.get('url', 'No URL')
+            source = item.get('source', 'Unknown source')
+            news_items.append(f"- {title} ({source}): {url}")
+
+        return f"Latest {coin} news from CryptoCompare:\n" + "\n".join(news_items)
+
+    except CryptoAPIError as e:
+        logger.error(f"CryptoCompare API error: {e}")
+        return f"Error fetching news for {coin} from CryptoCompare: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in get_crypto_news_cryptocompare: {e}")
+        return f"Unexpected error fetching news for {coin} from CryptoCompare: {str(e)}"
+
+# Piyasa evreni: CoinGecko coins/markets sayfaları arka planda paralel çekilip
+# sütun bazlı numpy tablosunda tutulur; istek yolunda upstream'e gidilmez.
+MARKET_UNIVERSE_SIZE = 1000  # Top-N coins by market cap
+MARKET_UNIVERSE_PAGE_SIZE = 250  # CoinGecko's per_page maximum
+MARKET_UNIVERSE_REFRESH_SECONDS = 120
+MARKET_UNIVERSE_FETCH_WORKERS = 4  # Pages in flight at once; the CoinGecko token bucket still paces them
+MARKET_UNIVERSE_COLD_START_WAIT = 15  # Seconds a request may wait for the very first load
+# Hacim/sıra değişimi, yaşı bu hedefe en yakın eski snapshot'a göre hesaplanır
+MOVER_BASELINE_SECONDS = 3600
+MOVER_BASELINE_MIN_SECONDS = 900  # Daha genç bir baseline yalnızca gürültü ölçer; kullanılmaz
+
+_MARKET_TEXT_COLUMNS = ('id', 'symbol', 'name')
+_MARKET_NUMERIC_COLUMNS = ('current_price', 'market_cap', 'total_volume', 'price_change_percentage_24h',
+                           'market_cap_rank', 'high_24h', 'low_24h')
+# Baseline snapshot ile karşılaştırılarak hesaplanan sütunlar (uygun baseline yoksa NaN)
+_MARKET_DERIVED_COLUMNS = ('volume_change_ratio', 'rank_change')
+# kind -> (sütun, en büyükler mi, hareket sayılma koşulu)
+MOVER_KINDS = {
+    'gainers': ('price_change_percentage_24h', True, lambda values: values > 0),
+    'losers': ('price_change_percentage_24h', False, lambda values: values < 0),
+    'volume_spikes': ('volume_change_ratio', True, lambda values: values > 1),
+    'rank_gainers': ('rank_change', True, lambda values: values > 0),
+    'rank_losers': ('rank_change', False, lambda values: values < 0),
+}
+_MARKET_MONEY_COLUMNS = ('current_price', 'market_cap', 'total_volume')  # USD; converted on read
+MARKET_SORT_COLUMNS = {
+    'market_cap': 'market_cap',
+    'price': 'current_price',
+    'volume': 'total_volume',
+    'change_24h': 'price_change_percentage_24h',
+    'rank': 'market_cap_rank',
+}
+
+def _markets_page_url(page: int, per_page: int) -> str:
+    return (f"https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd&order=market_cap_desc"
+            f"&per_page={per_page}&page={page}")
+
+class MarketUniverse:
+    """
+    Top-N coin'in sütun bazlı (her alan ayrı numpy dizisi) bellek içi tablosu.
+
+    Tablo refresh() ile bütün olarak yeniden kurulur ve tek referans ataması ile değiştirilir;
+    okuyucular kilit tutmadan tutarlı bir anlık görüntü görür. Eksik değerler NaN'dır.
+    """
+
+    def __init__(self, size: Optional[int] = None, page_size: Optional[int] = None):
+        self.size = MARKET_UNIVERSE_SIZE if size is None else size
+        self.page_size = MARKET_UNIVERSE_PAGE_SIZE if page_size is None else page_size
+        self._columns: Optional[Dict[str, np.ndarray]] = None
+        self._row_by_id: Dict[str, int] = {}
+        self.updated_at: Optional[float] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.baseline_at: Optional[float] = None  # Timestamp of the snapshot the derived columns compare to
+        self._snapshots: deque = deque()  # (zaman, row_by_id, total_volume, market_cap_rank), eskiden yeniye
+        self._loaded = threading.Event()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        columns = self._columns
+        return 0 if columns is None else len(columns['id'])
+
+    def is_loaded(self) -> bool:
+        return self._columns is not None
+
+    def refresh(self) -> bool:
+        """Tüm sayfaları paralel çeker ve tabloyu değiştirir. İlk sayfa alınamazsa eski tablo korunur."""
+        with self._refresh_lock:
+            pages = max(1, -(-self.size // self.page_size))
+            with ThreadPoolExecutor(max_workers=MARKET_UNIVERSE_FETCH_WORKERS,
+                                    thread_name_prefix='crypto-market') as executor:
+                futures = [executor.submit(safe_api_call, _markets_page_url(page, self.page_size), "CoinGecko",
+                                           timeout=15, use_cache=False)
+                           for page in range(1, pages + 1)]
+
+            rows = []
+            for page, future in enumerate(futures, start=1):
+                try:
+                    rows.extend(future.result() or [])
+                except CryptoAPIError as e:
+                    self.last_error = str(e)
+                    logger.warning(f"Market universe page {page} failed: {e}")
+                    if page == 1:
+                        self.failures += 1
+                        return False
+                    break  # Keep the contiguous top of the ranking only
+
+            self._install(rows[:self.size])
+            self.refreshes += 1
+            logger.info(f"Market universe refreshed: {len(self)} coins")
+            return True
+
+    def _install(self, rows: list, now: Optional[float] = None) -> None:
+        seen = set()
+        unique = []
+        for row in rows:
+            if row.get('id') and row['id'] not in seen:
+                seen.add(row['id'])
+                unique.append(row)
+
+        columns = {name: np.array([str(row.get(name) or '') for row in unique], dtype=object)
+                   for name in _MARKET_TEXT_COLUMNS}
+        columns['symbol'] = np.array([symbol.upper() for symbol in columns['symbol']], dtype=object)
+        for name in _MARKET_NUMERIC_COLUMNS:
+            columns[name] = np.array([np.nan if row.get(name) is None else row[name] for row in unique],
+                                     dtype=np.float64)
+
+        now = time.time() if now is None else now
+        row_by_id = {coin_id: i for i, coin_id in enumerate(columns['id'])}
+        baseline_at = self._add_snapshot_deltas(columns, now)
+        self._snapshots.append((now, row_by_id, columns['total_volume'], columns['market_cap_rank']))
+        while len(self._snapshots) > 1 and now - self._snapshots[1][0] >= MOVER_BASELINE_SECONDS:
+            self._snapshots.popleft()  # The next one is old enough to serve as the baseline
+
+        self._columns, self._row_by_id, self.baseline_at = columns, row_by_id, baseline_at
+        self.updated_at = now
+        self._loaded.set()
+
+    def _baseline(self, now: float) -> Optional[tuple]:
+        """Yaşı MOVER_BASELINE_SECONDS'a en yakın (ve en az MOVER_BASELINE_MIN_SECONDS olan) snapshot."""
+        candidates = [snapshot for snapshot in self._snapshots if now - snapshot[0] >= MOVER_BASELINE_MIN_SECONDS]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda snapshot: abs(now - snapshot[0] - MOVER_BASELINE_SECONDS))
+
+    def _add_snapshot_deltas(self, columns: Dict[str, np.ndarray], now: float) -> Optional[float]:
+        """Hacim oranı ve sıra değişimi sütunlarını baseline snapshot'a göre hesaplar; baseline zamanını döndürür."""
+        count = len(columns['id'])
+        previous_volume = np.full(count, np.nan)
+        previous_rank = np.full(count, np.nan)
+        baseline = self._baseline(now)
+        if baseline is not None:
+            _, baseline_rows, baseline_volume, baseline_rank = baseline
+            rows = np.array([baseline_rows.get(coin_id, -1) for coin_id in columns['id']], dtype=np.int64)
+            known = rows >= 0
+            previous_volume[known] = baseline_volume[rows[known]]
+            previous_rank[known] = baseline_rank[rows[known]]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = columns['total_volume'] / previous_volume
+        ratio[~np.isfinite(ratio)] = np.nan
+        columns['volume_change_ratio'] = ratio
+        columns['rank_change'] = previous_rank - columns['market_cap_rank']  # Positive = climbed
+        return None if baseline is None else baseline[0]
+
+    def baseline_age(self) -> Optional[float]:
+        """Seconds between the current table and the snapshot its volume/rank changes compare to."""
+        baseline_at, updated_at = self.baseline_at, self.updated_at
+        if baseline_at is None or updated_at is None:
+            return None
+        return round(updated_at - baseline_at, 1)
+
+    @staticmethod
+    def _in_currency(columns: Dict[str, np.ndarray], vs_currency: str) -> Dict[str, np.ndarray]:
+        """Para sütunlarını tek kurla çarpılmış bir görünüm döndürür (tablo USD olarak kalır)."""
+        rate = fx_rate(BASE_CURRENCY, vs_currency)
+        if rate == 1.0:
+            return columns
+        converted = dict(columns)
+        for name in _MARKET_MONEY_COLUMNS:
+            converted[name] = columns[name] * rate
+        return converted
+
+    def top_movers(self, kind: str, k: int = 10, min_market_cap: Optional[float] = None,
+                   vs_currency: str = BASE_CURRENCY) -> list:
+        """
+        En çok hareket eden k coin'i heap tabanlı top-k seçimi ile döndürür (O(n log k), tam sıralama yok).
+
+        kind: gainers, losers, volume_spikes, rank_gainers, rank_losers. Her satıra 'metric' eklenir.
+        Fiyat/market cap/hacim ve min_market_cap vs_currency cinsindendir.
+        """
+        if kind not in MOVER_KINDS:
+            raise ValueError(f"kind must be one of: {', '.join(MOVER_KINDS)}")
+        columns = self._columns
+        if columns is None or k <= 0:
+            return []
+        columns = self._in_currency(columns, vs_currency)
+
+        column, largest, is_mover = MOVER_KINDS[kind]
+        values = columns[column]
+        with np.errstate(invalid='ignore'):
+            candidates = np.isfinite(values) & is_mover(values)
+            if min_market_cap:
+                candidates &= columns['market_cap'] >= min_market_cap
+
+        select = heapq.nlargest if largest else heapq.nsmallest
+        top = select(k, np.flatnonzero(candidates).tolist(), key=values.__getitem__)
+        return [dict(self._row(columns, i), metric=float(values[i])) for i in top]
+
+    def start(self, interval: Optional[float] = None) -> None:
+        """Arka plan yenileyicisini başlatır (zaten çalışıyorsa bir şey yapmaz)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        interval = MARKET_UNIVERSE_REFRESH_SECONDS if interval is None else interval
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error(f"Market universe refresh failed: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=run, name='crypto-market-universe', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        """Tablo hiç yüklenmediyse yenileyiciyi başlatır ve ilk yüklemeyi bekler (istek thread'i upstream'e gitmez)."""
+        if self.is_loaded():
+            return True
+        self.start()
+        return self._loaded.wait(MARKET_UNIVERSE_COLD_START_WAIT if timeout is None else timeout)
+
+    def _row(self, columns: Dict[str, np.ndarray], i: int) -> Dict[str, Any]:
+        row = {name: columns[name][i] for name in _MARKET_TEXT_COLUMNS}
+        for name in _MARKET_NUMERIC_COLUMNS + _MARKET_DERIVED_COLUMNS:
+            value = columns[name][i]
+            row[name] = None if np.isnan(value) else float(value)
+        for name in ('market_cap_rank', 'rank_change'):
+            if row[name] is not None:
+                row[name] = int(row[name])
+        return row
+
+    def get(self, coin_id: str) -> Optional[Dict[str, Any]]:
+        columns, row_by_id = self._columns, self._row_by_id
+        i = row_by_id.get(coin_id.lower())
+        if columns is None or i is None or i >= len(columns['id']):
+            return None
+        return self._row(columns, i)
+
+    def query(self, sort_by: str = 'market_cap', descending: bool = True, offset: int = 0, limit: int = 10,
+              min_market_cap: Optional[float] = None, max_market_cap: Optional[float] = None,
+              min_volume: Optional[float] = None, min_change_24h: Optional[float] = None,
+              max_change_24h: Optional[float] = None, vs_currency: str = BASE_CURRENCY) -> tuple:
+        """
+        Tabloyu filtreler, sıralar ve sayfalar. Eksik (NaN) sıralama değerleri her zaman sona düşer.
+        Para sütunları ve market cap/hacim filtreleri vs_currency cinsindendir.
+
+        Returns:
+            (satırlar, filtre sonrası toplam satır sayısı)
+        """
+        columns = self._columns
+        if columns is None:
+            return [], 0
+        if sort_by not in MARKET_SORT_COLUMNS:
+            raise ValueError(f"sort_by must be one of: {', '.join(MARKET_SORT_COLUMNS)}")
+        columns = self._in_currency(columns, vs_currency)
+
+        mask = np.ones(len(columns['id']), dtype=bool)
+        for column, bound, is_min in (('market_cap', min_market_cap, True), ('market_cap', max_market_cap, False),
+                                      ('total_volume', min_volume, True),
+                                      ('price_change_percentage_24h', min_change_24h, True),
+                                      ('price_change_percentage_24h', max_change_24h, False)):
+            if bound is not None:
+                mask &= columns[column] >= bound if is_min else columns[column] <= bound
+
+        rows = np.flatnonzero(mask)
+        values = columns[MARKET_SORT_COLUMNS[sort_by]][rows]
+        keys = -values if descending else values
+        order = rows[np.argsort(np.where(np.isnan(keys), np.inf, keys), kind='stable')]
+
+        offset = max(0, offset)
+        page = order[offset:offset + max(0, limit)]
+        return [self._row(columns, i) for i in page], len(order)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'coins': len(self),
+            'target_size': self.size,
+            'age_seconds': None if self.updated_at is None else round(time.time() - self.updated_at, 1),
+            'baseline_age_seconds': self.baseline_age(),
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'refresher_running': self._thread is not None and self._thread.is_alive(),
+            'last_error': self.last_error
+        }
+
+market_universe = MarketUniverse()
+atexit.register(market_universe.stop)
+
+
+def _format_market_analysis(data: list, currency: str = BASE_CURRENCY) -> str:
+    """Format the CoinGecko markets response as the top 10 summary."""
+    if not data:
+        raise APIDataError("No market data received", "CoinGecko")
+
+    result = "Top 10 cryptocurrencies (CoinGecko):\n"
+    for coin in data:
+        name = coin.get('name', 'Unknown')
+        symbol = coin.get('symbol', '').upper()
+        price = coin.get('current_price')
+        change_24h = coin.get('price_change_percentage_24h')
+
+        if price is None or change_24h is None:
+            result += f"{name} ({symbol}): Data unavailable\n"
+        else:
+            result += f"{name} ({symbol}): {format_money(price, currency)} | 24h: {change_24h:.2f}%\n"
+
+    return result
+
+@mcp.tool()
+def market_analysis(vs_currency: str = "usd"):
+    """Returns a summary table of the top 10 cryptocurrencies by market cap, including current price (USD or vs_currency) and 24h change percentage."""
+    try:
+        if not market_universe.wait_until_loaded():
+            raise APIDataError(f"Market data is still loading: {market_universe.last_error or 'first refresh pending'}",
+                               "CoinGecko")
+        data, _ = market_universe.query(limit=10, vs_currency=vs_currency)
+        return _format_market_analysis(data, normalize_currency(vs_currency))
+
+    except CryptoAPIError as e:
+        logger.error(f"CoinGecko API error in market_analysis: {e}")
+        return f"Error fetching market analysis from CoinGecko: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in market_analysis: {e}")
+        return f"Unexpected error fetching market analysis: {str(e)}"
+
+@mcp.tool()
+def screen_market(sort_by: str = "market_cap", descending: bool = True, offset: int = 0, limit: int = 20,
+                  min_market_cap: float = 0, min_volume: float = 0,
+                  min_change_24h: Optional[float] = None, max_change_24h: Optional[float] = None,
+                  vs_currency: str = "usd"):
+    """Sorts, filters and pages the top 1000 coins. sort_by: market_cap, price, volume, change_24h, rank. Money values and filters are in vs_currency."""
+    try:
+        if not market_universe.wait_until_loaded():
+            raise APIDataError("Market data is still loading", "CoinGecko")
+        currency = normalize_currency(vs_currency)
+        rows, total = market_universe.query(
+            sort_by=sort_by, descending=descending, offset=offset, limit=min(limit, MARKET_UNIVERSE_PAGE_SIZE),
+            min_market_cap=min_market_cap or None, min_volume=min_volume or None,
+            min_change_24h=min_change_24h, max_change_24h=max_change_24h, vs_currency=currency
+        )
+        if not rows:
+            return f"No coins match ({total} after filters)."
+
+        result = f"Market screen: {offset + 1}-{offset + len(rows)} of {total} coins by {sort_by} ({'desc' if descending else 'asc'})\n"
+        for row in rows:
+            price = "N/A" if row['current_price'] is None else format_money(row['current_price'], currency)
+            change = "N/A" if row['price_change_percentage_24h'] is None else f"{row['price_change_percentage_24h']:+.2f}%"
+            cap = "N/A" if row['market_cap'] is None else format_money(row['market_cap'], currency, ',.0f')
+            result += f"#{row['market_cap_rank'] or '-'} {row['name']} ({row['symbol']}): {price} | 24h: {change} | MCap: {cap}\n"
+        return result
+
+    except ValueError as e:
+        return f"Invalid screen parameters: {e}"
+    except CryptoAPIError as e:
+        logger.error(f"CoinGecko API error in screen_market: {e}")
+        return f"Error screening market: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in screen_market: {e}")
+        return f"Unexpected error screening market: {str(e)}"
+
+_MOVER_TITLES = {
+    'gainers': ("Top gainers (24h)", lambda row: f"{row['metric']:+.2f}%"),
+    'losers': ("Top losers (24h)", lambda row: f"{row['metric']:+.2f}%"),
+    'volume_spikes': ("Volume spikes", lambda row: f"{row['metric']:.2f}x volume"),
+    'rank_gainers': ("Market-cap rank climbers", lambda row: f"+{row['metric']:.0f} ranks"),
+    'rank_losers': ("Market-cap rank fallers", lambda row: f"{row['metric']:.0f} ranks"),
+}
+
+def _movers_report(kind: str, limit: int, min_market_cap: float, vs_currency: str = BASE_CURRENCY) -> str:
+    """Shared body of the top-mover tools."""
+    try:
+        if not market_universe.wait_until_loaded():
+            raise APIDataError("Market data is still loading", "CoinGecko")
+        currency = normalize_currency(vs_currency)
+        rows = market_universe.top_movers(kind, min(limit, MARKET_UNIVERSE_PAGE_SIZE), min_market_cap or None,
+                                          vs_currency=currency)
+        title, describe = _MOVER_TITLES[kind]
+        if MOVER_KINDS[kind][0] in _MARKET_DERIVED_COLUMNS:
+            baseline_age = market_universe.baseline_age()
+            if baseline_age is None:
+                return (f"{title}: needs a market snapshot at least {MOVER_BASELINE_MIN_SECONDS // 60} minutes old; "
+                        f"try again later.")
+            title += f" vs {baseline_age / 60:.0f} min ago"
+        if not rows:
+            return f"{title}: no movers across {len(market_universe)} tracked coins."
+
+        result = f"{title} across {len(market_universe)} coins:\n"
+        for position, row in enumerate(rows, start=1):
+            price = "N/A" if row['current_price'] is None else format_money(row['current_price'], currency)
+            result += f"{position}. {row['name']} ({row['symbol']}) #{row['market_cap_rank'] or '-'}: {describe(row)} | {price}\n"
+        return result
 
     except CryptoAPIError as e:
-        logger.error(f"Bybit API error: {e}")
-        return f"Error fetching {symbol} from Bybit: {e}"
+        logger.error(f"CoinGecko API error in {kind} movers: {e}")
+        return f"Error getting {kind}: {e}"
     except Exception as e:
-        logger.error(f"Unexpected error in get_price_bybit: {e}")
-        return f"Unexpected error fetching {symbol} from Bybit: {str(e)}"
+        logger.error(f"Unexpected error in {kind} movers: {e}")
+        return f"Unexpected error getting {kind}: {str(e)}"
 
 @mcp.tool()
-def get_price_kucoin(symbol: str = "BTC-USDT"):
-    """Gets cryptocurrency price from KuCoin exchange. Use symbols like BTC-USDT, ETH-USDT."""
-    try:
-        url = f"https://api.kucoin.com/api/v1/market/orderbook/level1?symbol={symbol}"
-        data = safe_api_call(url, "KuCoin")
-
-        if not data.get('data'):
-            raise APIDataError("No orderbook data found", "KuCoin")
+def get_top_gainers(limit: int = 10, min_market_cap: float = 0, vs_currency: str = "usd"):
+    """Top 24h gainers across the tracked top-1000 universe, optionally above a market cap."""
+    return _movers_report('gainers', limit, min_market_cap, vs_currency)
 
-        price = data['data'].get('price')
+@mcp.tool()
+def get_top_losers(limit: int = 10, min_market_cap: float = 0, vs_currency: str = "usd"):
+    """Top 24h losers across the tracked top-1000 universe, optionally above a market cap."""
+    return _movers_report('losers', limit, min_market_cap, vs_currency)
 
-        if price is None:
-            raise APIDataError("Price not found in orderbook data", "KuCoin")
+@mcp.tool()
+def get_volume_spikes(limit: int = 10, min_market_cap: float = 0, vs_currency: str = "usd"):
+    """Coins whose 24h volume grew most against the market snapshot from about an hour ago."""
+    return _movers_report('volume_spikes', limit, min_market_cap, vs_currency)
 
-        return f"{symbol} price (KuCoin): ${price}"
+@mcp.tool()
+def get_rank_changes(direction: str = "up", limit: int = 10, min_market_cap: float = 0, vs_currency: str = "usd"):
+    """Coins whose market-cap rank moved most against the snapshot from about an hour ago. direction: up or down."""
+    if direction not in ("up", "down"):
+        return "direction must be 'up' or 'down'"
+    return _movers_report('rank_gainers' if direction == "up" else 'rank_losers', limit, min_market_cap, vs_currency)
 
-    except CryptoAPIError as e:
-        logger.error(f"KuCoin API error: {e}")
-        return f"Error fetching {symbol} from KuCoin: {e}"
+@mcp.tool()
+def get_market_universe_status():
+    """Shows size, age and refresh history of the in-memory top-N market table."""
+    try:
+        status = market_universe.status()
+        age = "never loaded" if status['age_seconds'] is None else f"{status['age_seconds']:.0f}s old"
+        result = (f"Market universe: {status['coins']}/{status['target_size']} coins, {age}\n"
+                  f"Refreshes: {status['refreshes']} | Failures: {status['failures']} | "
+                  f"Refresher: {'running' if status['refresher_running'] else 'stopped'}\n")
+        baseline = status['baseline_age_seconds']
+        result += f"Mover baseline: {'none yet' if baseline is None else f'{baseline:.0f}s before the current table'}\n"
+        if status['last_error']:
+            result += f"Last error: {status['last_error']}\n"
+        return result
     except Exception as e:
-        logger.error(f"Unexpected error in get_price_kucoin: {e}")
-        return f"Unexpected error fetching {symbol} from KuCoin: {str(e)}"
+        logger.error(f"Error getting market universe status: {e}")
+        return f"Error getting market universe status: {str(e)}"
+
+# Async MCP araçları: aynı event loop üzerinde çok sayıda eşzamanlı çağrı I/O'yu paylaşır
 
 @mcp.tool()
-def get_uniswap_token_price(token_address: str = "0x1f9840a85d5af5bf1d1762f925bdaddc4201f984"):  # UNI token
-    """Gets token price from Uniswap v3. Use token contract addresses."""
+async def get_crypto_price_async(coin_name: str = "bitcoin", vs_currency: str = "usd"):
+    """Gets the current price of a cryptocurrency in USD (or vs_currency) without blocking other tool calls."""
     try:
-        # Using Uniswap v3 subgraph
-        query = """
-        {
-          token(id: "%s") {
-            symbol
-            name
-            derivedETH
-          }
-          bundle(id: "1") {
-            ethPriceUSD
-          }
-        }
-        """ % token_address.lower()
+        return await async_get_crypto_price_with_fallback(coin_name, vs_currency=vs_currency)
+    except Exception as e:
+        logger.error(f"Unexpected error in get_crypto_price_async: {e}")
+        return f"Error fetching price for {coin_name}: {str(e)}"
 
-        url = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3"
-        response = requests.post(url, json={'query': query}, timeout=10)
+@mcp.tool()
+async def get_multiple_prices_async(coin_names: str = "bitcoin,ethereum", vs_currency: str = "usd"):
+    """Gets prices (USD or vs_currency) for several cryptocurrencies concurrently. Input format: 'bitcoin,ethereum,cardano'"""
+    try:
+        coin_list = [coin.strip().lower() for coin in coin_names.split(',') if coin.strip()]
+        if not coin_list:
+            return "No valid coin names provided. Use format: 'bitcoin,ethereum,cardano'"
 
-        if response.status_code != 200:
-            raise APIDataError(f"HTTP {response.status_code}", "Uniswap")
+        results = await asyncio.gather(*(async_get_crypto_price_with_fallback(coin, vs_currency=vs_currency)
+                                         for coin in coin_list))
+        return "\n".join(results)
+    except Exception as e:
+        logger.error(f"Unexpected error in get_multiple_prices_async: {e}")
+        return f"Error fetching prices: {str(e)}"
 
-        data = response.json()
+@mcp.tool()
+async def market_analysis_async(vs_currency: str = "usd"):
+    """Async version of market_analysis: top 10 cryptocurrencies by market cap with 24h change."""
+    try:
+        loaded = market_universe.is_loaded() or await asyncio.get_running_loop().run_in_executor(
+            _async_http_executor, market_universe.wait_until_loaded)
+        if not loaded:
+            raise APIDataError(f"Market data is still loading: {market_universe.last_error or 'first refresh pending'}",
+                               "CoinGecko")
+        currency = normalize_currency(vs_currency)
+        # Kur matrisi cache'te değilse fetch event loop'u bloklamasın
+        data, _ = await asyncio.get_running_loop().run_in_executor(
+            _async_http_executor, lambda: market_universe.query(limit=10, vs_currency=currency))
+        return _format_market_analysis(data, currency)
 
-        if data.get('errors'):
-            raise APIDataError(f"GraphQL errors: {data['errors']}", "Uniswap")
+    except CryptoAPIError as e:
+        logger.error(f"CoinGecko API error in market_analysis_async: {e}")
+        return f"Error fetching market analysis from CoinGecko: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in market_analysis_async: {e}")
+        return f"Unexpected error fetching market analysis: {str(e)}"
 
-        token_data = data.get('data', {}).get('token')
-        bundle_data = data.get('data', {}).get('bundle')
 
-        if not token_data or not bundle_data:
-            raise APIDataError("Token or bundle data not found", "Uniswap")
+# Teknik Analiz Fonksiyonları
 
-        eth_price = float(bundle_data['ethPriceUSD'])
-        token_eth_price = float(token_data['derivedETH'])
-        usd_price = eth_price * token_eth_price
+def _historical_prices_url(coin_id: str, days: int) -> str:
+    return f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart?vs_currency=usd&days={days}&interval=daily"
 
-        return f"{token_data['symbol']} ({token_data['name']}) price (Uniswap): ${usd_price:.4f}"
 
-    except CryptoAPIError as e:
-        logger.error(f"Uniswap API error: {e}")
-        return f"Error fetching token {token_address} from Uniswap: {e}"
-    except Exception as e:
-        logger.error(f"Unexpected error in get_uniswap_token_price: {e}")
-        return f"Unexpected error fetching token {token_address} from Uniswap: {str(e)}"
+def _market_chart_to_dataframe(data: Dict[str, Any]) -> pd.DataFrame:
+    """Convert a CoinGecko market_chart response into a timestamp/price/volume DataFrame."""
+    prices = data.get('prices', [])
+    volumes = data.get('total_volumes', [])
 
-@mcp.tool()
-def get_cache_status():
-    """Shows current cache status including number of entries and memory usage."""
-    try:
-        cache_size = len(price_cache)
-        total_memory = sum(len(str(item['data'])) for item in price_cache.values())
+    if not prices:
+        raise APIDataError("No price data available", "CoinGecko")
 
-        # Clear expired entries
-        clear_expired_cache()
-        active_size = len(price_cache)
+    # Create DataFrame
+    df = pd.DataFrame(prices, columns=['timestamp', 'price'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    df['date'] = df['timestamp'].dt.date
 
-        expired_count = cache_size - active_size
+    # Add volume data if available
+    if volumes:
+        volume_df = pd.DataFrame(volumes, columns=['timestamp', 'volume'])
+        volume_df['timestamp'] = pd.to_datetime(volume_df['timestamp'], unit='ms')
+        volume_df['date'] = volume_df['timestamp'].dt.date
+        df = df.merge(volume_df[['date', 'volume']], on='date', how='left')
 
-        return f"Cache Status:\n- Active entries: {active_size}\n- Expired entries cleared: {expired_count}\n- Approximate memory usage: {total_memory} characters\n- Cache expiry: {CACHE_EXPIRY_SECONDS} seconds"
+    df = df.sort_values('timestamp').reset_index(drop=True)
+    return df
 
-    except Exception as e:
-        logger.error(f"Error getting cache status: {e}")
-        return f"Error getting cache status: {str(e)}"
 
-@mcp.tool()
-def get_crypto_news_cryptocompare(coin: str = "BTC"):
-    """Gets latest crypto news from CryptoCompare. Use coin symbols like BTC, ETH."""
-    try:
-        url = f"https://min-api.cryptocompare.com/data/v2/news/?categories={coin}"
-        data = safe_api_call(url, "CryptoCompare")
+# Yerel zaman serisi deposu: coin başına günlük noktalar ve hangi aralıkların zaten çekildiği
+# (coverage) saklanır. Pencere istekleri yerelden dilimlenir; upstream'e yalnızca eksik
+# kuyruk ve boşluklar için market_chart/range ile gidilir.
+HISTORY_DB_PATH = 'crypto_history.db'
+HISTORY_STORE_ENABLED = True
+HISTORY_TAIL_REFRESH_SECONDS = CACHE_TTL_POLICIES['history']['ttl']  # Newest day is refetched at most this often
+DAY_SECONDS = 86400
 
-        news_list = data.get('Data', [])
-        if not news_list:
-            return f"No news found for {coin}"
 
-        # Get first 3 news items
-        news_items = []
-        for item in news_list[:3]:
-            title = item.get('title', 'No title')
-            url = item.get('url', 'No URL')
-            source = item.get('source', 'Unknown source')
-            news_items.append(f"- {title} ({source}): {url}")
+def _history_range_url(coin_id: str, start: float, end: float) -> str:
+    return (f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart/range?vs_currency=usd"
+            f"&from={int(start)}&to={int(math.ceil(end))}")
 
-        return f"Latest {coin} news from CryptoCompare:\n" + "\n".join(news_items)
 
-    except CryptoAPIError as e:
-        logger.error(f"CryptoCompare API error: {e}")
-        return f"Error fetching news for {coin} from CryptoCompare: {e}"
-    except Exception as e:
-        logger.error(f"Unexpected error in get_crypto_news_cryptocompare: {e}")
-        return f"Unexpected error fetching news for {coin} from CryptoCompare: {str(e)}"
+def _daily_points(data: Dict[str, Any]) -> list:
+    """
+    market_chart yanıtını gün başına tek noktaya indirger (günün son noktası).
 
-@mcp.tool()
-def market_analysis():
-    """Returns a summary table of the top 10 cryptocurrencies by market cap, including current price and 24h change percentage."""
-    try:
-        url = "https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd&order=market_cap_desc&per_page=10&page=1"
-        data = safe_api_call(url, "CoinGecko")
+    /range uzun aralıklarda günlük, kısa aralıklarda saatlik veri döndürür; indirgeme
+    sayesinde depo her iki durumda da aynı günlük seriyi tutar.
 
-        if not data:
-            raise APIDataError("No market data received", "CoinGecko")
+    Returns:
+        [(day, ts_ms, price, volume), ...]
+    """
+    by_day: Dict[int, list] = {}
+    for ts, price in sorted(data.get('prices') or []):
+        if price is not None:
+            by_day[int(ts) // (DAY_SECONDS * 1000)] = [int(ts), float(price), None]
+    for ts, volume in sorted(data.get('total_volumes') or []):
+        point = by_day.get(int(ts) // (DAY_SECONDS * 1000))
+        if point is not None and volume is not None:
+            point[2] = float(volume)
+    return [(day, ts, price, volume) for day, (ts, price, volume) in sorted(by_day.items())]
+
+
+class HistoryStore:
+    """
+    SQLite-backed per-coin daily price series with coverage bookkeeping.
 
-        result = "Top 10 cryptocurrencies (CoinGecko):\n"
-        for coin in data:
-            name = coin.get('name', 'Unknown')
-            symbol = coin.get('symbol', '').upper()
-            price = coin.get('current_price')
-            change_24h = coin.get('price_change_percentage_24h')
+    history_points holds one row per coin and UTC day (the latest point seen for
+    that day). history_coverage holds merged [start, end] second ranges that have
+    already been fetched, so a day with no upstream data is not requested again.
+    """
 
-            if price is None or change_24h is None:
-                result += f"{name} ({symbol}): Data unavailable\n"
-            else:
-                result += f"{name} ({symbol}): ${price} | 24h: {change_24h:.2f}%\n"
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS history_points (
+                    coin TEXT NOT NULL,
+                    day INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    price REAL NOT NULL,
+                    volume REAL,
+                    PRIMARY KEY (coin, day)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS history_coverage (
+                    coin TEXT NOT NULL,
+                    start REAL NOT NULL,
+                    end REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_history_coverage_coin ON history_coverage (coin)')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def coverage(self, coin_id: str) -> list:
+        return [tuple(row) for row in self._connection().execute(
+            'SELECT start, end FROM history_coverage WHERE coin = ? ORDER BY start', (coin_id,))]
+
+    def missing_ranges(self, coin_id: str, start: float, end: float) -> list:
+        """[start, end] içinde henüz çekilmemiş aralıklar. Kuyruk HISTORY_TAIL_REFRESH_SECONDS kadar eskiyse taze sayılır."""
+        missing = []
+        cursor = start
+        for covered_start, covered_end in self.coverage(coin_id):
+            if covered_end <= cursor:
+                continue
+            if covered_start > cursor:
+                missing.append((cursor, min(covered_start, end)))
+            cursor = max(cursor, covered_end)
+            if cursor >= end:
+                break
+        if end - cursor > HISTORY_TAIL_REFRESH_SECONDS:
+            missing.append((cursor, end))
+        return [(gap_start, gap_end) for gap_start, gap_end in missing if gap_end > gap_start]
+
+    def add(self, coin_id: str, points: list, start: float, end: float) -> None:
+        """Noktaları yazar (aynı gün için daha yeni nokta kazanır) ve coverage'ı birleştirerek günceller."""
+        conn = self._connection()
+        with conn:
+            conn.executemany('''
+                INSERT INTO history_points (coin, day, ts, price, volume) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (coin, day) DO UPDATE SET ts = excluded.ts, price = excluded.price,
+                    volume = COALESCE(excluded.volume, history_points.volume)
+                WHERE excluded.ts >= history_points.ts
+            ''', [(coin_id, day, ts, price, volume) for day, ts, price, volume in points])
+
+            ranges = sorted(self.coverage(coin_id) + [(start, end)])
+            merged = [list(ranges[0])]
+            for range_start, range_end in ranges[1:]:
+                if range_start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], range_end)
+                else:
+                    merged.append([range_start, range_end])
+            conn.execute('DELETE FROM history_coverage WHERE coin = ?', (coin_id,))
+            conn.executemany('INSERT INTO history_coverage (coin, start, end) VALUES (?, ?, ?)',
+                             [(coin_id, range_start, range_end) for range_start, range_end in merged])
+
+    def window(self, coin_id: str, start: float, end: float) -> list:
+        """[(ts_ms, price, volume), ...] for the UTC days touching [start, end], oldest first."""
+        return self._connection().execute(
+            'SELECT ts, price, volume FROM history_points WHERE coin = ? AND day BETWEEN ? AND ? ORDER BY day',
+            (coin_id, int(start // DAY_SECONDS), int(end // DAY_SECONDS))
+        ).fetchall()
+
+    def clear(self, coin_id: Optional[str] = None) -> int:
+        conn = self._connection()
+        with conn:
+            if coin_id is None:
+                conn.execute('DELETE FROM history_coverage')
+                return conn.execute('DELETE FROM history_points').rowcount
+            conn.execute('DELETE FROM history_coverage WHERE coin = ?', (coin_id,))
+            return conn.execute('DELETE FROM history_points WHERE coin = ?', (coin_id,)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        coins, points = self._connection().execute(
+            'SELECT COUNT(DISTINCT coin), COUNT(*) FROM history_points').fetchone()
+        return {'coins': coins, 'points': points, 'path': self.path}
+
+
+history_store = HistoryStore(HISTORY_DB_PATH)
+_history_sync_locks: Dict[str, threading.Lock] = {}
+_history_sync_locks_guard = threading.Lock()
+
+
+def _history_rows_to_dataframe(rows: list) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=['timestamp', 'price', 'volume'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    df['date'] = df['timestamp'].dt.date
+    return df[['timestamp', 'price', 'date', 'volume']]
+
+
+def get_history_window(coin_id: str, days: int = 30) -> pd.DataFrame:
+    """
+    Son `days` günün günlük serisini depodan döndürür; önce yalnızca eksik aralıkları çeker.
 
-        return result
+    Bir aralığın çekilmesi başarısız olursa depoda olanla devam edilir; hiç veri yoksa
+    son hata yükseltilir.
+    """
+    end = time.time()
+    start = end - days * DAY_SECONDS
+    with _history_sync_locks_guard:
+        lock = _history_sync_locks.setdefault(coin_id, threading.Lock())
 
-    except CryptoAPIError as e:
-        logger.error(f"CoinGecko API error in market_analysis: {e}")
-        return f"Error fetching market analysis from CoinGecko: {e}"
-    except Exception as e:
-        logger.error(f"Unexpected error in market_analysis: {e}")
-        return f"Unexpected error fetching market analysis: {str(e)}"
+    last_error = None
+    with lock:  # Aynı coin için eşzamanlı isteklerin aynı boşluğu iki kez çekmesini önler
+        for gap_start, gap_end in history_store.missing_ranges(coin_id, start, end):
+            try:
+                data = safe_api_call(_history_range_url(coin_id, gap_start, gap_end), "CoinGecko", use_cache=False)
+            except CryptoAPIError as e:
+                logger.warning(f"History fetch for {coin_id} failed, serving stored points: {e}")
+                last_error = e
+                continue
+            history_store.add(coin_id, _daily_points(data), gap_start, gap_end)
+            logger.info(f"Stored {coin_id} history {datetime.fromtimestamp(gap_start):%Y-%m-%d %H:%M} → "
+                        f"{datetime.fromtimestamp(gap_end):%Y-%m-%d %H:%M}")
 
+    rows = history_store.window(coin_id, start, end)
+    if not rows:
+        raise last_error or APIDataError("No price data available", "CoinGecko")
+    return _history_rows_to_dataframe(rows)
 
-# Teknik Analiz Fonksiyonları
 
 def get_historical_prices(coin_id: str, days: int = 30) -> pd.DataFrame:
     """
@@ -545,35 +3720,58 @@ def get_historical_prices(coin_id: str, days: int = 30) -> pd.DataFrame:
         DataFrame with timestamp, price, volume columns
     """
     try:
-        url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart?vs_currency=usd&days={days}&interval=daily"
-        data = safe_api_call(url, "CoinGecko")
-
-        prices = data.get('prices', [])
-        volumes = data.get('total_volumes', [])
-
-        if not prices:
-            raise APIDataError("No price data available", "CoinGecko")
+        if HISTORY_STORE_ENABLED:
+            try:
+                return get_history_window(coin_id, days)
+            except sqlite3.Error as e:
+                logger.warning(f"History store unavailable, downloading full window: {e}")
+        data = safe_api_call(_historical_prices_url(coin_id, days), "CoinGecko")
+        return _market_chart_to_dataframe(data)
 
-        # Create DataFrame
-        df = pd.DataFrame(prices, columns=['timestamp', 'price'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df['date'] = df['timestamp'].dt.date
+    except CryptoAPIError as e:
+        logger.error(f"Error fetching historical data for {coin_id}: {e}")
+        raise
 
-        # Add volume data if available
-        if volumes:
-            volume_df = pd.DataFrame(volumes, columns=['timestamp', 'volume'])
-            volume_df['timestamp'] = pd.to_datetime(volume_df['timestamp'], unit='ms')
-            volume_df['date'] = volume_df['timestamp'].dt.date
-            df = df.merge(volume_df[['date', 'volume']], on='date', how='left')
 
-        df = df.sort_values('timestamp').reset_index(drop=True)
-        return df
+async def get_historical_prices_async(coin_id: str, days: int = 30) -> pd.DataFrame:
+    """Async variant of get_historical_prices."""
+    try:
+        if HISTORY_STORE_ENABLED:
+            # Depo erişimi ve eksik aralık çekimi bloklayıcı; executor'da çalışır
+            return await asyncio.get_running_loop().run_in_executor(
+                _async_http_executor, get_historical_prices, coin_id, days)
+        data = await async_safe_api_call(_historical_prices_url(coin_id, days), "CoinGecko")
+        return _market_chart_to_dataframe(data)
 
     except CryptoAPIError as e:
         logger.error(f"Error fetching historical data for {coin_id}: {e}")
         raise
 
 
+@mcp.tool()
+async def get_price_history_async(coin_id: str = "bitcoin", days: int = 30):
+    """Summarizes daily USD price history for a cryptocurrency without blocking other tool calls."""
+    try:
+        df = await get_historical_prices_async(coin_id, days)
+        prices = df['price']
+
+        result = f"Price History for {coin_id} (last {days} days, CoinGecko):\n"
+        result += f"Records: {len(df)}\n"
+        result += f"Average Price: ${prices.mean():.2f}\n"
+        result += f"Min Price: ${prices.min():.2f}\n"
+        result += f"Max Price: ${prices.max():.2f}\n"
+        result += f"Latest Price: ${prices.iloc[-1]:.2f}\n"
+        result += f"Change: {(prices.iloc[-1] - prices.iloc[0]) / prices.iloc[0] * 100:+.2f}%"
+        return result
+
+    except CryptoAPIError as e:
+        logger.error(f"Error in get_price_history_async for {coin_id}: {e}")
+        return f"Error fetching price history for {coin_id}: {e}"
+    except Exception as e:
+        logger.error(f"Unexpected error in get_price_history_async: {e}")
+        return f"Unexpected error fetching price history: {str(e)}"
+
+
 def calculate_rsi(prices: pd.Series, period: int = 14) -> pd.Series:
     """Calculate Relative Strength Index (RSI)"""
     delta = prices.diff()
@@ -1005,22 +4203,23 @@ def trend_analysis(coin_id: str = "bitcoin", days: int = 60):
 
 # Portföy Analizi Fonksiyonları
 
-def calculate_portfolio_returns(portfolio: dict, days: int = 30) -> dict:
+def calculate_portfolio_returns(portfolio: dict, days: int = 30, vs_currency: str = 'usd') -> dict:
     """
     Calculate portfolio returns and performance metrics.
 
     Args:
         portfolio: Dict of {coin_id: amount} or {coin_id: {'amount': x, 'cost_basis': y}}
         days: Number of days to look back
+        vs_currency: Valuation currency; cost_basis is read in the same currency
 
     Returns:
         Dict with performance metrics
     """
     try:
-        total_value = 0
-        total_cost = 0
-        holdings = []
+        currency = normalize_currency(vs_currency)
+        quotes = get_price_quotes_bulk(list(portfolio.keys()))
 
+        coins, amounts, cost_bases, usd_prices = [], [], [], []
         for coin_id, holding in portfolio.items():
             if isinstance(holding, dict):
                 amount = holding.get('amount', 0)
@@ -1029,45 +4228,33 @@ def calculate_portfolio_returns(portfolio: dict, days: int = 30) -> dict:
                 amount = holding
                 cost_basis = 0  # Unknown cost basis
 
-            # Get current price
-            try:
-                current_price = get_crypto_price_with_fallback(coin_id)
-                if isinstance(current_price, str) and current_price.startswith("Error"):
-                    logger.warning(f"Could not get price for {coin_id}")
-                    continue
-
-                # Extract price from string response
-                if isinstance(current_price, str):
-                    import re
-                    price_match = re.search(r'\$([0-9,]+\.?[0-9]*)', current_price)
-                    if price_match:
-                        current_price = float(price_match.group(1).replace(',', ''))
-                    else:
-                        continue
-
-                current_value = amount * current_price
-                total_value += current_value
-
-                if cost_basis > 0:
-                    total_cost += cost_basis
-                else:
-                    total_cost += current_value  # Assume current value as cost if unknown
-
-                holdings.append({
-                    'coin': coin_id,
-                    'amount': amount,
-                    'current_price': current_price,
-                    'current_value': current_value,
-                    'cost_basis': cost_basis
-                })
-
-            except Exception as e:
-                logger.warning(f"Error processing {coin_id}: {e}")
+            quote = quotes.get(coin_id)
+            if quote is None:
+                logger.warning(f"Could not get price for {coin_id}")
                 continue
+            coins.append(coin_id)
+            amounts.append(amount)
+            cost_bases.append(cost_basis)
+            usd_prices.append(quote.price)
 
-        if not holdings:
+        if not coins:
             return {"error": "No valid holdings found"}
 
+        # Tüm pozisyonlar tek kurla, vektörel olarak değerlenir
+        prices = convert_from_usd(usd_prices, currency)
+        values = np.asarray(amounts, dtype=np.float64) * prices
+        costs = np.asarray(cost_bases, dtype=np.float64)
+        total_value = float(values.sum())
+        total_cost = float(np.where(costs > 0, costs, values).sum())  # Assume current value as cost if unknown
+
+        holdings = [{
+            'coin': coin_id,
+            'amount': amount,
+            'current_price': float(price),
+            'current_value': float(value),
+            'cost_basis': cost_basis
+        } for coin_id, amount, price, value, cost_basis in zip(coins, amounts, prices, values, cost_bases)]
+
         # Calculate metrics
         total_return = ((total_value - total_cost) / total_cost * 100) if total_cost > 0 else 0
 
@@ -1076,7 +4263,8 @@ def calculate_portfolio_returns(portfolio: dict, days: int = 30) -> dict:
             'total_cost': total_cost,
             'total_return_pct': total_return,
             'holdings': holdings,
-            'num_holdings': len(holdings)
+            'num_holdings': len(holdings),
+            'currency': currency
         }
 
     except Exception as e:
@@ -1085,10 +4273,11 @@ def calculate_portfolio_returns(portfolio: dict, days: int = 30) -> dict:
 
 
 @mcp.tool()
-def portfolio_tracker(portfolio: str):
+def portfolio_tracker(portfolio: str, vs_currency: str = "usd"):
     """
     Track portfolio performance. Input format: 'bitcoin:0.5,ethereum:2.1' (coin:amount pairs separated by commas)
     Or use detailed format: 'bitcoin:amount=0.5,cost_basis=30000;ethereum:amount=2.1,cost_basis=4000'
+    Values (and cost_basis) are in vs_currency (usd, eur, try, ...).
     """
     try:
         # Parse portfolio input
@@ -1131,14 +4320,15 @@ def portfolio_tracker(portfolio: str):
             return "Invalid portfolio format. Use: 'bitcoin:0.5,ethereum:2.1' or 'bitcoin:amount=0.5,cost_basis=30000;ethereum:amount=2.1,cost_basis=4000'"
 
         # Calculate portfolio performance
-        portfolio_data = calculate_portfolio_returns(portfolio_dict)
+        portfolio_data = calculate_portfolio_returns(portfolio_dict, vs_currency=vs_currency)
 
         if 'error' in portfolio_data:
             return f"Error calculating portfolio: {portfolio_data['error']}"
 
+        currency = portfolio_data['currency']
         result = f"📊 Portfolio Analysis\n\n"
-        result += f"💰 Total Value: ${portfolio_data['total_value']:.2f}\n"
-        result += f"💵 Total Cost Basis: ${portfolio_data['total_cost']:.2f}\n"
+        result += f"💰 Total Value: {format_money(portfolio_data['total_value'], currency, '.2f')}\n"
+        result += f"💵 Total Cost Basis: {format_money(portfolio_data['total_cost'], currency, '.2f')}\n"
         result += f"📈 Total Return: {portfolio_data['total_return_pct']:+.2f}%\n"
         result += f"🪙 Holdings: {portfolio_data['num_holdings']}\n\n"
 
@@ -1149,7 +4339,8 @@ def portfolio_tracker(portfolio: str):
                 pnl_pct = (holding['current_value'] - holding['cost_basis']) / holding['cost_basis'] * 100
                 pnl = f" | P&L: {pnl_pct:+.2f}%"
 
-            result += f"• {holding['coin'].upper()}: {holding['amount']} @ ${holding['current_price']:.2f} = ${holding['current_value']:.2f}{pnl}\n"
+            result += (f"• {holding['coin'].upper()}: {holding['amount']} @ {format_money(holding['current_price'], currency, '.2f')}"
+                       f" = {format_money(holding['current_value'], currency, '.2f')}{pnl}\n")
 
         return result
 
@@ -1290,14 +4481,14 @@ def correlation_analysis(coin_ids: str, days: int = 30):
         return f"Error performing correlation analysis: {str(e)}"
 
 # Database functions
-def init_database():
-    """Initialize SQLite database for storing crypto data."""
-    conn = sqlite3.connect('crypto_data.db')
-    cursor = conn.cursor()
-
-    # Create price history table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS price_history (
+DATA_DB_PATH = os.environ.get('CRYPTO_MCP_DB_PATH', 'crypto_data.db')
+DATA_DB_STATEMENT_CACHE = 256  # Prepared statements kept per connection
+
+# Şema migration'ları: (hedef user_version, SQL adımları). Her adım grubu tek transaction'da
+# uygulanır ve PRAGMA user_version güncellenir; mevcut crypto_data.db yerinde yükseltilir.
+SCHEMA_MIGRATIONS = [
+    (1, [
+        '''CREATE TABLE IF NOT EXISTS price_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             coin_id TEXT NOT NULL,
             price REAL NOT NULL,
@@ -1305,38 +4496,571 @@ def init_database():
             market_cap REAL,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
             source TEXT NOT NULL
-        )
-    ''')
-
-    # Create portfolio table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS portfolio (
+        )''',
+        '''CREATE TABLE IF NOT EXISTS portfolio (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             coin_id TEXT NOT NULL,
             amount REAL NOT NULL,
             purchase_price REAL NOT NULL,
             purchase_date DATETIME DEFAULT CURRENT_TIMESTAMP,
             notes TEXT
-        )
-    ''')
+        )''',
+    ]),
+    (2, [
+        # Epoch saniye; aralık sorguları metin karşılaştırması yerine tamsayı indeksi kullanır
+        'ALTER TABLE price_history ADD COLUMN ts INTEGER',
+        "UPDATE price_history SET ts = CAST(strftime('%s', timestamp) AS INTEGER) WHERE ts IS NULL",
+        'CREATE INDEX IF NOT EXISTS idx_price_history_coin_ts ON price_history (coin_id, ts)',
+        'CREATE INDEX IF NOT EXISTS idx_portfolio_purchase_date ON portfolio (purchase_date)',
+        'CREATE INDEX IF NOT EXISTS idx_portfolio_coin ON portfolio (coin_id, purchase_date)',
+    ]),
+    (3, [
+        # Write-behind satırlarında timestamp DEFAULT ile flush anını almıştı; ts (gönderim anı) esas alınır
+        "UPDATE price_history SET timestamp = datetime(ts, 'unixepoch') "
+        "WHERE ts IS NOT NULL AND CAST(strftime('%s', timestamp) AS INTEGER) IS NOT ts",
+    ]),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+# Bağlantı başına ayarlar; journal_mode=WAL dosyaya kalıcı yazılır (okurlar yazarları beklemez)
+DATA_DB_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',  # 16 MB page cache
+)
 
-    conn.commit()
-    conn.close()
 
-def save_price_to_db(coin_id: str, price: float, volume: float = None, market_cap: float = None, source: str = "unknown"):
-    """Save price data to database."""
+def connect_data_db(path: Optional[str] = None) -> sqlite3.Connection:
+    """crypto_data.db'ye ayarlı bir bağlantı açar (Database dışında doğrudan kullanım için de)."""
+    # check_same_thread=False yalnızca close()'un tüm bağlantıları kapatabilmesi için; her bağlantıyı tek thread kullanır
+    conn = sqlite3.connect(path or DATA_DB_PATH, timeout=5, check_same_thread=False,
+                           cached_statements=DATA_DB_STATEMENT_CACHE)
+    for pragma in DATA_DB_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def migrate_database(conn: sqlite3.Connection) -> int:
+    """
+    Eksik migration'ları sırayla uygular.
+
+    Her sürüm BEGIN IMMEDIATE ile kilitlenir, böylece aynı anda açılan iki süreç aynı
+    adımı iki kez çalıştırmaz; bir adım başarısız olursa o sürümün tamamı geri alınır.
+
+    Returns:
+        Son şema sürümü
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Transaction'ları (DDL dahil) burada açıkça yönetiyoruz
     try:
-        init_database()
-        conn = sqlite3.connect('crypto_data.db')
-        cursor = conn.cursor()
+        for target, statements in SCHEMA_MIGRATIONS:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= target:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] < target:
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute(f'PRAGMA user_version = {target}')
+                    logger.info(f"Migrated database schema to version {target}")
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.isolation_level = isolation_level
+
+
+class Database:
+    """
+    crypto_data.db veri erişim katmanı.
 
-        cursor.execute('''
-            INSERT INTO price_history (coin_id, price, volume, market_cap, source)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (coin_id, price, volume, market_cap, source))
+    Her thread ilk kullanımda tek bir bağlantı açar (DATA_DB_PRAGMAS ile) ve yaşadığı sürece
+    onu yeniden kullanır; sqlite3'ün bağlantı başına statement cache'i sabit SQL'leri
+    hazırlanmış tutar. Bağlantı thread-local bir tutucuya bağlıdır: thread bittiğinde tutucu
+    toplanır ve bağlantı kapatılır, böylece istek başına thread açan Flask sunucusunda
+    bağlantılar birikmez. Şema kontrolü/migration süreç başına bir kez yapılır.
+    """
 
-        conn.commit()
-        conn.close()
+    class _ThreadConnection:
+        __slots__ = ('generation', 'conn', '__weakref__')
+
+        def __init__(self, generation: int, conn: sqlite3.Connection):
+            self.generation, self.conn = generation, conn
+
+    def __init__(self, path: str = DATA_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connections: set = set()  # Açık bağlantılar (yaşayan thread'ler)
+        self._generation = 0  # close() sonrası eski thread bağlantılarını geçersiz kılar
+        self._lock = threading.Lock()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        holder = getattr(self._local, 'holder', None)
+        if holder is not None and holder.generation == self._generation:
+            return holder.conn
+        conn = connect_data_db(self.path)
+        with self._lock:
+            self._connections.add(conn)
+            holder = self._ThreadConnection(self._generation, conn)
+        # Thread çıkınca threading.local tutucuyu bırakır; finalizer bağlantıyı kapatır
+        weakref.finalize(holder, self._release, conn).atexit = False
+        self._local.holder = holder
+        return conn
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            if conn not in self._connections:
+                return  # close() already closed it
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Error closing database connection: {e}")
+
+    def open_connections(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    def connection(self) -> sqlite3.Connection:
+        """Bu thread'in bağlantısı; şema henüz doğrulanmadıysa önce migration çalışır."""
+        if not self._schema_ready:
+            self.ensure_schema()
+        return self._connection()
+
+    def ensure_schema(self, force: bool = False) -> int:
+        """Migration'ları uygular; force=False iken süreç başına yalnızca ilk çağrı veritabanına gider."""
+        with self._schema_lock:
+            if self._schema_ready and not force:
+                return SCHEMA_VERSION
+            version = migrate_database(self._connection())
+            self._schema_ready = True
+            return version
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        return self.connection().execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params: tuple = ()) -> int:
+        """Tek bir yazma ifadesini kendi transaction'ında çalıştırır; lastrowid döndürür."""
+        conn = self.connection()
+        with conn:
+            return conn.execute(sql, params).lastrowid
+
+    def executemany(self, sql: str, rows: list) -> int:
+        """Satırları tek transaction'da yazar; yazılan satır sayısını döndürür."""
+        conn = self.connection()
+        with conn:
+            return conn.executemany(sql, rows).rowcount
+
+    def close(self) -> None:
+        """Tüm thread'lerin bağlantılarını kapatır; sonraki kullanım yeni bağlantı açar."""
+        with self._lock:
+            connections, self._connections = self._connections, set()
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Error closing database connection: {e}")
+
+
+database = Database(DATA_DB_PATH)
+atexit.register(database.close)
+
+
+def init_database():
+    """Initialize SQLite database for storing crypto data (runs any pending migrations)."""
+    database.ensure_schema(force=True)
+
+# Sütunlu (columnar) geçmiş deposu: coin/interval başına bir dosya (büyüdükçe yeni nesil). Her sütun
+# dosyada kapasite kadar yer ayrılmış bitişik bir float64/int64 bloğudur; np.memmap ile kopyasız
+# okunur, yerinde eklenir ve zaman aralığı ts sütununda ikili arama ile bulunur.
+HISTORY_STORAGE_ENGINE = 'sqlite'  # 'sqlite' (price_history tablosu) veya 'columnar'
+COLUMNAR_HISTORY_DIR = 'history_columns'
+COLUMNAR_INITIAL_CAPACITY = 1024  # Rows; capacity doubles when full
+COLUMNAR_COLUMNS = (('ts', np.int64), ('open', np.float64), ('high', np.float64), ('low', np.float64),
+                    ('close', np.float64), ('volume', np.float64), ('market_cap', np.float64))
+_COLUMNAR_MAGIC = b'CMCOL1'
+_COLUMNAR_HEADER = np.dtype([('magic', 'S8'), ('rows', '<i8'), ('capacity', '<i8')])
+_COLUMNAR_HEADER_BYTES = 64
+# coin_id ve interval dosya yolu bileşeni olur; ayraç, '..' ya da gizli dosya adı kabul edilmez.
+# interval nokta içeremez: dosya adındaki nesil numarasıyla karışmasın (<interval>.<nesil>.col)
+COLUMNAR_NAME_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,127}')
+COLUMNAR_INTERVAL_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]{0,31}')
+
+
+class ColumnarHistoryStore:
+    """
+    Memory-mapped OHLCV series, one file per coin and interval.
+
+    Layout: a 64-byte header (magic, rows, capacity) followed by one contiguous
+    block of `capacity` values per column. Appends write into the mapped blocks
+    and bump `rows` last. When capacity runs out (or rows arrive out of order) the
+    series is written to a new generation file (<interval>.<n>.col) instead of
+    replacing the mapped one, so views handed out earlier stay valid; old
+    generations are deleted once nothing maps them (Windows refuses while mapped).
+    Reads return views into the newest generation.
+    """
+
+    def __init__(self, root: str = COLUMNAR_HISTORY_DIR):
+        self.root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _directory(self, coin_id: str, interval: str) -> str:
+        """Series directory; raises ValueError for ids that are not a single safe path component."""
+        if not isinstance(coin_id, str) or not COLUMNAR_NAME_PATTERN.fullmatch(coin_id) or '..' in coin_id:
+            raise ValueError(f"Invalid coin_id for columnar history: {coin_id!r}")
+        if not isinstance(interval, str) or not COLUMNAR_INTERVAL_PATTERN.fullmatch(interval):
+            raise ValueError(f"Invalid interval for columnar history: {interval!r}")
+        return os.path.join(self.root, coin_id)
+
+    def _generations(self, coin_id: str, interval: str) -> list:
+        """[(nesil, yol), ...] eskiden yeniye."""
+        directory = self._directory(coin_id, interval)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        pattern = re.compile(rf'{re.escape(interval)}(?:\.(\d+))?\.col')
+        found = []
+        for name in names:
+            match = pattern.fullmatch(name)
+            if match:
+                found.append((int(match.group(1) or 0), os.path.join(directory, name)))
+        return sorted(found)
+
+    def path(self, coin_id: str, interval: str) -> str:
+        """Path of the series' newest generation file (the first generation's name if none exists yet)."""
+        generations = self._generations(coin_id, interval)
+        if generations:
+            return generations[-1][1]
+        return os.path.join(self._directory(coin_id, interval), f"{interval}.col")
+
+    def _map_current(self, coin_id: str, interval: str, mode: str = 'r') -> Optional[tuple]:
+        """En yeni nesli map'ler; dosya yoksa None. Okuma sırasında silinen eski nesle karşı yeniden dener."""
+        for _ in range(3):
+            path = self.path(coin_id, interval)
+            if not os.path.exists(path):
+                return None
+            try:
+                return self._map(path, mode)
+            except FileNotFoundError:
+                continue  # A writer just replaced this generation
+        return None
+
+    @staticmethod
+    def _discard(paths: list) -> None:
+        """Eski nesilleri siler; hâlâ map'li olanlar (Windows) bir sonraki büyümede tekrar denenir."""
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.debug(f"Keeping old columnar generation {path} for now: {e}")
+
+    def _lock(self, path: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(path, threading.Lock())
+
+    @staticmethod
+    def _map(path: str, mode: str = 'r') -> tuple:
+        """(header, {sütun: tam kapasite view}, memmap) döndürür."""
+        raw = np.memmap(path, dtype=np.uint8, mode=mode)
+        header = raw[:_COLUMNAR_HEADER.itemsize].view(_COLUMNAR_HEADER)
+        if header['magic'][0] != _COLUMNAR_MAGIC:
+            raise ValueError(f"Not a columnar history file: {path}")
+        capacity = int(header['capacity'][0])
+        columns, offset = {}, _COLUMNAR_HEADER_BYTES
+        for name, dtype in COLUMNAR_COLUMNS:
+            columns[name] = raw[offset:offset + capacity * 8].view(dtype)
+            offset += capacity * 8
+        return header, columns, raw
+
+    @staticmethod
+    def _write_file(path: str, columns: Dict[str, np.ndarray], rows: int, capacity: int) -> None:
+        """Yeni bir dosyayı geçici isimle yazıp atomik olarak yeni adına taşır (hedefi kimse map'lemiyor)."""
+        tmp_path = f"{path}.tmp"
+        raw = np.memmap(tmp_path, dtype=np.uint8, mode='w+',
+                        shape=(_COLUMNAR_HEADER_BYTES + capacity * 8 * len(COLUMNAR_COLUMNS),))
+        header = raw[:_COLUMNAR_HEADER.itemsize].view(_COLUMNAR_HEADER)
+        header['magic'], header['rows'], header['capacity'] = _COLUMNAR_MAGIC, rows, capacity
+        offset = _COLUMNAR_HEADER_BYTES
+        for name, dtype in COLUMNAR_COLUMNS:
+            raw[offset:offset + capacity * 8].view(dtype)[:rows] = columns[name][:rows]
+            offset += capacity * 8
+        raw.flush()
+        del raw
+        os.replace(tmp_path, path)
+
+    def append(self, coin_id: str, interval: str, ts: Any, close: Any, open: Any = None, high: Any = None,
+               low: Any = None, volume: Any = None, market_cap: Any = None) -> int:
+        """
+        Satırları (skaler ya da dizi) sona ekler. ts: epoch milisaniye.
+
+        open/high/low verilmezse close kullanılır; eksik volume/market_cap NaN olur.
+        Sıra dışı zaman damgaları gelirse seri sıralanarak yeni bir nesle yazılır (nadir yol).
+
+        Returns:
+            Dosyadaki toplam satır sayısı
+        """
+        ts = np.atleast_1d(np.asarray(ts, dtype=np.int64))
+        close = np.broadcast_to(np.asarray(close, dtype=np.float64), ts.shape)
+        new = {'ts': ts, 'close': close}
+        for name, value in (('open', open), ('high', high), ('low', low)):
+            new[name] = close if value is None else np.broadcast_to(np.asarray(value, dtype=np.float64), ts.shape)
+        for name, value in (('volume', volume), ('market_cap', market_cap)):
+            new[name] = np.broadcast_to(np.asarray(np.nan if value is None else value, dtype=np.float64), ts.shape)
+        if not ts.size:
+            return self.rows(coin_id, interval)
+
+        directory = self._directory(coin_id, interval)
+        with self._lock(os.path.join(directory, interval)):
+            generations = self._generations(coin_id, interval)
+            if not generations:
+                os.makedirs(directory, exist_ok=True)
+                capacity = max(COLUMNAR_INITIAL_CAPACITY, 1 << int(ts.size - 1).bit_length())
+                order = np.argsort(ts, kind='stable')
+                self._write_file(self.path(coin_id, interval), {name: values[order] for name, values in new.items()},
+                                 int(ts.size), capacity)
+                return int(ts.size)
+
+            generation, path = generations[-1]
+            header, columns, raw = self._map(path, mode='r+')
+            rows, capacity = int(header['rows'][0]), int(header['capacity'][0])
+            total = rows + int(ts.size)
+            in_order = (rows == 0 or ts[0] >= columns['ts'][rows - 1]) and bool(np.all(np.diff(ts) >= 0))
+            if in_order and total <= capacity:
+                for name, _ in COLUMNAR_COLUMNS:
+                    columns[name][rows:total] = new[name]
+                raw.flush()
+                header['rows'] = total  # Satırlar yazıldıktan sonra görünür olur
+                raw.flush()
+                return total
+
+            merged = {name: np.concatenate([columns[name][:rows], new[name]]) for name, _ in COLUMNAR_COLUMNS}
+            del header, columns, raw
+            if not in_order:
+                order = np.argsort(merged['ts'], kind='stable')
+                merged = {name: values[order] for name, values in merged.items()}
+            while capacity < total:
+                capacity *= 2
+            self._write_file(os.path.join(directory, f"{interval}.{generation + 1}.col"), merged, total, capacity)
+            self._discard([old for _, old in generations])
+            return total
+
+    def rows(self, coin_id: str, interval: str) -> int:
+        mapped = self._map_current(coin_id, interval)
+        return 0 if mapped is None else int(mapped[0]['rows'][0])
+
+    def read(self, coin_id: str, interval: str, start_ms: Optional[int] = None,
+             end_ms: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """[start_ms, end_ms] aralığındaki sütunlar; dosyaya bakan salt-okunur view'lar (kopya yok)."""
+        mapped = self._map_current(coin_id, interval)
+        if mapped is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNAR_COLUMNS}
+        header, columns, _ = mapped
+        rows = int(header['rows'][0])
+        ts = columns['ts'][:rows]
+        lo = 0 if start_ms is None else int(np.searchsorted(ts, start_ms, side='left'))
+        hi = rows if end_ms is None else int(np.searchsorted(ts, end_ms, side='right'))
+        return {name: columns[name][lo:hi] for name, _ in COLUMNAR_COLUMNS}
+
+    def read_frame(self, coin_id: str, interval: str, start_ms: Optional[int] = None,
+                   end_ms: Optional[int] = None) -> pd.DataFrame:
+        """
+        read() sonucunu timestamp index'li DataFrame olarak döndürür.
+
+        Sütunlar tek bir float bloğuna birleştirilip kopyalanmasın diye ayrı Series olarak verilir;
+        pandas 3'te (copy-on-write) sütunlar memmap'e bakar. Eski pandas sürümleri yine de
+        kopyalayabilir; kopyasızlık garanti gerekiyorsa read() kullanın.
+        """
+        columns = self.read(coin_id, interval, start_ms, end_ms)
+        index = pd.DatetimeIndex(columns['ts'].astype('datetime64[ms]'), name='timestamp')
+        return pd.DataFrame({name: pd.Series(columns[name], index=index, name=name, copy=False)
+                             for name, _ in COLUMNAR_COLUMNS[1:]}, copy=False)
+
+
+columnar_history = ColumnarHistoryStore(COLUMNAR_HISTORY_DIR)
+
+# Write-behind fiyat yazıcısı: save_price_to_db satırları sınırlı bir kuyruğa bırakır, arka plandaki
+# yazıcı thread'i bunları executemany ile toplu transaction'larda yazar.
+PRICE_WRITE_BEHIND = True
+PRICE_WRITER_QUEUE_SIZE = 10000  # Rows held in memory at most
+PRICE_WRITER_BATCH_SIZE = 500  # Rows per transaction
+PRICE_WRITER_PUT_TIMEOUT = 1.0  # Backpressure: producers block this long on a full queue, then the row is dropped
+# timestamp, DEFAULT CURRENT_TIMESTAMP'e (yazıcının flush anı) bırakılmaz; ts ile aynı andan yazılır
+_PRICE_INSERT_SQL = '''
+    INSERT INTO price_history (coin_id, price, volume, market_cap, source, ts, timestamp)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, datetime(?6, 'unixepoch'))
+'''
+
+
+class PriceWriter:
+    """
+    Bounded write-behind queue for price_history rows.
+
+    submit() hands a row to the queue and returns immediately unless the queue is
+    full, in which case it blocks up to put_timeout (backpressure) and then drops the
+    row. A daemon thread drains whatever is queued (up to batch_size rows) into one
+    executemany transaction, so batches grow with the ingest rate. flush() waits until everything submitted so
+    far is on disk; stop() flushes and ends the thread (registered with atexit).
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_queue: int = PRICE_WRITER_QUEUE_SIZE, batch_size: int = PRICE_WRITER_BATCH_SIZE,
+                 put_timeout: float = PRICE_WRITER_PUT_TIMEOUT):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._pending = 0  # Submitted but not yet committed (or failed)
+        self._pending_changed = threading.Condition()  # Also guards the counters below
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.blocked_puts = 0
+        self.last_flush_ms: Optional[float] = None
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='crypto-price-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, row: tuple) -> bool:
+        """Satırı kuyruğa bırakır; kuyruk put_timeout boyunca dolu kalırsa satır düşürülür ve False döner."""
+        self._ensure_started()
+        with self._pending_changed:
+            self._pending += 1
+        try:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                with self._pending_changed:
+                    self.blocked_puts += 1
+                self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            with self._pending_changed:
+                self.dropped += 1
+                self._settle_locked(1)
+            logger.warning(f"Price writer queue full ({self.max_queue} rows), dropped {row[0]} tick")
+            return False
+        with self._pending_changed:
+            self.submitted += 1
+        return True
+
+    def _settle_locked(self, count: int) -> None:
+        self._pending -= count
+        self._pending_changed.notify_all()
+
+    def _write(self, batch: list) -> None:
+        started = time.perf_counter()
+        try:
+            database.executemany(_PRICE_INSERT_SQL, batch)
+        except Exception as e:
+            # Yazıcı thread'i hiçbir hatada ölmemeli; satırlar başarısız sayılır
+            with self._pending_changed:
+                self.failed += len(batch)
+                self._settle_locked(len(batch))
+            logger.error(f"Price writer failed to store {len(batch)} rows: {e}")
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._pending_changed:
+            self.written += len(batch)
+            self.batches += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._flush_ms_total += elapsed_ms
+            self._settle_locked(len(batch))
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """O ana kadar gönderilen satırlar yazılana kadar bekler; zaman aşımında False döner."""
+        with self._pending_changed:
+            if self._pending and (self._thread is None or not self._thread.is_alive()):
+                self._ensure_started()
+            return self._pending_changed.wait_for(lambda: self._pending <= 0, timeout=timeout)
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Kuyruğu boşaltır ve yazıcı thread'ini durdurur (sonraki submit yeniden başlatır)."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self.flush(timeout)
+        try:
+            self._queue.put(self._STOP, timeout=self.put_timeout if timeout is None else timeout)
+        except queue.Full:
+            logger.warning(f"Price writer queue still full ({self._queue.qsize()} rows); not waiting for it to stop")
+            return
+        thread.join(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        with self._pending_changed:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue': self.max_queue,
+                'pending': self._pending,
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'blocked_puts': self.blocked_puts,
+                'batches': self.batches,
+                'avg_batch_rows': round(self.written / self.batches, 1) if self.batches else None,
+                'last_flush_ms': None if self.last_flush_ms is None else round(self.last_flush_ms, 3),
+                'avg_flush_ms': round(self._flush_ms_total / self.batches, 3) if self.batches else None,
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'running': self._thread is not None and self._thread.is_alive()
+            }
+
+
+price_writer = PriceWriter()
+atexit.register(price_writer.stop)  # Registered after database.close, so it runs first
+
+def save_price_to_db(coin_id: str, price: float, volume: float = None, market_cap: float = None, source: str = "unknown"):
+    """Save price data to database."""
+    try:
+        if HISTORY_STORAGE_ENGINE == 'columnar':
+            columnar_history.append(coin_id, 'tick', int(time.time() * 1000), price,
+                                    volume=volume, market_cap=market_cap)
+            return True
+
+        row = (coin_id, price, volume, market_cap, source, int(time.time()))
+        if PRICE_WRITE_BEHIND:
+            return price_writer.submit(row)
+        database.execute(_PRICE_INSERT_SQL, row)
         return True
     except Exception as e:
         logger.error(f"Error saving price to database: {e}")
@@ -1345,23 +5069,24 @@ def save_price_to_db(coin_id: str, price: float, volume: float = None, market_ca
 def get_price_history_from_db(coin_id: str, days: int = 30) -> pd.DataFrame:
     """Get price history from database."""
     try:
-        init_database()
-        conn = sqlite3.connect('crypto_data.db')
-        cursor = conn.cursor()
-
-        # Calculate date threshold
-        from datetime import datetime, timedelta
-        threshold_date = datetime.now() - timedelta(days=days)
-
-        cursor.execute('''
+        if HISTORY_STORAGE_ENGINE == 'columnar':
+            start_ms = int((time.time() - days * DAY_SECONDS) * 1000)
+            df = columnar_history.read_frame(coin_id, 'tick', start_ms=start_ms)
+            if df.empty:
+                return pd.DataFrame()
+            return df.rename(columns={'close': 'price'})[['price', 'volume', 'market_cap']]
+
+        # Write-behind kuyruğunda bekleyen satırlar da görünsün
+        if not price_writer.flush():
+            logger.warning("Price writer flush timed out; history may miss the newest ticks")
+
+        # idx_price_history_coin_ts üzerinden aralık taraması
+        rows = database.query('''
             SELECT price, volume, market_cap, timestamp, source
             FROM price_history
-            WHERE coin_id = ? AND timestamp >= ?
-            ORDER BY timestamp ASC
-        ''', (coin_id, threshold_date.strftime('%Y-%m-%d %H:%M:%S')))
-
-        rows = cursor.fetchall()
-        conn.close()
+            WHERE coin_id = ? AND ts >= ?
+            ORDER BY ts ASC
+        ''', (coin_id, int(time.time() - days * DAY_SECONDS)))
 
         if not rows:
             return pd.DataFrame()
@@ -1380,18 +5105,11 @@ def get_price_history_from_db(coin_id: str, days: int = 30) -> pd.DataFrame:
 def save_portfolio_to_db(coin_id: str, amount: float, purchase_price: float, notes: str = ""):
     """Save portfolio entry to database. Use coin IDs like 'bitcoin', 'ethereum'."""
     try:
-        init_database()
-        conn = sqlite3.connect('crypto_data.db')
-        cursor = conn.cursor()
-
-        cursor.execute('''
+        database.execute('''
             INSERT INTO portfolio (coin_id, amount, purchase_price, notes)
             VALUES (?, ?, ?, ?)
         ''', (coin_id, amount, purchase_price, notes))
 
-        conn.commit()
-        conn.close()
-
         return f"Portfolio entry saved: {amount} {coin_id} at ${purchase_price}"
 
     except Exception as e:
@@ -1402,13 +5120,7 @@ def save_portfolio_to_db(coin_id: str, amount: float, purchase_price: float, not
 def get_portfolio_from_db():
     """Get all portfolio entries from database."""
     try:
-        init_database()
-        conn = sqlite3.connect('crypto_data.db')
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM portfolio ORDER BY purchase_date DESC')
-        rows = cursor.fetchall()
-        conn.close()
+        rows = database.query('SELECT * FROM portfolio ORDER BY purchase_date DESC')
 
         if not rows:
             return "No portfolio entries found."
@@ -1426,6 +5138,25 @@ def get_portfolio_from_db():
         logger.error(f"Error getting portfolio from database: {e}")
         return f"Error retrieving portfolio: {str(e)}"
 
+@mcp.tool()
+def get_price_writer_status():
+    """Shows the write-behind price writer: queue depth, written/dropped rows, batch sizes and flush latency."""
+    try:
+        status = price_writer.status()
+        result = (f"Price Writer: {'running' if status['running'] else 'idle'}\n"
+                  f"- Queue depth: {status['queue_depth']} / {status['max_queue']} (pending {status['pending']})\n"
+                  f"- Rows: {status['submitted']} submitted | {status['written']} written | "
+                  f"{status['dropped']} dropped | {status['failed']} failed | {status['blocked_puts']} blocked puts\n"
+                  f"- Batches: {status['batches']}")
+        if status['batches']:
+            result += (f" (avg {status['avg_batch_rows']} rows)\n"
+                       f"- Flush latency: last {status['last_flush_ms']} ms | avg {status['avg_flush_ms']} ms | "
+                       f"max {status['max_flush_ms']} ms")
+        return result
+    except Exception as e:
+        logger.error(f"Error getting price writer status: {e}")
+        return f"Error getting price writer status: {str(e)}"
+
 @mcp.tool()
 def get_stored_price_history(coin_id: str, days: int = 30):
     """Get stored price history from database for analysis."""
@@ -1567,19 +5298,13 @@ def start_price_monitoring(coin_id: str, interval_seconds: int = 60, duration_mi
         while time.time() < end_time:
             try:
                 # Get current price
-                price_data = get_crypto_price_with_fallback(coin_id)
+                price = get_price_quote(coin_id).price
+                timestamp = datetime.now().strftime('%H:%M:%S')
+                prices.append((timestamp, price))
+                print(f"[{timestamp}] {coin_id}: ${format_price(price)}")
 
-                # Extract numeric price from response
-                import re
-                price_match = re.search(r'\$([0-9,]+\.?[0-9]*)', price_data)
-                if price_match:
-                    price = float(price_match.group(1).replace(',', ''))
-                    timestamp = datetime.now().strftime('%H:%M:%S')
-                    prices.append((timestamp, price))
-                    print(f"[{timestamp}] {coin_id}: ${price}")
-
-                    # Save to database
-                    save_price_to_db(coin_id, price, source="realtime_monitor")
+                # Save to database
+                save_price_to_db(coin_id, price, source="realtime_monitor")
 
                 time.sleep(interval_seconds)
 
@@ -1621,15 +5346,12 @@ def display_price_table(coin_data: dict):
     table.add_column("Time", style="magenta")
 
     for coin, data in coin_data.items():
-        if isinstance(data, str):
-            # Parse price from string response
-            import re
-            price_match = re.search(r'\$([0-9,]+\.?[0-9]*)', data)
-            if price_match:
-                price = f"${price_match.group(1)}"
-                source_match = re.search(r'\(([^)]+)\)', data)
-                source = source_match.group(1) if source_match else "Unknown"
-                table.add_row(coin.upper(), price, source, datetime.now().strftime("%H:%M:%S"))
+        if isinstance(data, PriceQuote):
+            source = f"{data.source} (stale)" if data.stale else data.source
+            table.add_row(coin.upper(), f"${format_price(data.price)}", source,
+                          datetime.fromtimestamp(data.timestamp).strftime("%H:%M:%S"))
+        elif data is None:
+            table.add_row(coin.upper(), "N/A", "Unavailable", datetime.now().strftime("%H:%M:%S"))
         else:
             table.add_row(coin.upper(), f"${data.get('price', 'N/A')}", data.get('source', 'Unknown'), datetime.now().strftime("%H:%M:%S"))
 
@@ -1638,13 +5360,7 @@ def display_price_table(coin_data: dict):
 def display_portfolio_table():
     """Display portfolio in a rich table format."""
     try:
-        init_database()
-        conn = sqlite3.connect('crypto_data.db')
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM portfolio ORDER BY purchase_date DESC')
-        rows = cursor.fetchall()
-        conn.close()
+        rows = database.query('SELECT * FROM portfolio ORDER BY purchase_date DESC')
 
         if not rows:
             console.print("[yellow]No portfolio entries found.[/yellow]")
@@ -1660,18 +5376,14 @@ def display_portfolio_table():
 
         total_value = 0
         total_pnl = 0
+        quotes = get_price_quotes_bulk([row[1] for row in rows])
 
         for row in rows:
             coin_id, amount, purchase_price, purchase_date = row[1], row[2], row[3], row[4]
 
             # Get current price
-            try:
-                current_price_data = get_crypto_price_with_fallback(coin_id)
-                import re
-                price_match = re.search(r'\$([0-9,]+\.?[0-9]*)', current_price_data)
-                current_price = float(price_match.group(1).replace(',', '')) if price_match else purchase_price
-            except:
-                current_price = purchase_price
+            quote = quotes.get(coin_id)
+            current_price = quote.price if quote is not None else purchase_price
 
             current_value = amount * current_price
             pnl = current_value - (amount * purchase_price)
@@ -1734,14 +5446,12 @@ def cli_price_command(args):
     ) as progress:
         task = progress.add_task(f"Fetching prices for {', '.join(coins)}...", total=len(coins))
 
-        price_data = {}
-        for coin in coins:
-            try:
-                price = get_crypto_price_with_fallback(coin)
-                price_data[coin] = price
-            except Exception as e:
-                price_data[coin] = f"Error: {e}"
-            progress.advance(task)
+        try:
+            price_data = get_price_quotes_bulk(coins)
+        except Exception as e:
+            console.print(f"[red]Error fetching prices: {e}[/red]")
+            price_data = {coin: None for coin in coins}
+        progress.update(task, completed=len(coins))
 
     display_price_table(price_data)
 
@@ -1817,16 +5527,15 @@ def cli_alert_command(args):
             console.print(table)
     elif args.check:
         triggered = []
+        quotes = get_price_quotes_bulk([alert['coin_id'] for alert in alerts if alert['active']])
         for alert in alerts:
             if not alert['active']:
                 continue
 
             try:
-                price_data = get_crypto_price_with_fallback(alert['coin_id'])
-                import re
-                price_match = re.search(r'\$([0-9,]+\.?[0-9]*)', price_data)
-                if price_match:
-                    current_price = float(price_match.group(1).replace(',', ''))
+                quote = quotes.get(alert['coin_id'])
+                if quote is not None:
+                    current_price = quote.price
 
                     triggered_condition = False
                     if alert['condition'] == 'above' and current_price >= alert['target_price']:
@@ -1929,6 +5638,9 @@ def main():
     # Initialize database
     init_database()
 
+    # Load (or build) the symbol resolution index without delaying the command
+    threading.Thread(target=symbol_index.ensure_loaded, name='crypto-symbol-index', daemon=True).start()
+
     # Execute command
     try:
         args.func(args)
@@ -1950,68 +5662,117 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '2.0.0'
+        'version': '2.0.0',
+        'providers': get_provider_health_data()
     })
 
 @app.route('/api/prices/<coin>', methods=['GET'])
 def get_price_api(coin):
     """Get price for a specific coin via REST API."""
     try:
-        price_data = get_crypto_price_with_fallback(coin)
-
-        # Parse price from response
-        import re
-        price_match = re.search(r'\$([0-9,]+\.?[0-9]*)', price_data)
-        if price_match:
-            price = float(price_match.group(1).replace(',', ''))
-            return jsonify({
-                'coin': coin,
-                'price': price,
-                'currency': 'USD',
-                'timestamp': datetime.now().isoformat(),
-                'source': 'multiple_apis'
-            })
-        else:
-            return jsonify({'error': 'Price not found'}), 404
+        quote = get_price_quote(coin)
+        return jsonify(quote.convert(request.args.get('currency', 'usd')).to_dict())
 
+    except PriceUnavailableError:
+        return jsonify({'error': 'Price not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except CryptoAPIError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/prices', methods=['GET'])
 def get_multiple_prices_api():
     """Get prices for multiple coins."""
-    coins = request.args.get('coins', 'bitcoin').split(',')
+    coins = [coin.strip() for coin in request.args.get('coins', 'bitcoin').split(',') if coin.strip()]
+    currency = normalize_currency(request.args.get('currency'))
+    try:
+        rate = fx_rate(BASE_CURRENCY, currency)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except CryptoAPIError as e:
+        return jsonify({'error': f"Exchange rates unavailable: {e}"}), 503
+    quotes = get_price_quotes_bulk(coins)
 
     results = {}
     for coin in coins:
-        coin = coin.strip()
-        try:
-            price_data = get_crypto_price_with_fallback(coin)
-            import re
-            price_match = re.search(r'\$([0-9,]+\.?[0-9]*)', price_data)
-            if price_match:
-                price = float(price_match.group(1).replace(',', ''))
-                results[coin] = {
-                    'price': price,
-                    'currency': 'USD',
-                    'timestamp': datetime.now().isoformat()
-                }
-            else:
-                results[coin] = {'error': 'Price not found'}
-        except Exception as e:
-            results[coin] = {'error': str(e)}
+        quote = quotes.get(coin)
+        if quote is not None:
+            results[coin] = dict(quote.to_dict(), price=quote.price * rate, currency=currency)
+        else:
+            results[coin] = {'error': 'Price not found'}
 
     return jsonify(results)
 
+@app.route('/api/quote/<asset>', methods=['GET'])
+def get_consolidated_quote_api(asset):
+    """Cross-exchange consolidated quote for one asset."""
+    try:
+        deadline = float(request.args.get('deadline', CONSOLIDATED_QUOTE_DEADLINE_SECONDS))
+    except ValueError:
+        return jsonify({'error': 'deadline must be a number'}), 400
+    low, high = CONSOLIDATED_QUOTE_DEADLINE_RANGE
+    if not low <= deadline <= high:
+        return jsonify({'error': f'deadline must be between {low:g} and {high:g} seconds'}), 400
+    try:
+        quote = get_consolidated_quote(asset, deadline=deadline, vs_currency=request.args.get('currency', 'usd'))
+        if quote['median'] is None:
+            return jsonify(dict(quote, error='Price not found')), 404
+        return jsonify(quote)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/market', methods=['GET'])
 def get_market_api():
     """Get market overview."""
     try:
-        market_data = market_analysis()
+        currency = normalize_currency(request.args.get('currency'))
+        market_data = market_analysis(currency)
+        coins, total = market_universe.query(
+            sort_by=request.args.get('sort', 'market_cap'),
+            descending=request.args.get('order', 'desc') != 'asc',
+            offset=int(request.args.get('offset', 0)),
+            limit=min(int(request.args.get('limit', 10)), MARKET_UNIVERSE_PAGE_SIZE),
+            vs_currency=currency
+        )
         return jsonify({
             'market_overview': market_data,
+            'currency': currency,
+            'coins': coins,
+            'total': total,
+            'updated_at': datetime.fromtimestamp(market_universe.updated_at).isoformat() if market_universe.updated_at else None,
             'timestamp': datetime.now().isoformat()
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/movers', methods=['GET'])
+@app.route('/api/movers/<kind>', methods=['GET'])
+def get_movers_api(kind='gainers'):
+    """Top movers: gainers, losers, volume_spikes, rank_gainers, rank_losers."""
+    try:
+        if kind not in MOVER_KINDS:
+            return jsonify({'error': f"kind must be one of: {', '.join(MOVER_KINDS)}"}), 404
+        limit = min(int(request.args.get('limit', 10)), MARKET_UNIVERSE_PAGE_SIZE)
+        min_market_cap = float(request.args.get('min_market_cap', 0)) or None
+        currency = normalize_currency(request.args.get('currency'))
+        if not market_universe.wait_until_loaded():
+            return jsonify({'error': 'Market data is still loading'}), 503
+        return jsonify({
+            'kind': kind,
+            'currency': currency,
+            'coins': market_universe.top_movers(kind, limit, min_market_cap, vs_currency=currency),
+            'universe_size': len(market_universe),
+            'baseline_age_seconds': market_universe.baseline_age(),
+            'updated_at': datetime.fromtimestamp(market_universe.updated_at).isoformat()
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2019,13 +5780,7 @@ def get_market_api():
 def get_portfolio_api():
     """Get portfolio data."""
     try:
-        init_database()
-        conn = sqlite3.connect('crypto_data.db')
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM portfolio ORDER BY purchase_date DESC')
-        rows = cursor.fetchall()
-        conn.close()
+        rows = database.query('SELECT * FROM portfolio ORDER BY purchase_date DESC')
 
         portfolio = []
         for row in rows:
@@ -2038,11 +5793,27 @@ def get_portfolio_api():
                 'notes': row[5]
             })
 
-        return jsonify({
+        response = {
             'portfolio': portfolio,
             'timestamp': datetime.now().isoformat()
-        })
+        }
+        if 'currency' in request.args and portfolio:
+            # ?currency= verilirse kayıtlar güncel fiyatla o para biriminde değerlenir (alış fiyatları USD)
+            currency = normalize_currency(request.args['currency'])
+            holdings = {}
+            for entry in portfolio:
+                holding = holdings.setdefault(entry['coin_id'], {'amount': 0.0, 'cost_basis': 0.0})
+                holding['amount'] += entry['amount']
+                holding['cost_basis'] += entry['amount'] * entry['purchase_price']
+            costs = convert_from_usd([h['cost_basis'] for h in holdings.values()], currency)
+            for holding, cost in zip(holdings.values(), costs):
+                holding['cost_basis'] = float(cost)
+            response['valuation'] = calculate_portfolio_returns(holdings, vs_currency=currency)
+
+        return jsonify(response)
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2156,6 +5927,7 @@ def start_api_server(host='0.0.0.0', port=5000):
         console.print(f"[green]Starting REST API server on http://{host}:{port}[/green]")
         app.run(host=host, port=port, debug=False)
 
+    market_universe.start()
     api_thread = threading.Thread(target=run_server, daemon=True)
     api_thread.start()
     return api_thread
@@ -2192,6 +5964,7 @@ def add_price_alert(coin_id: str, target_price: float, condition: str = "above",
 def check_alerts():
     """Check all active alerts and return triggered ones."""
     triggered_alerts = []
+    quotes = get_price_quotes_bulk([alert['coin_id'] for alert in alerts if alert['active']])
 
     for alert in alerts:
         if not alert['active']:
@@ -2199,11 +5972,9 @@ def check_alerts():
 
         try:
             # Get current price
-            price_data = get_crypto_price_with_fallback(alert['coin_id'])
-            import re
-            price_match = re.search(r'\$([0-9,]+\.?[0-9]*)', price_data)
-            if price_match:
-                current_price = float(price_match.group(1).replace(',', ''))
+            quote = quotes.get(alert['coin_id'])
+            if quote is not None:
+                current_price = quote.price
 
                 triggered = False
                 if alert['condition'] == 'above' and current_price >= alert['target_price']:
@@ -4,16 +4,79 @@ import requests_mock
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import time
+import asyncio
+import threading
+import json
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+import crypto_mcp
 from crypto_mcp import (
     safe_api_call, get_cached_data, set_cached_data, clear_expired_cache,
-    CryptoAPIError, APIRateLimitError, APINetworkError, APIDataError
+    CryptoAPIError, APIRateLimitError, APINetworkError, APIDataError,
+    get_http_session, configure_http_pool, close_http_sessions,
+    async_safe_api_call, get_crypto_price_with_fallback, async_get_crypto_price_with_fallback,
+    ResponseCache, classify_endpoint, DiskCache, TokenBucket, parse_retry_after,
+    CircuitBreaker, APICircuitOpenError, get_crypto_prices_bulk,
+    PriceQuote, PriceUnavailableError, get_price_quote, get_price_quotes_bulk,
+    TickStore, TickerStreamService, STREAM_ADAPTERS, SymbolIndex
 )
 
 
+@pytest.fixture(autouse=True)
+def isolated_disk_cache(tmp_path, monkeypatch):
+    """Keep the persistent cache tier out of the working tree and fresh for each test."""
+    monkeypatch.setattr(crypto_mcp, 'disk_cache', DiskCache(str(tmp_path / 'cache.db')))
+
+
+@pytest.fixture(autouse=True)
+def isolated_history_store(tmp_path, monkeypatch):
+    """Keep the local time-series store out of the working tree and empty for each test."""
+    from crypto_mcp import HistoryStore
+    monkeypatch.setattr(crypto_mcp, 'history_store', HistoryStore(str(tmp_path / 'history.db')))
+
+
+@pytest.fixture(autouse=True)
+def isolated_data_db(tmp_path, monkeypatch):
+    """Point crypto_data.db access at a per-test file; the tracked database is never touched."""
+    from crypto_mcp import Database
+    path = str(tmp_path / 'crypto_data.db')
+    database = Database(path)
+    monkeypatch.setattr(crypto_mcp, 'DATA_DB_PATH', path)
+    monkeypatch.setattr(crypto_mcp, 'database', database)
+    writer = crypto_mcp.PriceWriter()
+    monkeypatch.setattr(crypto_mcp, 'price_writer', writer)
+    yield
+    writer.stop()
+    database.close()
+
+
+@pytest.fixture(autouse=True)
+def isolated_symbol_index(tmp_path, monkeypatch):
+    """Use an empty, non-building symbol index so tests never fetch provider coin lists."""
+    monkeypatch.setattr(crypto_mcp, 'symbol_index', SymbolIndex(str(tmp_path / 'symbols.json'), auto_build=False))
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limiters(monkeypatch):
+    """Give every test full provider token buckets."""
+    monkeypatch.setattr(crypto_mcp, 'rate_limiters', {})
+
+
+@pytest.fixture(autouse=True)
+def fresh_provider_stats(monkeypatch):
+    """Start every test without latency/success history so provider order is the configured one."""
+    monkeypatch.setattr(crypto_mcp, 'provider_stats', {})
+
+
+@pytest.fixture(autouse=True)
+def fresh_circuit_breakers(monkeypatch):
+    """Start every test with all provider circuits closed."""
+    monkeypatch.setattr(crypto_mcp, 'circuit_breakers', {})
+
+
 class TestSafeApiCall:
     """Test cases for the safe_api_call function."""
 
@@ -173,5 +236,2104 @@ class TestCacheManagement:
             assert get_cached_data("url2") is None
 
 
+class TestResponseCache:
+    """Test cases for the bounded LRU/TTL response cache."""
+
+    def test_lru_eviction_by_entry_count(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = ResponseCache(max_entries=2, max_bytes=10_000, default_ttl=60)
+        cache.set("a", {"v": 1})
+        cache.set("b", {"v": 2})
+        cache.get("a")  # 'b' is now least recently used
+        cache.set("c", {"v": 3})
+
+        assert "b" not in cache
+        assert cache.get("a") == {"v": 1}
+        assert cache.get("c") == {"v": 3}
+        assert cache.evictions == 1
+
+    def test_byte_budget(self):
+        """Test that the payload byte budget bounds the cache."""
+        cache = ResponseCache(max_entries=100, max_bytes=120, default_ttl=60)
+        cache.set("small", {"v": "x" * 20})
+        cache.set("big", {"prices": list(range(35))})
+
+        assert cache.total_bytes <= 120
+        assert "small" not in cache
+        assert cache.set("huge", {"prices": list(range(500))}) is False
+
+    def test_per_entry_ttl_and_counters(self):
+        """Test per-entry TTLs and hit/miss/expiration counters."""
+        cache = ResponseCache(max_entries=10, max_bytes=10_000, default_ttl=300)
+        with patch('crypto_mcp.time.time') as mock_time:
+            mock_time.return_value = 1000
+            cache.set("short", {"v": 1}, ttl=10)
+            cache.set("long", {"v": 2})
+
+            mock_time.return_value = 1011
+            assert cache.get("short") is None
+            assert cache.get("long") == {"v": 2}
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['expirations'] == 1
+        assert stats['bytes'] == cache.total_bytes
+
+    def test_concurrent_access(self):
+        """Test that concurrent writers keep the byte accounting consistent."""
+        cache = ResponseCache(max_entries=50, max_bytes=1_000_000, default_ttl=60)
+
+        def writer(offset):
+            for i in range(200):
+                cache.set(f"key-{(offset + i) % 80}", {"i": i})
+                cache.get(f"key-{i % 80}")
+
+        threads = [threading.Thread(target=writer, args=(n * 7,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(cache) <= 50
+        assert cache.total_bytes == sum(entry.size for entry in cache._entries.values())
+
+
+class TestCachePolicies:
+    """Test cases for per-endpoint TTL policies and stale-while-revalidate."""
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def test_classify_endpoint(self):
+        """Test that URLs map to the expected TTL policy classes."""
+        assert classify_endpoint("https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd") == 'spot'
+        assert classify_endpoint("https://api.binance.com/api/v3/ticker/price?symbol=BTCUSDT") == 'spot'
+        assert classify_endpoint("https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd") == 'market'
+        assert classify_endpoint("https://api.coingecko.com/api/v3/coins/bitcoin/market_chart?days=30") == 'history'
+        assert classify_endpoint("https://min-api.cryptocompare.com/data/v2/news/?categories=BTC") == 'news'
+        assert classify_endpoint("https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3") == 'uniswap'
+        assert classify_endpoint("https://api.example.com/test") == 'default'
+
+    def test_policy_ttl_applied(self):
+        """Test that cached entries get their endpoint class TTL."""
+        from crypto_mcp import price_cache, CACHE_TTL_POLICIES
+        url = "https://api.coingecko.com/api/v3/coins/bitcoin/market_chart?vs_currency=usd&days=30"
+        set_cached_data(url, {"prices": []})
+
+        entry = price_cache._entries[url]
+        assert entry.ttl == CACHE_TTL_POLICIES['history']['ttl']
+        assert entry.stale_ttl == CACHE_TTL_POLICIES['history']['stale']
+
+    def test_stale_entry_served_while_refreshing(self):
+        """Test that a slightly stale entry is returned at once and refreshed in the background."""
+        from crypto_mcp import CACHE_TTL_POLICIES
+        url = "https://api.binance.com/api/v3/ticker/price?symbol=SWRUSDT"
+        ttl = CACHE_TTL_POLICIES['spot']['ttl']
+
+        with requests_mock.Mocker() as m:
+            m.get(url, json={"symbol": "SWRUSDT", "price": "2.0"})
+
+            with patch('crypto_mcp.time.time') as mock_time:
+                mock_time.return_value = 1000
+                set_cached_data(url, {"symbol": "SWRUSDT", "price": "1.0"})
+
+                mock_time.return_value = 1000 + ttl + 1
+                result = safe_api_call(url, "Binance")
+                assert result == {"symbol": "SWRUSDT", "price": "1.0"}
+
+                for _ in range(50):
+                    if m.call_count and get_cached_data(url):
+                        break
+                    time.sleep(0.05)
+
+                assert m.call_count == 1
+                assert get_cached_data(url) == {"symbol": "SWRUSDT", "price": "2.0"}
+
+    def test_entry_past_stale_window_is_refetched(self):
+        """Test that very old entries are not served."""
+        from crypto_mcp import CACHE_TTL_POLICIES
+        url = "https://api.binance.com/api/v3/ticker/price?symbol=OLDUSDT"
+        policy = CACHE_TTL_POLICIES['spot']
+
+        with requests_mock.Mocker() as m:
+            m.get(url, json={"price": "3.0"})
+
+            with patch('crypto_mcp.time.time') as mock_time:
+                mock_time.return_value = 1000
+                set_cached_data(url, {"price": "1.0"})
+
+                mock_time.return_value = 1000 + policy['ttl'] + policy['stale'] + 1
+                assert safe_api_call(url, "Binance") == {"price": "3.0"}
+
+
+class TestDiskCache:
+    """Test cases for the persistent on-disk cache tier."""
+
+    def test_entries_survive_memory_loss(self):
+        """Test that a restart (empty memory tier) is served from disk."""
+        from crypto_mcp import price_cache
+        url = "https://api.coingecko.com/api/v3/coins/bitcoin/market_chart?vs_currency=usd&days=7"
+        set_cached_data(url, {"prices": [[1, 2.0]]})
+
+        price_cache.clear()
+
+        with requests_mock.Mocker() as m:
+            assert safe_api_call(url, "CoinGecko") == {"prices": [[1, 2.0]]}
+            assert m.call_count == 0
+        assert url in price_cache
+
+    def test_disk_entries_keep_original_ttl(self):
+        """Test that entries loaded from disk expire on their original schedule."""
+        from crypto_mcp import price_cache
+        url = "https://api.coingecko.com/api/v3/exchange_rates"
+
+        with patch('crypto_mcp.time.time') as mock_time:
+            mock_time.return_value = 1000
+            set_cached_data(url, {"v": 1})
+            price_cache.clear()
+
+            mock_time.return_value = 1000 + 299
+            assert get_cached_data(url) == {"v": 1}
+            price_cache.clear()
+
+            mock_time.return_value = 1000 + 301
+            assert get_cached_data(url) is None
+
+    def test_clear_cache_tool_clears_disk(self):
+        """Test that clear_cache empties both tiers."""
+        from crypto_mcp import clear_cache, disk_cache
+        url = "https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd&page=1"
+        set_cached_data(url, {"v": 1})
+        assert disk_cache.stats()['entries'] == 1
+
+        clear_cache()
+
+        assert disk_cache.stats()['entries'] == 0
+        assert get_cached_data(url) is None
+
+    def test_short_lived_classes_stay_in_memory(self):
+        """Test that spot quotes and ticker tables never touch SQLite, on write or on miss."""
+        from crypto_mcp import price_cache, disk_cache
+        spot = "https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd"
+        tickers = "https://api.kraken.com/0/public/Ticker"
+
+        with patch.object(disk_cache, 'set') as disk_set, patch.object(disk_cache, 'get') as disk_get:
+            set_cached_data(spot, {"bitcoin": {"usd": 1.0}})
+            set_cached_data(tickers, {"result": {}})
+            price_cache.clear()
+            assert get_cached_data(spot) is None
+
+        assert disk_set.call_count == 0 and disk_get.call_count == 0
+
+    def test_expired_rows_are_swept_not_deleted_on_read(self, monkeypatch):
+        """Test that reads do not write and expired rows go in the periodic sweep."""
+        from crypto_mcp import price_cache, disk_cache
+        fx = "https://api.coingecko.com/api/v3/exchange_rates"
+        market = "https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd&page=1"
+
+        with patch('crypto_mcp.time.time') as mock_time:
+            mock_time.return_value = 1000
+            set_cached_data(fx, {"v": 1})
+            price_cache.clear()
+
+            mock_time.return_value = 1000 + 300 + 900  # past ttl + stale
+            assert disk_cache.get(fx) is None
+            assert disk_cache.stats()['entries'] == 1
+
+            mock_time.return_value += crypto_mcp.DISK_CACHE_SWEEP_SECONDS
+            set_cached_data(market, {"v": 2})
+
+            assert disk_cache.stats()['entries'] == 1
+            assert disk_cache.get(market).data == {"v": 2}
+
+
+class TestRateLimiter:
+    """Test cases for the client-side token bucket rate limiter."""
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def test_burst_then_queue(self):
+        """Test that requests beyond the burst wait for a token."""
+        bucket = TokenBucket("TestAPI", rate=20.0, burst=2)
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+
+        waited = bucket.acquire(max_wait=1.0)
+        assert 0 < waited < 0.2
+        assert bucket.delayed == 1
+
+    def test_shed_when_wait_too_long(self):
+        """Test that requests are shed early instead of queueing forever."""
+        bucket = TokenBucket("TestAPI", rate=0.1, burst=1)
+        bucket.acquire()
+
+        with pytest.raises(APIRateLimitError) as exc_info:
+            bucket.acquire(max_wait=0.5)
+        assert exc_info.value.retry_after > 0.5
+        assert bucket.shed == 1
+
+    def test_retry_after_parsing(self):
+        """Test Retry-After in seconds and HTTP-date form."""
+        assert parse_retry_after("7") == 7.0
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("not a date") is None
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+    def test_429_backs_off_provider(self, monkeypatch):
+        """Test that a 429 with Retry-After blocks further calls until it passes."""
+        monkeypatch.setitem(crypto_mcp.PROVIDER_RATE_LIMITS, 'LimitedAPI', {'rate': 100.0, 'burst': 10})
+        monkeypatch.setattr(crypto_mcp, 'RATE_LIMIT_MAX_WAIT_SECONDS', 0.1)
+
+        with requests_mock.Mocker() as m:
+            url = "https://api.example.com/limited"
+            m.get(url, status_code=429, headers={'Retry-After': '30'})
+
+            with pytest.raises(APIRateLimitError) as exc_info:
+                safe_api_call(url, "LimitedAPI")
+            assert exc_info.value.retry_after == 30.0
+
+            with pytest.raises(APIRateLimitError):
+                safe_api_call(url, "LimitedAPI")
+
+        assert m.call_count == 1
+        status = crypto_mcp.rate_limiters['LimitedAPI'].status()
+        assert status['throttled'] == 1
+        assert status['shed'] == 1
+        assert status['rate'] < status['base_rate']
+
+
+class TestCircuitBreaker:
+    """Test cases for the per-provider circuit breaker."""
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def test_opens_after_repeated_failures_and_skips(self):
+        """Test that an open circuit rejects calls without touching the network."""
+        with requests_mock.Mocker() as m:
+            url = "https://api.example.com/breaker"
+            m.get(url, exc=requests.exceptions.ConnectTimeout)
+
+            for _ in range(crypto_mcp.CIRCUIT_FAILURE_THRESHOLD):
+                with pytest.raises(APINetworkError):
+                    safe_api_call(url, "BreakerAPI")
+
+            with pytest.raises(APICircuitOpenError):
+                safe_api_call(url, "BreakerAPI")
+
+        assert m.call_count == crypto_mcp.CIRCUIT_FAILURE_THRESHOLD
+        assert crypto_mcp.circuit_breakers["BreakerAPI"].status()['state'] == CircuitBreaker.OPEN
+
+    def test_client_errors_do_not_open_circuit(self):
+        """Test that 404s (unknown coin) are not counted as provider failures."""
+        with requests_mock.Mocker() as m:
+            url = "https://api.example.com/breaker-404"
+            m.get(url, status_code=404)
+
+            for _ in range(crypto_mcp.CIRCUIT_FAILURE_THRESHOLD + 1):
+                with pytest.raises(CryptoAPIError):
+                    safe_api_call(url, "BreakerAPI")
+
+        assert crypto_mcp.circuit_breakers["BreakerAPI"].status()['state'] == CircuitBreaker.CLOSED
+
+    def test_half_open_probe(self):
+        """Test that after the recovery time a single probe decides the state."""
+        breaker = CircuitBreaker("ProbeAPI", failure_threshold=1, recovery_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.is_open()
+        assert not breaker.allow_request()
+
+        time.sleep(0.06)
+        assert breaker.allow_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow_request()  # only one probe at a time
+
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_fallback_skips_open_provider(self):
+        """Test that the fallback chain skips a provider with an open circuit."""
+        breaker = crypto_mcp.get_circuit_breaker("CoinGecko")
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.coinstats.app/public/v1/coins/breakercoin", json={"coin": {"price": 5.0}})
+
+            result = get_crypto_price_with_fallback("breakercoin", hedged=False)
+
+        assert "via CoinStats" in result
+        assert m.call_count == 1
+
+
+class TestBulkPrices:
+    """Test cases for bulk multi-coin price lookups."""
+
+    SIMPLE_PRICE = "https://api.coingecko.com/api/v3/simple/price"
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def test_one_request_for_many_coins(self):
+        """Test that several coins are priced with a single upstream call."""
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={
+                "bitcoin": {"usd": 50000}, "ethereum": {"usd": 3000}, "cardano": {"usd": 0.5}
+            })
+
+            prices = get_crypto_prices_bulk(["bitcoin", "ethereum", "cardano"])
+
+            assert m.call_count == 1
+            assert m.last_request.qs['ids'] == ["bitcoin,ethereum,cardano"]
+            assert prices["ethereum"] == "Ethereum price: $3000 (via CoinGecko)"
+
+            # Per-coin cache entries were seeded, so single lookups stay local
+            assert "via CoinGecko" in get_crypto_price_with_fallback("cardano")
+            assert m.call_count == 1
+
+    def test_chunking(self, monkeypatch):
+        """Test that large lists are split into chunks."""
+        monkeypatch.setattr(crypto_mcp, 'BULK_PRICE_CHUNK_SIZE', 2)
+
+        def respond(request, context):
+            ids = request.qs['ids'][0].split(',')
+            return {coin: {"usd": 1.0} for coin in ids}
+
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json=respond)
+
+            prices = get_crypto_prices_bulk(["a", "b", "c", "d", "e"])
+
+        assert m.call_count == 3
+        assert len(prices) == 5
+
+    def test_missing_coin_uses_fallback(self):
+        """Test that coins absent from the bulk answer go through the fallback chain."""
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={"bitcoin": {"usd": 50000}})
+            m.get("https://api.coinstats.app/public/v1/coins/rarecoin", json={"coin": {"price": 0.1}})
+            m.get("https://api.coinpaprika.com/v1/tickers/rarecoin-bitcoin", status_code=404)
+
+            prices = get_crypto_prices_bulk(["bitcoin", "rarecoin"])
+
+        assert "via CoinGecko" in prices["bitcoin"]
+        assert "via CoinStats" in prices["rarecoin"]
+
+    def test_check_alerts_uses_bulk(self):
+        """Test that alert checks for several coins share one request."""
+        from crypto_mcp import add_price_alert, check_alerts, alerts
+        alerts.clear()
+        add_price_alert("bitcoin", 40000, "above")
+        add_price_alert("ethereum", 5000, "above")
+
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={"bitcoin": {"usd": 50000}, "ethereum": {"usd": 3000}})
+
+            triggered = check_alerts()
+
+        alerts.clear()
+        assert m.call_count == 1
+        assert [alert['coin_id'] for alert in triggered] == ["bitcoin"]
+
+
+class TestPriceQuote:
+    """Test cases for the typed price quote API."""
+
+    SIMPLE_PRICE = "https://api.coingecko.com/api/v3/simple/price"
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def test_format_avoids_scientific_notation(self):
+        """Test that tiny prices are rendered positionally."""
+        quote = PriceQuote("shiba-inu", 1e-05, "CoinGecko")
+
+        assert quote.format() == "Shiba-inu price: $0.00001 (via CoinGecko)"
+        assert quote.to_dict()['price'] == 1e-05
+        assert not hasattr(quote, '__dict__')
+
+    def test_quote_carries_source_and_cache_age(self):
+        """Test that quotes report the provider and when the data was fetched."""
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={"bitcoin": {"usd": 50000}})
+
+            with patch('crypto_mcp.time.time', return_value=1000.0):
+                get_price_quote("bitcoin", hedged=False)
+            with patch('crypto_mcp.time.time', return_value=1040.0):
+                quote = get_price_quote("bitcoin", hedged=False)
+
+        assert m.call_count == 1
+        assert quote.price == 50000.0
+        assert quote.source == "CoinGecko"
+        assert quote.timestamp == 1000.0
+        assert quote.stale  # spot TTL is 30s, served from the stale window
+
+    def test_unavailable_raises(self):
+        """Test that a fully failed chain raises instead of returning text."""
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={})
+            m.get("https://api.coinstats.app/public/v1/coins/nocoin", json={})
+            m.get("https://api.coinpaprika.com/v1/tickers/nocoin-bitcoin", status_code=404)
+
+            with pytest.raises(PriceUnavailableError):
+                get_price_quote("nocoin", hedged=False)
+            assert get_price_quotes_bulk(["nocoin"]) == {"nocoin": None}
+
+    def test_portfolio_uses_small_prices(self):
+        """Test that sub-cent prices reach portfolio math without string parsing."""
+        from crypto_mcp import calculate_portfolio_returns
+
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={"pepe": {"usd": 1.2e-05}, "bitcoin": {"usd": 50000}})
+
+            result = calculate_portfolio_returns({"pepe": 1000000, "bitcoin": 0.1})
+
+        values = {h['coin']: h['current_value'] for h in result['holdings']}
+        assert values["pepe"] == pytest.approx(12.0)
+        assert values["bitcoin"] == pytest.approx(5000.0)
+
+
+class _LocalTickerServer:
+    """Local WebSocket stand-in for an exchange; replies to each subscription via `respond`."""
+
+    def __init__(self, respond, drop_first_connection=False):
+        self.respond = respond
+        self.drop_first_connection = drop_first_connection
+        self.received = []
+        self.connections = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    async def _handler(self, connection, *args):
+        self.connections += 1
+        async for raw in connection:
+            message = json.loads(raw)
+            self.received.append(message)
+            for reply in self.respond(message):
+                await connection.send(json.dumps(reply))
+            if self.drop_first_connection and self.connections == 1:
+                await connection.close()
+                return
+
+    def __enter__(self):
+        import websockets
+
+        async def start():
+            return await websockets.serve(self._handler, "127.0.0.1", 0)
+
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(start(), self._loop).result(5)
+        self.url = f"ws://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+        return self
+
+    def __exit__(self, *exc):
+        self._server.close()
+        asyncio.run_coroutine_threadsafe(self._server.wait_closed(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _binance_ticker_reply(message):
+    return [{"e": "24hrTicker", "s": param.split('@')[0].upper(), "c": "50000.50"}
+            for param in message.get("params", [])]
+
+
+class TestTickerStream:
+    """Test cases for the WebSocket ticker ingestion service."""
+
+    def test_stream_feeds_exchange_tool(self, monkeypatch):
+        """Test that streamed ticks answer get_price_binance without a REST call."""
+        from crypto_mcp import get_price_binance
+        store = TickStore()
+        with _LocalTickerServer(_binance_ticker_reply) as server:
+            service = TickerStreamService(store, urls={"Binance": server.url})
+            monkeypatch.setattr(crypto_mcp, 'tick_store', store)
+            monkeypatch.setattr(crypto_mcp, 'ticker_stream', service)
+            try:
+                service.subscribe("Binance", ["BTCUSDT"])
+                assert _wait_for(lambda: store.get("Binance", "BTCUSDT") is not None)
+
+                with requests_mock.Mocker() as m:
+                    result = get_price_binance("BTCUSDT")
+                assert m.call_count == 0
+                assert result == "BTCUSDT price (Binance): $50000.5"
+                assert server.received[0]["params"] == ["btcusdt@ticker"]
+            finally:
+                service.stop()
+
+    def test_reconnect_resubscribes(self, monkeypatch):
+        """Test that a dropped connection is reopened with all symbols resubscribed."""
+        monkeypatch.setattr(crypto_mcp, 'STREAM_RECONNECT_MIN_SECONDS', 0.05)
+        store = TickStore()
+        with _LocalTickerServer(_binance_ticker_reply, drop_first_connection=True) as server:
+            service = TickerStreamService(store, urls={"Binance": server.url})
+            try:
+                service.subscribe("Binance", ["BTCUSDT", "ETHUSDT"])
+                assert _wait_for(lambda: server.connections == 2 and len(server.received) == 2)
+
+                assert server.received[1]["params"] == ["btcusdt@ticker", "ethusdt@ticker"]
+                assert service.status()["Binance"]["reconnects"] >= 1
+                assert store.get("Binance", "ETHUSDT").price == 50000.5
+            finally:
+                service.stop()
+
+    def test_adapter_messages(self):
+        """Test subscription and parsing for the Kraken, Bybit and KuCoin protocols."""
+        kraken = STREAM_ADAPTERS["Kraken"]
+        assert json.loads(kraken.subscribe_messages(["BTCUSD"])[0])["pair"] == ["XBT/USD"]
+        assert kraken.normalize("XBTUSD") == kraken.normalize("BTCUSD") == "XBTUSD"
+        assert kraken.parse([42, {"c": ["61000.1", "0.01"]}, "ticker", "XBT/USD"]) == [("XBTUSD", "61000.1")]
+        assert kraken.parse({"event": "heartbeat"}) == []
+
+        bybit = STREAM_ADAPTERS["Bybit"]
+        message = {"topic": "tickers.BTCUSDT", "type": "snapshot", "data": {"symbol": "BTCUSDT", "lastPrice": "61000"}}
+        assert bybit.parse(message) == [("BTCUSDT", "61000")]
+
+        kucoin = STREAM_ADAPTERS["KuCoin"]
+        message = {"type": "message", "topic": "/market/ticker:BTC-USDT", "data": {"price": "61000"}}
+        assert kucoin.parse(message) == [("BTC-USDT", "61000")]
+        assert kucoin.parse({"type": "welcome"}) == []
+
+    def test_adapter_contract_and_status_snapshot(self):
+        """Test that adapters must implement the protocol and status() copies subscriptions under the lock."""
+        from crypto_mcp import _StreamAdapter
+        with pytest.raises(TypeError):
+            _StreamAdapter()
+
+        service = TickerStreamService(TickStore())
+        service._symbols["Binance"] = {"BTCUSDT"}
+        with patch.object(service, '_lock') as lock:
+            status = service.status()
+        assert lock.__enter__.called
+        assert status["Binance"]["symbols"] == ["BTCUSDT"]
+
+    def test_stop_keeps_loop_open_while_thread_runs(self):
+        """Test that stop() does not close a loop whose thread failed to exit."""
+        service = TickerStreamService(TickStore())
+        loop, thread = MagicMock(), MagicMock()
+        thread.is_alive.return_value = True
+        service._loop, service._thread = loop, thread
+
+        pending = MagicMock()
+        pending.result.side_effect = TimeoutError
+
+        def submit(coro, target_loop):
+            coro.close()
+            return pending
+
+        with patch('crypto_mcp.asyncio.run_coroutine_threadsafe', side_effect=submit):
+            service.stop(timeout=0.01)
+
+        loop.close.assert_not_called()
+        thread.join.assert_called_once_with(0.01)
+
+    def test_stale_tick_falls_back_to_rest(self, monkeypatch):
+        """Test that old ticks are ignored in favour of the REST endpoint."""
+        from crypto_mcp import get_price_binance, price_cache
+        price_cache.clear()
+        store = TickStore()
+        store.update("Binance", "BTCUSDT", 1.0, timestamp=time.time() - 600)
+        monkeypatch.setattr(crypto_mcp, 'tick_store', store)
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.binance.com/api/v3/ticker/price", json=[{"symbol": "BTCUSDT", "price": "50000.00"}])
+            result = get_price_binance("BTCUSDT")
+
+        assert m.call_count == 1
+        assert result == "BTCUSDT price (Binance): $50000"
+
+
+class TestExchangeSnapshots:
+    """Test cases for full-table exchange ticker snapshots."""
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def test_one_request_serves_many_symbols(self):
+        """Test that a single snapshot answers every Binance symbol and the index is reused."""
+        from crypto_mcp import get_price_binance, snapshot_stats
+        rebuilds = snapshot_stats['rebuilds']
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.binance.com/api/v3/ticker/price", json=[
+                {"symbol": "BTCUSDT", "price": "50000.00"},
+                {"symbol": "ETHUSDT", "price": "3000.10"},
+                {"symbol": "PEPEUSDT", "price": "0.00001200"}
+            ])
+
+            assert get_price_binance("BTCUSDT") == "BTCUSDT price (Binance): $50000"
+            assert get_price_binance("ethusdt") == "ethusdt price (Binance): $3000.1"
+            assert get_price_binance("PEPEUSDT") == "PEPEUSDT price (Binance): $0.000012"
+            assert "not found" in get_price_binance("NOPEUSDT")
+
+        assert m.call_count == 1
+        assert 'symbol' not in m.last_request.qs
+        assert snapshot_stats['rebuilds'] == rebuilds + 1
+
+    def test_kraken_pair_aliases(self):
+        """Test that Kraken internal pair names are reachable by altname and BTC spelling."""
+        from crypto_mcp import get_price_kraken
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.kraken.com/0/public/Ticker", json={"error": [], "result": {
+                "XXBTZUSD": {"c": ["61000.10000", "0.001"]},
+                "XETHZUSD": {"c": ["3000.00000", "0.1"]}
+            }})
+            m.get("https://api.kraken.com/0/public/AssetPairs", json={"error": [], "result": {
+                "XXBTZUSD": {"altname": "XBTUSD", "wsname": "XBT/USD"},
+                "XETHZUSD": {"altname": "ETHUSD", "wsname": "ETH/USD"}
+            }})
+
+            assert get_price_kraken("XBTUSD") == "XBTUSD price (Kraken): $61000.1"
+            assert get_price_kraken("BTCUSD") == "BTCUSD price (Kraken): $61000.1"
+            assert get_price_kraken("XXBTZUSD") == "XXBTZUSD price (Kraken): $61000.1"
+            assert get_price_kraken("ETHUSD") == "ETHUSD price (Kraken): $3000"
+
+        assert m.call_count == 2
+
+    def test_bybit_and_kucoin_tables(self):
+        """Test the Bybit spot and KuCoin allTickers snapshot formats."""
+        from crypto_mcp import get_price_bybit, get_price_kucoin
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.bybit.com/v5/market/tickers", json={"result": {"list": [
+                {"symbol": "BTCUSDT", "lastPrice": "61000"}, {"symbol": "SOLUSDT", "lastPrice": "150.5"}
+            ]}})
+            m.get("https://api.kucoin.com/api/v1/market/allTickers", json={"data": {"ticker": [
+                {"symbol": "BTC-USDT", "last": "61001"}, {"symbol": "SOL-USDT", "last": "150.4"}
+            ]}})
+
+            assert get_price_bybit("SOLUSDT") == "SOLUSDT price (Bybit): $150.5"
+            assert get_price_kucoin("SOL-USDT") == "SOL-USDT price (KuCoin): $150.4"
+            assert get_price_kucoin("BTC-USDT") == "BTC-USDT price (KuCoin): $61001"
+
+        assert m.call_count == 2
+        assert m.request_history[0].qs == {'category': ['spot']}
+
+
+class TestConsolidatedQuote:
+    """Test cases for the cross-exchange consolidated quote."""
+
+    VENUE_RESPONSES = {
+        "api.binance.com": [{"symbol": "BTCUSDT", "price": "100.0"}],
+        "api.kraken.com/0/public/Ticker": {"result": {"XBTUSD": {"c": ["101.0", "1"]}}},
+        "api.kraken.com/0/public/AssetPairs": {"result": {}},
+        "api.bybit.com": {"result": {"list": [{"symbol": "BTCUSDT", "lastPrice": "99.0"}]}},
+        "api.kucoin.com": {"data": {"ticker": [{"symbol": "BTC-USDT", "last": "102.0"}]}},
+        "api.coinpaprika.com/v1/tickers/btc-bitcoin": {"quotes": {"USD": {"price": 100.5}}},
+        "api.coingecko.com": {"bitcoin": {"usd": 98.0}},
+    }
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def _fake_api_call(self, slow_host=None, delay=0):
+        def fake(url, api_name, timeout=10, use_cache=True, json_body=None):
+            if slow_host and slow_host in url:
+                time.sleep(delay)
+            for fragment, payload in self.VENUE_RESPONSES.items():
+                if fragment in url:
+                    return payload
+            raise APINetworkError("unexpected url", api_name)
+        return fake
+
+    def test_median_and_spread(self):
+        """Test that all six venues are combined into median and spread."""
+        from crypto_mcp import get_consolidated_quote
+
+        with patch('crypto_mcp.safe_api_call', side_effect=self._fake_api_call()):
+            quote = get_consolidated_quote("bitcoin")
+
+        assert quote['asset'] == "BTC"
+        assert quote['responded'] == 6
+        assert quote['median'] == pytest.approx(100.25)
+        assert quote['spread'] == pytest.approx(4.0)
+        assert quote['venues']['Kraken']['price'] == 101.0
+        assert all(info['latency_ms'] is not None for info in quote['venues'].values())
+
+    def test_deadline_bounds_slow_venue(self):
+        """Test that a slow venue is reported as timed out instead of delaying the answer."""
+        from crypto_mcp import get_consolidated_quote
+
+        with patch('crypto_mcp.safe_api_call', side_effect=self._fake_api_call("api.kucoin.com", 1.0)):
+            started = time.time()
+            quote = get_consolidated_quote("BTC", deadline=0.3)
+            elapsed = time.time() - started
+
+        assert elapsed < 0.8
+        assert quote['responded'] == 5
+        assert quote['venues']['KuCoin']['error'].startswith('timeout')
+        assert quote['median'] == pytest.approx(100.0)
+
+    def test_fx_rate_is_fetched_inside_the_deadline(self):
+        """Test that a cold, slow exchange-rate fetch cannot stretch the deadline."""
+        from crypto_mcp import get_consolidated_quote
+        venues = self._fake_api_call()
+
+        def fake(url, api_name, timeout=10, use_cache=True, json_body=None):
+            if "exchange_rates" in url:
+                time.sleep(fx_delay)
+                return TestFxConversion.RATES
+            return venues(url, api_name, timeout, use_cache, json_body)
+
+        with patch('crypto_mcp.safe_api_call', side_effect=fake):
+            fx_delay = 1.0
+            started = time.time()
+            slow = get_consolidated_quote("BTC", deadline=0.3, vs_currency="eur")
+            elapsed = time.time() - started
+            fx_delay = 0
+            fast = get_consolidated_quote("BTC", vs_currency="eur")
+
+        assert elapsed < 0.8
+        assert slow['currency'] == "USD" and slow['fx_error'].startswith('exchange rate timeout')
+        assert slow['median'] == pytest.approx(100.25)
+        assert fast['currency'] == "EUR" and fast['fx_error'] is None
+        assert fast['median'] == pytest.approx(100.25 * 0.9)
+
+    def test_rest_endpoint(self):
+        """Test the /api/quote/<asset> REST endpoint."""
+        from crypto_mcp import app
+
+        with patch('crypto_mcp.safe_api_call', side_effect=self._fake_api_call()):
+            response = app.test_client().get('/api/quote/ETH')
+            assert response.status_code == 404  # no venue lists ETH in the fake data
+
+            response = app.test_client().get('/api/quote/BTC?deadline=2')
+            assert response.status_code == 200
+            assert response.get_json()['venues']['CoinGecko']['price'] == 98.0
+
+            for bad in ('-1', '0', '1e9', 'nan'):
+                assert app.test_client().get(f'/api/quote/BTC?deadline={bad}').status_code == 400
+
+    def test_malformed_venue_payload_is_isolated(self):
+        """Test that an unexpected payload shape only fails its own venue."""
+        from crypto_mcp import get_consolidated_quote
+        self.VENUE_RESPONSES = dict(self.VENUE_RESPONSES, **{"api.bybit.com": {"result": {"list": [{"lastPrice": "99.0"}]}}})
+
+        with patch('crypto_mcp.safe_api_call', side_effect=self._fake_api_call()):
+            quote = get_consolidated_quote("BTC", deadline=-5)
+
+        assert quote['responded'] == 5
+        assert quote['venues']['Bybit']['price'] is None
+        assert quote['venues']['Bybit']['error'].startswith('unexpected response')
+        assert quote['median'] == pytest.approx(100.5)
+
+class TestSymbolIndex:
+    """Test cases for the cross-provider symbol resolution index."""
+
+    COINGECKO_LIST = [
+        {"id": "batcat", "symbol": "btc", "name": "Batcat"},
+        {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+        {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+    ]
+    PAPRIKA_COINS = [
+        {"id": "btc-bitcoin", "symbol": "BTC", "name": "Bitcoin", "rank": 1},
+        {"id": "eth-ethereum", "symbol": "ETH", "name": "Ethereum", "rank": 2},
+        {"id": "btc-batcat", "symbol": "BTC", "name": "Batcat", "rank": 0},
+    ]
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def _built_index(self, tmp_path):
+        index = SymbolIndex(str(tmp_path / 'built.json'), auto_build=False)
+        index._install(SymbolIndex.build_payload(self.COINGECKO_LIST, self.PAPRIKA_COINS, {
+            "Binance": ["BTCUSDT", "ETHUSDT"], "Kraken": ["XBTUSD"], "Bybit": [], "KuCoin": ["BTC-USDT"]
+        }))
+        return index
+
+    def test_build_persist_and_reload(self, tmp_path):
+        """Test that the index is built from provider lists, persisted and reloaded offline."""
+        path = str(tmp_path / 'symbols.json')
+        with requests_mock.Mocker() as m:
+            m.get("https://api.coingecko.com/api/v3/coins/list", json=self.COINGECKO_LIST)
+            m.get("https://api.coinpaprika.com/v1/coins", json=self.PAPRIKA_COINS)
+            m.get("https://api.binance.com/api/v3/ticker/price", json=[{"symbol": "BTCUSDT", "price": "1"}])
+            m.get("https://api.kraken.com/0/public/Ticker", json={"result": {"XXBTZUSD": {"c": ["1", "1"]}}})
+            m.get("https://api.kraken.com/0/public/AssetPairs", json={"result": {"XXBTZUSD": {"altname": "XBTUSD"}}})
+            m.get("https://api.bybit.com/v5/market/tickers", json={"result": {"list": []}})
+            m.get("https://api.kucoin.com/api/v1/market/allTickers", json={"data": {"ticker": []}})
+
+            index = SymbolIndex(path)
+            index.ensure_loaded()
+            assert index.wait_for_build(5)
+            assert index.resolve("BTC")['coingecko'] == "bitcoin"
+            calls = m.call_count
+
+            reloaded = SymbolIndex(path, auto_build=False)
+            ids = reloaded.resolve("btc")
+            assert m.call_count == calls
+
+        assert ids['coinpaprika'] == "btc-bitcoin"
+        assert ids['Binance'] == "BTCUSDT"
+        assert ids['Kraken'] == "XBTUSD"
+        assert ids['Bybit'] is None
+
+    def test_lookups_do_not_wait_for_the_build(self, tmp_path, monkeypatch):
+        """Test that a missing index is built once in the background while lookups use the fallback mapping."""
+        index = SymbolIndex(str(tmp_path / 'symbols.json'), auto_build=True)
+        monkeypatch.setattr(crypto_mcp, 'symbol_index', index)
+        release = threading.Event()
+        builds = []
+
+        def slow_rebuild():
+            builds.append(threading.current_thread().name)
+            release.wait(5)
+            return False
+
+        monkeypatch.setattr(index, 'rebuild', slow_rebuild)
+        started = time.time()
+        lookups = [crypto_mcp.resolve_coin_ids("bitcoin") for _ in range(5)]
+        assert crypto_mcp.resolve_asset("ETH")['coingecko'] == "ethereum"
+        elapsed = time.time() - started
+        release.set()
+        assert index.wait_for_build(5)
+
+        assert elapsed < 0.5
+        assert lookups == [("bitcoin", "btc-bitcoin")] * 5
+        assert builds == ['crypto-symbol-index']
+
+    def test_collisions_and_aliases(self, tmp_path):
+        """Test that the top-ranked coin owns a shared symbol and every alias resolves."""
+        index = self._built_index(tmp_path)
+
+        for identifier in ("bitcoin", "BTC", "btc-bitcoin", "Bitcoin"):
+            assert index.resolve(identifier)['coingecko'] == "bitcoin"
+
+        batcat = index.resolve("batcat")
+        assert batcat['coinpaprika'] == "btc-batcat"
+        assert batcat['Binance'] is None  # BTCUSDT belongs to Bitcoin
+        assert index.resolve("nosuchcoin") is None
+
+    def test_fallback_chain_uses_resolved_ids(self, tmp_path, monkeypatch):
+        """Test that providers get their own IDs and unknown coins send no requests."""
+        monkeypatch.setattr(crypto_mcp, 'symbol_index', self._built_index(tmp_path))
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.coingecko.com/api/v3/simple/price", json={})
+            m.get("https://api.coinstats.app/public/v1/coins/ethereum", json={})
+            m.get("https://api.coinpaprika.com/v1/tickers/eth-ethereum", json={"quotes": {"USD": {"price": 3000}}})
+
+            assert get_crypto_price_with_fallback("ETH", hedged=False) == "Eth price: $3000 (via CoinPaprika)"
+            assert m.request_history[0].qs['ids'] == ["ethereum"]
+
+            calls = m.call_count
+            with pytest.raises(PriceUnavailableError):
+                get_price_quote("nosuchcoin")
+            assert get_price_quotes_bulk(["nosuchcoin"]) == {"nosuchcoin": None}
+            assert m.call_count == calls
+
+    def test_no_guessed_coinpaprika_id_without_index(self):
+        """Test that CoinPaprika is skipped instead of guessing '<coin>-bitcoin'."""
+        with requests_mock.Mocker() as m:
+            m.get("https://api.coingecko.com/api/v3/simple/price", json={})
+            m.get("https://api.coinstats.app/public/v1/coins/rarecoin", json={})
+
+            with pytest.raises(PriceUnavailableError):
+                get_price_quote("rarecoin", hedged=False)
+
+        assert not any("coinpaprika" in request.url for request in m.request_history)
+
+
+class TestUniswapBatch:
+    """Test cases for batched Uniswap subgraph queries."""
+
+    SUBGRAPH = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3"
+    UNI = "0x1f9840a85d5af5bf1d1762f925bdaddc4201f984"
+    DAI = "0x6b175474e89094c44da98b954eedeac495271d0f"
+    MISSING = "0x000000000000000000000000000000000000dead"
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def _respond(self, request, context):
+        tokens = {self.UNI: ("UNI", "Uniswap", "0.002"), self.DAI: ("DAI", "Dai Stablecoin", "0.0005")}
+        data = {"bundle": {"ethPriceUSD": "2000"}}
+        for line in request.json()["query"].splitlines():
+            if "token(id:" in line:
+                alias = line.strip().split(":")[0]
+                address = line.split('"')[1]
+                symbol, name, derived = tokens.get(address, (None, None, None))
+                data[alias] = {"id": address, "symbol": symbol, "name": name, "derivedETH": derived} if symbol else None
+        return {"data": data}
+
+    def test_one_query_for_many_tokens(self):
+        """Test that several tokens share one aliased query and one bundle lookup."""
+        from crypto_mcp import get_uniswap_token_prices
+
+        with requests_mock.Mocker() as m:
+            m.post(self.SUBGRAPH, json=self._respond)
+
+            prices = get_uniswap_token_prices([self.UNI, self.DAI.upper().replace("0X", "0x"), self.MISSING])
+            again = get_uniswap_token_prices([self.DAI, self.UNI])
+
+        assert m.call_count == 1
+        query = m.last_request.json()["query"]
+        assert query.count("bundle(") == 1 and query.count("token(id:") == 3
+        assert prices[self.UNI]['price_usd'] == pytest.approx(4.0)
+        assert prices[self.MISSING] is None
+        assert again[self.DAI]['price_usd'] == pytest.approx(1.0)
+
+    def test_single_token_tool_uses_batch_cache(self):
+        """Test that the single-token tool is served from the per-token cache."""
+        from crypto_mcp import get_uniswap_token_price, get_uniswap_token_prices_batch
+
+        with requests_mock.Mocker() as m:
+            m.post(self.SUBGRAPH, json=self._respond)
+
+            batch = get_uniswap_token_prices_batch(f"{self.UNI},{self.DAI},not-an-address")
+            single = get_uniswap_token_price(self.UNI)
+
+        assert m.call_count == 1
+        assert "not-an-address: not found" in batch
+        assert single == "UNI (Uniswap) price (Uniswap): $4.0000"
+
+    def test_graphql_errors(self):
+        """Test that GraphQL errors surface as API errors."""
+        from crypto_mcp import get_uniswap_token_price
+
+        with requests_mock.Mocker() as m:
+            m.post(self.SUBGRAPH, json={"errors": [{"message": "indexer unavailable"}]})
+            result = get_uniswap_token_price(self.UNI)
+
+        assert result.startswith(f"Error fetching token {self.UNI} from Uniswap")
+        assert "indexer unavailable" in result
+
+    def test_rejects_addresses_that_are_not_hex(self):
+        """Test that only 0x + 40 hex characters ever reach the GraphQL text."""
+        from crypto_mcp import get_uniswap_token_prices
+
+        injected = '0x" ) { id } evil: token(id: "0x' + "0" * 8
+        padded = "0x" + "g" * 40
+
+        with requests_mock.Mocker() as m:
+            m.post(self.SUBGRAPH, json=self._respond)
+            prices = get_uniswap_token_prices([injected[:42], padded, self.UNI])
+
+        query = m.last_request.json()["query"]
+        assert query.count("token(id:") == 1 and "evil" not in query
+        assert prices[injected[:42]] is None and prices[padded] is None
+        assert prices[self.UNI]['price_usd'] == pytest.approx(4.0)
+
+    def test_failed_chunk_keeps_other_results(self):
+        """Test that a failing batch marks its own tokens as errors and keeps the rest."""
+        import crypto_mcp
+        from crypto_mcp import get_uniswap_token_prices_batch
+
+        def respond(request, context):
+            if self.DAI in request.json()["query"]:
+                return {"errors": [{"message": "indexer unavailable"}]}
+            return self._respond(request, context)
+
+        with patch.object(crypto_mcp, 'UNISWAP_BATCH_SIZE', 1), requests_mock.Mocker() as m:
+            m.post(self.SUBGRAPH, json=respond)
+            prices = crypto_mcp.get_uniswap_token_prices([self.UNI, self.DAI])
+            crypto_mcp.price_cache.clear()
+            report = get_uniswap_token_prices_batch(f"{self.UNI},{self.DAI}")
+
+        assert prices[self.UNI]['price_usd'] == pytest.approx(4.0)
+        assert "indexer unavailable" in prices[self.DAI]['error']
+        assert "UNI (Uniswap): $4.0000" in report
+        assert f"{self.DAI}: error (" in report
+
+
+class TestAdaptiveRouting:
+    """Test cases for latency-aware provider ordering."""
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def test_ewma_and_ranking(self):
+        """Test that slow or failing providers sink and unseen ones keep a neutral prior."""
+        from crypto_mcp import get_provider_stats, rank_providers
+
+        slow = get_provider_stats("CoinGecko")
+        slow.record(2.0, True)
+        slow.record(1.0, True)
+        assert slow.latency_ewma == pytest.approx(1.8)
+
+        get_provider_stats("CoinStats").record(0.1, True)
+        flaky = get_provider_stats("Bybit")
+        for _ in range(5):
+            flaky.record(1.0, False)
+
+        assert rank_providers(["CoinGecko", "CoinStats", "CoinPaprika", "Bybit"]) == \
+            ["CoinStats", "CoinPaprika", "CoinGecko", "Bybit"]
+
+    def test_fetch_path_records_stats(self):
+        """Test that every upstream request updates its provider's stats."""
+        from crypto_mcp import provider_stats
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.example.com/ok", json={"ok": True})
+            m.get("https://api.example.com/down", status_code=503)
+            m.get("https://api.example.com/missing", status_code=404)
+
+            safe_api_call("https://api.example.com/ok", "Example")
+            for path in ("down", "missing"):
+                with pytest.raises(CryptoAPIError):
+                    safe_api_call(f"https://api.example.com/{path}", "Example")
+
+        stats = provider_stats["Example"]
+        assert stats.requests == 3
+        assert stats.failures == 1  # the 404 is a prompt answer, not an outage
+        assert stats.latency_ewma is not None
+
+    def test_fallback_chain_calls_fastest_first(self):
+        """Test that the fallback chain reorders itself from recorded stats."""
+        from crypto_mcp import get_provider_stats
+        get_provider_stats("CoinGecko").record(3.0, True)
+        get_provider_stats("CoinStats").record(0.05, True)
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.coingecko.com/api/v3/simple/price", json={"bitcoin": {"usd": 50000}})
+            m.get("https://api.coinstats.app/public/v1/coins/bitcoin", json={"coin": {"price": 50001}})
+
+            result = get_crypto_price_with_fallback("bitcoin", hedged=False)
+
+        assert result == "Bitcoin price: $50001 (via CoinStats)"
+        assert m.call_count == 1
+
+    def test_best_exchange_uses_ranking(self):
+        """Test that the best-exchange tool asks the fastest listing venue first."""
+        from crypto_mcp import get_best_exchange_price, get_provider_stats
+        for exchange, latency in (("Binance", 2.0), ("Bybit", 2.0), ("KuCoin", 2.0), ("Kraken", 0.05)):
+            get_provider_stats(exchange).record(latency, True)
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.kraken.com/0/public/Ticker", json={"result": {"XBTUSD": {"c": ["61000", "1"]}}})
+            m.get("https://api.kraken.com/0/public/AssetPairs", json={"result": {}})
+
+            result = get_best_exchange_price("btc")
+
+        assert result == "BTC price (Kraken): $61000"
+        assert all("kraken" in request.url for request in m.request_history)
+
+
+def _market_rows(count):
+    return [{"id": f"coin{i}", "symbol": f"c{i}", "name": f"Coin {i}", "current_price": 100.0 - i,
+             "market_cap": 1e9 - i * 1e7, "total_volume": 1e6 * (i + 1),
+             "price_change_percentage_24h": (i % 5) - 2.0, "market_cap_rank": i + 1}
+            for i in range(count)]
+
+
+class TestMarketUniverse:
+    """Test cases for the in-memory columnar market table."""
+
+    MARKETS = "https://api.coingecko.com/api/v3/coins/markets"
+
+    def _universe(self, rows):
+        from crypto_mcp import MarketUniverse
+        universe = MarketUniverse(size=len(rows))
+        universe._install(rows)
+        return universe
+
+    def test_refresh_fetches_all_pages(self):
+        """Test that the refresher pulls every page and builds one ranked table."""
+        from crypto_mcp import MarketUniverse
+        rows = _market_rows(6)
+
+        def respond(request, context):
+            page, per_page = int(request.qs['page'][0]), int(request.qs['per_page'][0])
+            return rows[(page - 1) * per_page:page * per_page]
+
+        universe = MarketUniverse(size=6, page_size=2)
+        with requests_mock.Mocker() as m:
+            m.get(self.MARKETS, json=respond)
+            assert universe.refresh()
+
+        assert m.call_count == 3
+        assert len(universe) == 6
+        assert universe.get("coin3")['market_cap_rank'] == 4
+        assert universe.query(limit=1)[0][0]['id'] == "coin0"
+
+    def test_failed_first_page_keeps_previous_table(self):
+        """Test that an upstream failure does not wipe the table readers are using."""
+        universe = self._universe(_market_rows(3))
+
+        with requests_mock.Mocker() as m:
+            m.get(self.MARKETS, status_code=503)
+            assert not universe.refresh()
+
+        assert len(universe) == 3
+        assert universe.status()['failures'] == 1
+
+    def test_sort_filter_paginate(self):
+        """Test sorting, filtering, paging and NaN handling."""
+        rows = _market_rows(10)
+        rows[9]['price_change_percentage_24h'] = None
+        universe = self._universe(rows)
+
+        page, total = universe.query(sort_by='change_24h', descending=True, limit=3)
+        assert total == 10
+        assert [row['price_change_percentage_24h'] for row in page] == [2.0, 1.0, 1.0]
+
+        page, _ = universe.query(sort_by='change_24h', descending=False, offset=8, limit=5)
+        assert page[-1]['id'] == "coin9"  # missing values sort last either way
+        assert page[-1]['price_change_percentage_24h'] is None
+
+        page, total = universe.query(sort_by='volume', min_market_cap=9.5e8, min_change_24h=0)
+        assert total == 3
+        assert [row['id'] for row in page] == ["coin4", "coin3", "coin2"]
+
+        with pytest.raises(ValueError):
+            universe.query(sort_by='bogus')
+
+    def test_request_path_reads_table_only(self, monkeypatch):
+        """Test that market_analysis, screen_market and /api/market never go upstream."""
+        from crypto_mcp import market_analysis, screen_market, app
+        monkeypatch.setattr(crypto_mcp, 'market_universe', self._universe(_market_rows(20)))
+
+        with requests_mock.Mocker() as m:
+            overview = market_analysis()
+            screen = screen_market(sort_by="price", descending=False, limit=2)
+            response = app.test_client().get('/api/market?sort=rank&order=asc&offset=5&limit=5')
+
+        assert m.call_count == 0
+        assert overview.count("\n") == 11  # header + top 10
+        assert "Coin 19 (C19): $81" in screen
+        body = response.get_json()
+        assert [coin['id'] for coin in body['coins']] == [f"coin{i}" for i in range(5, 10)]
+        assert body['total'] == 20
+
+
+class TestTopMovers:
+    """Test cases for heap-based top movers over market snapshots."""
+
+    def _universe(self, *snapshots, spacing=3600):
+        from crypto_mcp import MarketUniverse
+        universe = MarketUniverse(size=100)
+        for i, rows in enumerate(snapshots):
+            universe._install(rows, now=1_700_000_000 + i * spacing)
+            universe.refreshes += 1
+        return universe
+
+    def test_gainers_and_losers(self):
+        """Test top-k gainers/losers, market-cap floor and that only real movers are listed."""
+        rows = _market_rows(10)  # 24h changes cycle -2, -1, 0, +1, +2
+        universe = self._universe(rows)
+
+        gainers = universe.top_movers('gainers', 3)
+        assert [(row['id'], row['metric']) for row in gainers] == [("coin4", 2.0), ("coin9", 2.0), ("coin3", 1.0)]
+        assert all(row['metric'] > 0 for row in universe.top_movers('gainers', 100))
+        assert len(universe.top_movers('losers', 100)) == 4
+
+        big_only = universe.top_movers('gainers', 5, min_market_cap=9.65e8)
+        assert [row['id'] for row in big_only] == ["coin3"]
+
+        with pytest.raises(ValueError):
+            universe.top_movers('sideways')
+
+    def test_snapshot_deltas(self):
+        """Test volume spikes and rank changes against an hour-old baseline snapshot."""
+        before = _market_rows(5)
+        after = [dict(row) for row in before]
+        after[3]['total_volume'] *= 5
+        after[1]['market_cap_rank'], after[4]['market_cap_rank'] = 5, 2
+        after.append({"id": "newcoin", "symbol": "new", "name": "New", "total_volume": 1e9, "market_cap_rank": 6})
+        universe = self._universe(before, after)
+
+        spikes = universe.top_movers('volume_spikes', 5)
+        assert [row['id'] for row in spikes] == ["coin3"]
+        assert spikes[0]['metric'] == pytest.approx(5.0)
+
+        assert [(row['id'], row['rank_change']) for row in universe.top_movers('rank_gainers', 5)] == [("coin4", 3)]
+        assert [(row['id'], row['metric']) for row in universe.top_movers('rank_losers', 5)] == [("coin1", -3.0)]
+        assert universe.get("newcoin")['rank_change'] is None
+        assert universe.baseline_age() == 3600
+
+    def test_baseline_is_about_an_hour_old(self):
+        """Test that deltas skip young snapshots and compare to the one nearest an hour back."""
+        from crypto_mcp import MOVER_BASELINE_SECONDS
+        rows = _market_rows(3)
+        young = self._universe(rows, rows, rows, spacing=120)  # Only 4 minutes of history
+        assert young.baseline_age() is None
+        assert young.top_movers('volume_spikes', 5) == []
+
+        snapshots = []
+        for i in range(61):  # Two hours of refreshes every 2 minutes; volume grows 1% per refresh
+            snapshot = [dict(row) for row in rows]
+            snapshot[0]['total_volume'] *= 1.01 ** i
+            snapshots.append(snapshot)
+        universe = self._universe(*snapshots, spacing=120)
+
+        assert universe.baseline_age() == MOVER_BASELINE_SECONDS
+        assert universe.get("coin0")['volume_change_ratio'] == pytest.approx(1.01 ** 30)
+        assert len(universe._snapshots) <= MOVER_BASELINE_SECONDS // 120 + 1
+
+    def test_tools_and_rest(self, monkeypatch):
+        """Test the mover tools and /api/movers endpoints."""
+        from crypto_mcp import get_top_losers, get_volume_spikes, app
+        monkeypatch.setattr(crypto_mcp, 'market_universe', self._universe(_market_rows(10)))
+
+        with requests_mock.Mocker() as m:
+            losers = get_top_losers(limit=2)
+            spikes = get_volume_spikes()
+            response = app.test_client().get('/api/movers/losers?limit=3')
+            missing = app.test_client().get('/api/movers/sideways')
+
+        assert m.call_count == 0
+        assert losers.startswith("Top losers (24h) across 10 coins:")
+        assert "1. Coin 0 (C0) #1: -2.00%" in losers
+        assert "needs a market snapshot at least 15 minutes old" in spikes
+        assert [coin['metric'] for coin in response.get_json()['coins']] == [-2.0, -2.0, -1.0]
+        assert response.get_json()['baseline_age_seconds'] is None
+
+        rows = _market_rows(4)
+        later = [dict(row) for row in rows]
+        later[2]['total_volume'] *= 3
+        monkeypatch.setattr(crypto_mcp, 'market_universe', self._universe(rows, later, spacing=1800))
+        spikes = get_volume_spikes()
+        body = app.test_client().get('/api/movers/volume_spikes').get_json()
+        assert spikes.startswith("Volume spikes vs 30 min ago across 4 coins:")
+        assert "Coin 2 (C2) #3: 3.00x volume" in spikes
+        assert body['baseline_age_seconds'] == 1800 and body['coins'][0]['id'] == "coin2"
+        assert missing.status_code == 404
+
+
+class TestFxConversion:
+    """Test cases for quote currency conversion via the cached FX matrix."""
+
+    SIMPLE_PRICE = "https://api.coingecko.com/api/v3/simple/price"
+    FX = "https://api.coingecko.com/api/v3/exchange_rates"
+    RATES = {"rates": {
+        "btc": {"name": "Bitcoin", "unit": "BTC", "value": 1.0, "type": "crypto"},
+        "usd": {"name": "US Dollar", "unit": "$", "value": 50000.0, "type": "fiat"},
+        "eur": {"name": "Euro", "unit": "€", "value": 45000.0, "type": "fiat"},
+        "try": {"name": "Turkish Lira", "unit": "₺", "value": 1700000.0, "type": "fiat"},
+    }}
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def test_cross_rates(self):
+        """Test that the matrix derives every cross rate from BTC-denominated values."""
+        from crypto_mcp import FxMatrix
+        fx = FxMatrix(self.RATES['rates'])
+
+        assert fx.rate('usd', 'eur') == pytest.approx(0.9)
+        assert fx.rate('EUR', 'USD') == pytest.approx(1 / 0.9)
+        assert fx.rate('eur', 'try') == pytest.approx(1700000 / 45000)
+        assert fx.rate('btc', 'usd') == pytest.approx(50000)
+        assert fx.matrix.shape == (4, 4)
+        with pytest.raises(ValueError):
+            fx.rate('usd', 'xyz')
+
+    def test_quotes_convert_with_one_rates_fetch(self):
+        """Test that many conversions share one cached exchange_rates call and USD needs none."""
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={"bitcoin": {"usd": 50000}, "ethereum": {"usd": 2000}})
+            assert get_crypto_price_with_fallback("bitcoin", hedged=False) == "Bitcoin price: $50000 (via CoinGecko)"
+            assert m.call_count == 1
+
+            m.get(self.FX, json=self.RATES)
+            assert (get_crypto_price_with_fallback("bitcoin", hedged=False, vs_currency="eur")
+                    == "Bitcoin price: 45000 EUR (via CoinGecko)")
+            prices = get_crypto_prices_bulk(["bitcoin", "ethereum"], vs_currency="try")
+
+        assert prices["ethereum"] == "Ethereum price: 68000 TRY (via CoinGecko)"
+        assert sum(1 for request in m.request_history if request.url.startswith(self.FX)) == 1
+        assert PriceQuote("bitcoin", 1.0, "X").convert("usd").currency == "USD"
+
+    def test_portfolio_and_market_in_currency(self, monkeypatch):
+        """Test that portfolio valuation and the market table convert money columns locally."""
+        from crypto_mcp import calculate_portfolio_returns, MarketUniverse
+        universe = MarketUniverse(size=5)
+        universe._install(_market_rows(5))
+
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={"bitcoin": {"usd": 50000}, "ethereum": {"usd": 2000}})
+            m.get(self.FX, json=self.RATES)
+            result = calculate_portfolio_returns(
+                {"bitcoin": {"amount": 0.5, "cost_basis": 20000}, "ethereum": 2}, vs_currency="eur")
+            rows, total = universe.query(sort_by='rank', descending=False, min_market_cap=8.85e8, vs_currency="eur")
+
+        assert result['currency'] == "EUR"
+        assert result['total_value'] == pytest.approx(0.5 * 45000 + 2 * 1800)
+        assert result['total_cost'] == pytest.approx(20000 + 2 * 1800)
+        assert total == 2  # 900M and 891M EUR; 9.8e8 USD is only 882M EUR
+        assert rows[0]['current_price'] == pytest.approx(90.0)
+        assert universe.get("coin0")['current_price'] == 100.0  # table itself stays in USD
+
+    def test_unknown_currency_message_uses_one_matrix(self):
+        """Test that the unsupported-currency message does not fetch the rates a second time."""
+        from crypto_mcp import get_exchange_rate
+
+        with requests_mock.Mocker() as m, \
+                patch('crypto_mcp.get_fx_matrix', wraps=crypto_mcp.get_fx_matrix) as get_fx_matrix:
+            m.get(self.FX, json=self.RATES)
+            result = get_exchange_rate("usd", "xyz")
+
+        assert get_fx_matrix.call_count == 1
+        assert result == "Unsupported currency: XYZ. Supported: BTC, EUR, TRY, USD"
+
+    def test_async_conversion_does_not_block_the_loop(self):
+        """Test that a cold FX fetch in the async price tools runs off the event loop."""
+        from crypto_mcp import get_multiple_prices_async
+
+        def fake(url, api_name, timeout=10, use_cache=True, json_body=None):
+            if "exchange_rates" in url:
+                time.sleep(0.5)
+                return self.RATES
+            return {"bitcoin": {"usd": 50000}, "ethereum": {"usd": 2000}}
+
+        async def run():
+            gaps, stop = [], asyncio.Event()
+
+            async def ticker():
+                last = time.perf_counter()
+                while not stop.is_set():
+                    await asyncio.sleep(0.01)
+                    now = time.perf_counter()
+                    gaps.append(now - last)
+                    last = now
+
+            tick = asyncio.create_task(ticker())
+            result = await get_multiple_prices_async("bitcoin,ethereum", vs_currency="eur")
+            stop.set()
+            await tick
+            return result, max(gaps)
+
+        with patch('crypto_mcp.safe_api_call', side_effect=fake):
+            result, longest_gap = asyncio.run(run())
+
+        assert "Bitcoin price: 45000 EUR" in result and "Ethereum price: 1800 EUR" in result
+        assert longest_gap < 0.25
+
+    def test_rest_currency_parameter(self):
+        """Test the ?currency= parameter and the 400 for unknown currencies."""
+        from crypto_mcp import app
+        client = app.test_client()
+
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={"bitcoin": {"usd": 50000}})
+            m.get(self.FX, json=self.RATES)
+            body = client.get('/api/prices/bitcoin?currency=eur').get_json()
+            bad = client.get('/api/prices/bitcoin?currency=xyz')
+
+        assert body['currency'] == "EUR"
+        assert body['price'] == pytest.approx(45000)
+        assert bad.status_code == 400
+
+    def test_rest_fx_outage_is_json_503(self):
+        """Test that an exchange-rate provider error maps to a JSON 503, not an HTML 500."""
+        from crypto_mcp import app
+        client = app.test_client()
+
+        with requests_mock.Mocker() as m:
+            m.get(self.SIMPLE_PRICE, json={"bitcoin": {"usd": 50000}})
+            m.get(self.FX, status_code=500)
+            many = client.get('/api/prices?coins=bitcoin&currency=eur')
+            single = client.get('/api/prices/bitcoin?currency=eur')
+
+        assert many.status_code == 503 and "Exchange rates unavailable" in many.get_json()['error']
+        assert single.status_code == 503 and single.get_json()['error']
+
+
+def _range_reply(request, context):
+    """market_chart/range stand-in: one point per UTC midnight in [from, to] plus the 'to' instant."""
+    start, end = int(request.qs['from'][0]), int(request.qs['to'][0])
+    stamps = list(range(-(-start // 86400) * 86400, end, 86400)) + [end]
+    return {"prices": [[ts * 1000, ts / 86400] for ts in stamps],
+            "total_volumes": [[ts * 1000, 1000.0] for ts in stamps]}
+
+
+class TestHistoryStore:
+    """Test cases for incremental history fetches backed by the local time-series store."""
+
+    RANGE = "https://api.coingecko.com/api/v3/coins/bitcoin/market_chart/range"
+    NOW = 1_700_000_000.0
+
+    def _fetch(self, days, now):
+        from crypto_mcp import get_historical_prices
+        with patch('crypto_mcp.time.time', return_value=now):
+            return get_historical_prices("bitcoin", days)
+
+    def test_windows_are_sliced_locally(self):
+        """Test that a smaller or repeated window is served without another download."""
+        with requests_mock.Mocker() as m:
+            m.get(self.RANGE, json=_range_reply)
+            df = self._fetch(30, self.NOW)
+            small = self._fetch(7, self.NOW + 60)
+
+        assert m.call_count == 1
+        assert len(df) == 30  # one row per UTC day; the stub has no point on the partial first day
+        assert list(df.columns) == ['timestamp', 'price', 'date', 'volume']
+        assert df['date'].is_unique and df['timestamp'].is_monotonic_increasing
+        assert len(small) == 8
+        assert small['price'].iloc[-1] == df['price'].iloc[-1]
+
+    def test_only_tail_and_head_gaps_are_fetched(self):
+        """Test that later and wider requests download just the missing ranges."""
+        with requests_mock.Mocker() as m:
+            m.get(self.RANGE, json=_range_reply)
+            self._fetch(30, self.NOW)
+            later = self.NOW + 2 * 86400
+            df = self._fetch(60, later)
+
+        ranges = [(int(r.qs['from'][0]), int(r.qs['to'][0])) for r in m.request_history]
+        assert ranges[1:] == [(int(later - 60 * 86400), int(self.NOW - 30 * 86400)),
+                              (int(self.NOW), int(later))]
+        assert len(df) == 60
+        assert df['price'].iloc[-1] == pytest.approx(later / 86400)
+
+    def test_failed_refresh_serves_stored_points(self):
+        """Test that an upstream failure on the tail falls back to what the store holds."""
+        with requests_mock.Mocker() as m:
+            m.get(self.RANGE, json=_range_reply)
+            self._fetch(10, self.NOW)
+            m.get(self.RANGE, status_code=500)
+            df = self._fetch(10, self.NOW + 86400)
+
+        assert len(df) == 10  # today's row is missing, everything held is still served
+        assert df['price'].iloc[-1] == pytest.approx(self.NOW / 86400)
+
+        with requests_mock.Mocker() as m:
+            m.get("https://api.coingecko.com/api/v3/coins/nocoin/market_chart/range", status_code=500)
+            with pytest.raises(CryptoAPIError):
+                from crypto_mcp import get_historical_prices
+                get_historical_prices("nocoin", 5)
+
+
+class TestColumnarHistory:
+    """Test cases for the memory-mapped columnar history engine."""
+
+    def _store(self, tmp_path, monkeypatch):
+        from crypto_mcp import ColumnarHistoryStore
+        monkeypatch.setattr(crypto_mcp, 'COLUMNAR_INITIAL_CAPACITY', 8)
+        return ColumnarHistoryStore(str(tmp_path / 'columns'))
+
+    def test_append_in_place_and_range_read(self, tmp_path, monkeypatch):
+        """Test in-place appends, capacity growth and binary-search range reads."""
+        import numpy as np
+        store = self._store(tmp_path, monkeypatch)
+        minutes = np.arange(20, dtype=np.int64) * 60_000
+
+        assert store.append("bitcoin", "1m", minutes[:5], np.arange(5.0), volume=1.0) == 5
+        size = os.path.getsize(store.path("bitcoin", "1m"))
+        assert store.append("bitcoin", "1m", minutes[5:8], np.arange(5.0, 8.0)) == 8
+        assert os.path.getsize(store.path("bitcoin", "1m")) == size  # filled spare capacity in place
+        assert store.append("bitcoin", "1m", minutes[8:], np.arange(8.0, 20.0)) == 20
+
+        window = store.read("bitcoin", "1m", start_ms=3 * 60_000, end_ms=6 * 60_000)
+        assert window['close'].tolist() == [3.0, 4.0, 5.0, 6.0]
+        assert isinstance(window['close'], np.memmap)
+        assert window['volume'][0] == 1.0 and np.isnan(window['volume'][-1])
+        assert store.read("ethereum", "1m")['ts'].size == 0
+
+    def test_out_of_order_rows_are_merged(self, tmp_path, monkeypatch):
+        """Test that a late timestamp is sorted into place."""
+        store = self._store(tmp_path, monkeypatch)
+        store.append("bitcoin", "1d", [0, 2000], [1.0, 3.0])
+        store.append("bitcoin", "1d", 1000, 2.0, high=2.5)
+
+        frame = store.read_frame("bitcoin", "1d")
+        assert frame['close'].tolist() == [1.0, 2.0, 3.0]
+        assert frame['high'].tolist() == [1.0, 2.5, 3.0]
+        assert frame.index.is_monotonic_increasing
+
+    def test_read_frame_columns_are_views(self, tmp_path, monkeypatch):
+        """Test that read_frame does not merge (and so copy) the float columns."""
+        import numpy as np
+        import pandas as pd
+        store = self._store(tmp_path, monkeypatch)
+        store.append("bitcoin", "1d", np.arange(5, dtype=np.int64) * 1000, np.arange(5.0), volume=2.0)
+        views = []
+        real_read = store.read
+        monkeypatch.setattr(store, 'read', lambda *args, **kwargs: views.append(real_read(*args, **kwargs)) or views[-1])
+
+        frame = store.read_frame("bitcoin", "1d")
+
+        assert frame['close'].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+        if int(pd.__version__.split('.')[0]) >= 3:
+            assert all(np.shares_memory(frame[name].to_numpy(), views[0][name])
+                       for name in ('open', 'high', 'low', 'close', 'volume', 'market_cap'))
+
+    def test_growth_never_replaces_a_mapped_file(self, tmp_path, monkeypatch):
+        """Test that growing writes a new generation and earlier views stay readable."""
+        import numpy as np
+        store = self._store(tmp_path, monkeypatch)
+        store.append("bitcoin", "1m", np.arange(8, dtype=np.int64), np.arange(8.0))
+        first = store.path("bitcoin", "1m")
+        held = store.read("bitcoin", "1m")['close']
+
+        replaced = []
+        monkeypatch.setattr(crypto_mcp.os, 'replace', lambda src, dst: replaced.append(dst) or os.rename(src, dst))
+        removed = []
+        def refuse_remove(path):  # Windows: a mapped file cannot be deleted
+            removed.append(path)
+            raise PermissionError(path)
+        monkeypatch.setattr(crypto_mcp.os, 'remove', refuse_remove)
+        assert store.append("bitcoin", "1m", np.arange(8, 12, dtype=np.int64), np.arange(8.0, 12.0)) == 12
+
+        assert replaced == [store.path("bitcoin", "1m")] and first not in replaced
+        assert removed == [first] and os.path.exists(first)
+        assert held.tolist() == [float(i) for i in range(8)]
+        assert store.read("bitcoin", "1m")['close'].tolist() == [float(i) for i in range(12)]
+
+        monkeypatch.undo()
+        monkeypatch.setattr(crypto_mcp, 'COLUMNAR_INITIAL_CAPACITY', 8)
+        del held
+        store.append("bitcoin", "1m", np.arange(12, 20, dtype=np.int64), np.arange(12.0, 20.0))
+        assert sorted(os.listdir(os.path.dirname(first))) == ["1m.2.col"]
+        assert store.rows("bitcoin", "1m") == 20
+
+    def test_rejects_path_traversal_ids(self, tmp_path, monkeypatch):
+        """Test that coin ids and intervals cannot escape the store directory."""
+        from crypto_mcp import save_price_to_db
+        store = self._store(tmp_path, monkeypatch)
+        monkeypatch.setattr(crypto_mcp, 'columnar_history', store)
+        monkeypatch.setattr(crypto_mcp, 'HISTORY_STORAGE_ENGINE', 'columnar')
+
+        for coin_id in ("../outside", "..", "a/b", "a\\b", "/etc/passwd", ".hidden", "", "bit..coin"):
+            with pytest.raises(ValueError):
+                store.path(coin_id, "1d")
+        with pytest.raises(ValueError):
+            store.append("bitcoin", "../../1d", 0, 1.0)
+        assert not save_price_to_db("../escaped", 1.0)
+
+        assert store.path("usd-coin", "1d") == os.path.join(store.root, "usd-coin", "1d.col")
+        assert not (tmp_path / "escaped").exists() and not (tmp_path / "outside").exists()
+
+    def test_engine_switch_for_stored_prices(self, tmp_path, monkeypatch):
+        """Test that save/get_price_history_from_db use the columnar engine when selected."""
+        from crypto_mcp import save_price_to_db, get_price_history_from_db
+        monkeypatch.setattr(crypto_mcp, 'columnar_history', self._store(tmp_path, monkeypatch))
+        monkeypatch.setattr(crypto_mcp, 'HISTORY_STORAGE_ENGINE', 'columnar')
+
+        with patch('crypto_mcp.sqlite3.connect', side_effect=AssertionError("sqlite used")):
+            assert save_price_to_db("bitcoin", 50000.0, volume=10.0, source="test")
+            assert save_price_to_db("bitcoin", 50100.0, source="test")
+            df = get_price_history_from_db("bitcoin", days=1)
+
+        assert df['price'].tolist() == [50000.0, 50100.0]
+        assert list(df.columns) == ['price', 'volume', 'market_cap']
+
+
+class TestSchemaMigrations:
+    """Test cases for crypto_data.db schema migrations and pragmas."""
+
+    LEGACY_SCHEMA = """
+        CREATE TABLE price_history (id INTEGER PRIMARY KEY AUTOINCREMENT, coin_id TEXT NOT NULL,
+            price REAL NOT NULL, volume REAL, market_cap REAL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, source TEXT NOT NULL);
+        CREATE TABLE portfolio (id INTEGER PRIMARY KEY AUTOINCREMENT, coin_id TEXT NOT NULL,
+            amount REAL NOT NULL, purchase_price REAL NOT NULL,
+            purchase_date DATETIME DEFAULT CURRENT_TIMESTAMP, notes TEXT);
+        INSERT INTO price_history (coin_id, price, timestamp, source)
+            VALUES ('bitcoin', 45000.0, '2025-12-26 22:39:23', 'test');
+    """
+
+    def _legacy_db(self):
+        import sqlite3
+        conn = sqlite3.connect(crypto_mcp.DATA_DB_PATH)
+        conn.executescript(self.LEGACY_SCHEMA)
+        conn.close()
+
+    def test_upgrades_legacy_database_in_place(self):
+        """Test that an unversioned database gets ts, indexes, WAL and the latest version."""
+        from crypto_mcp import init_database, connect_data_db, SCHEMA_VERSION
+        self._legacy_db()
+
+        init_database()
+        init_database()  # second run is a no-op
+
+        conn = connect_data_db()
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('SELECT ts FROM price_history').fetchone()[0] == 1766788763
+        plan = conn.execute('EXPLAIN QUERY PLAN SELECT price FROM price_history '
+                            'WHERE coin_id = ? AND ts >= ? ORDER BY ts', ('bitcoin', 0)).fetchall()
+        conn.close()
+        assert 'idx_price_history_coin_ts' in str(plan)
+
+    def test_range_query_uses_integer_timestamps(self):
+        """Test that new rows get ts and old legacy rows fall outside the window."""
+        import pandas as pd
+        from crypto_mcp import save_price_to_db, get_price_history_from_db
+        self._legacy_db()
+
+        with patch('crypto_mcp.time.time', return_value=1_800_000_000.0):
+            assert save_price_to_db("bitcoin", 50000.0, source="test")
+            df = get_price_history_from_db("bitcoin", days=30)
+
+        assert df['price'].tolist() == [50000.0]
+        assert df.index[0] == pd.Timestamp(1_800_000_000, unit='s')  # timestamp agrees with ts
+
+    def test_drifted_timestamps_are_realigned(self):
+        """Test that v3 rewrites timestamp from ts for rows stamped at flush time."""
+        from crypto_mcp import init_database, connect_data_db, SCHEMA_MIGRATIONS
+        with patch.object(crypto_mcp, 'SCHEMA_MIGRATIONS', SCHEMA_MIGRATIONS[:2]):
+            init_database()
+        conn = connect_data_db()
+        with conn:
+            conn.execute("INSERT INTO price_history (coin_id, price, source, ts, timestamp) "
+                         "VALUES ('bitcoin', 1.0, 'test', 1800000000, '2027-01-15 08:00:04')")
+            conn.execute("INSERT INTO price_history (coin_id, price, source, ts, timestamp) "
+                         "VALUES ('bitcoin', 2.0, 'test', 1800000001, '2027-01-15 08:00:01.250')")
+
+        init_database()
+
+        stamps = [row[0] for row in conn.execute('SELECT timestamp FROM price_history ORDER BY ts')]
+        conn.close()
+        assert stamps == ['2027-01-15 08:00:00', '2027-01-15 08:00:01.250']
+
+    def test_failed_migration_rolls_back(self, monkeypatch):
+        """Test that a failing step leaves the schema at the previous version."""
+        from crypto_mcp import init_database, connect_data_db, SCHEMA_MIGRATIONS, SCHEMA_VERSION
+        init_database()
+        monkeypatch.setattr(crypto_mcp, 'SCHEMA_MIGRATIONS', SCHEMA_MIGRATIONS + [
+            (SCHEMA_VERSION + 1, ['CREATE TABLE half_done (x INTEGER)', 'ALTER TABLE missing ADD COLUMN y'])
+        ])
+
+        with pytest.raises(Exception):
+            init_database()
+
+        conn = connect_data_db()
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone()[0] == 0
+        conn.close()
+
+
+class TestDatabaseLayer:
+    """Test cases for the shared crypto_data.db access layer."""
+
+    def test_connections_are_reused_per_thread(self):
+        """Test that each thread keeps one connection and the schema is checked once."""
+        from crypto_mcp import database, save_price_to_db
+        with patch('crypto_mcp.migrate_database', wraps=crypto_mcp.migrate_database) as migrate:
+            assert save_price_to_db("bitcoin", 1.0, source="test")
+            conn = database.connection()
+            assert save_price_to_db("bitcoin", 2.0, source="test")
+            assert database.connection() is conn
+
+            other = []
+            worker = threading.Thread(target=lambda: other.append(database.connection()))
+            worker.start()
+            worker.join()
+
+        assert other[0] is not conn
+        assert migrate.call_count == 1
+        assert crypto_mcp.price_writer.flush()  # save_price_to_db is write-behind
+        assert database.query('SELECT COUNT(*) FROM price_history')[0][0] == 2
+
+    def test_short_lived_threads_do_not_leak_connections(self):
+        """Test that a connection is closed when its thread exits (thread-per-request servers)."""
+        import gc
+        import sqlite3
+        from crypto_mcp import database
+        database.connection()
+        opened = []
+
+        def request():
+            conn = database.connection()
+            conn.execute('SELECT 1').fetchone()
+            opened.append(conn)
+
+        for _ in range(50):
+            worker = threading.Thread(target=request)
+            worker.start()
+            worker.join()
+        gc.collect()
+
+        assert len(opened) == 50
+        assert database.open_connections() <= 2  # This thread + the price writer, at most
+        with pytest.raises(sqlite3.ProgrammingError):
+            opened[0].execute('SELECT 1')
+        assert database.query('SELECT 1')[0][0] == 1
+
+    def test_close_reopens_lazily(self):
+        """Test that close() drops every connection and the next call opens a fresh one."""
+        from crypto_mcp import database
+        conn = database.connection()
+        database.close()
+
+        assert database.connection() is not conn
+        assert database.query('PRAGMA journal_mode')[0][0] == 'wal'
+
+    def test_portfolio_roundtrip_and_env_path(self, tmp_path):
+        """Test portfolio writes/reads through the layer and the CRYPTO_MCP_DB_PATH override."""
+        import subprocess
+        from crypto_mcp import save_portfolio_to_db, get_portfolio_from_db
+        assert "saved" in save_portfolio_to_db("bitcoin", 0.5, 30000.0, "dca")
+        assert "bitcoin" in get_portfolio_from_db()
+
+        db_path = tmp_path / 'custom.db'
+        out = subprocess.run(
+            [sys.executable, '-c', 'import crypto_mcp; print(crypto_mcp.database.path)'],
+            env=dict(os.environ, CRYPTO_MCP_DB_PATH=str(db_path)), capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        assert out.stdout.strip().splitlines()[-1] == str(db_path)
+
+
+class TestPriceWriter:
+    """Test cases for the write-behind price_history writer."""
+
+    def _count(self):
+        return crypto_mcp.database.query('SELECT COUNT(*) FROM price_history')[0][0]
+
+    def test_ticks_are_batched(self, monkeypatch):
+        """Test that queued ticks land in a few executemany transactions."""
+        from crypto_mcp import PriceWriter, save_price_to_db
+        writer = PriceWriter(batch_size=100)
+        monkeypatch.setattr(crypto_mcp, 'price_writer', writer)
+
+        assert all(save_price_to_db("bitcoin", float(i), source="test") for i in range(1000))
+        assert writer.flush()
+
+        status = writer.status()
+        assert self._count() == 1000
+        assert status['written'] == 1000 and status['queue_depth'] == 0
+        assert 10 <= status['batches'] < 1000
+        assert status['avg_flush_ms'] is not None
+        writer.stop()
+
+    def test_backpressure_drops_when_full(self, monkeypatch):
+        """Test that a stalled writer blocks producers briefly, then drops instead of growing."""
+        from crypto_mcp import PriceWriter
+        writer = PriceWriter(max_queue=2, batch_size=1, put_timeout=0.05)
+        release = threading.Event()
+        real_executemany = crypto_mcp.database.executemany
+
+        def slow_executemany(sql, rows):
+            release.wait(5)
+            return real_executemany(sql, rows)
+
+        monkeypatch.setattr(crypto_mcp.database, 'executemany', slow_executemany)
+        accepted = [writer.submit(("bitcoin", 1.0, None, None, "test", 0)) for _ in range(6)]
+        release.set()
+        assert writer.flush()
+
+        assert accepted.count(False) == writer.status()['dropped'] > 0
+        assert writer.status()['blocked_puts'] >= writer.status()['dropped']
+        assert self._count() == accepted.count(True)
+        writer.stop()
+
+    def test_reads_and_shutdown_flush_first(self):
+        """Test that history reads see queued ticks and stop() writes the backlog."""
+        from crypto_mcp import save_price_to_db, get_price_history_from_db
+        assert save_price_to_db("bitcoin", 50000.0, source="test")
+        assert get_price_history_from_db("bitcoin", days=1)['price'].tolist() == [50000.0]
+
+        for i in range(50):
+            save_price_to_db("ethereum", float(i), source="test")
+        crypto_mcp.price_writer.stop()
+
+        assert self._count() == 51
+        assert not crypto_mcp.price_writer.status()['running']
+
+    def test_any_write_error_is_counted_and_the_thread_survives(self, monkeypatch):
+        """Test that non-sqlite errors fail the batch without killing the writer or hanging flush()."""
+        from crypto_mcp import PriceWriter
+        writer = PriceWriter(batch_size=10)
+        real_executemany = crypto_mcp.database.executemany
+        calls = []
+
+        def flaky_executemany(sql, rows):
+            calls.append(len(rows))
+            if len(calls) == 1:
+                raise TypeError("bad row")
+            return real_executemany(sql, rows)
+
+        monkeypatch.setattr(crypto_mcp.database, 'executemany', flaky_executemany)
+        assert writer.submit(("bitcoin", 1.0, None, None, "test", 0))
+        assert writer.flush(2)
+        assert writer.submit(("bitcoin", 2.0, None, None, "test", 0))
+        assert writer.flush(2)
+
+        status = writer.status()
+        assert status['failed'] == 1 and status['written'] == 1 and status['running']
+        assert self._count() == 1
+        writer.stop()
+
+    def test_counters_are_exact_under_concurrency(self):
+        """Test that counters updated from many producer threads add up."""
+        from crypto_mcp import PriceWriter
+        writer = PriceWriter(batch_size=500)
+        threads = [threading.Thread(target=lambda: [writer.submit(("bitcoin", 1.0, None, None, "test", 0))
+                                                    for _ in range(250)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert writer.flush()
+
+        status = writer.status()
+        assert status['submitted'] + status['dropped'] == 2000
+        assert status['written'] == status['submitted'] == self._count()
+        writer.stop()
+
+    def test_stop_does_not_block_on_a_full_queue(self, monkeypatch):
+        """Test that stop() gives up with a warning when the stop marker cannot be queued."""
+        from crypto_mcp import PriceWriter
+        writer = PriceWriter(max_queue=1, batch_size=1, put_timeout=0.01)
+        release = threading.Event()
+        real_executemany = crypto_mcp.database.executemany
+
+        def stalled_executemany(sql, rows):
+            release.wait(5)
+            return real_executemany(sql, rows)
+
+        monkeypatch.setattr(crypto_mcp.database, 'executemany', stalled_executemany)
+        for _ in range(3):
+            writer.submit(("bitcoin", 1.0, None, None, "test", 0))
+
+        with patch.object(crypto_mcp.logger, 'warning') as warning:
+            started = time.time()
+            writer.stop(timeout=0.2)
+            elapsed = time.time() - started
+
+        assert elapsed < 1.0
+        assert any("not waiting for it to stop" in call.args[0] for call in warning.call_args_list)
+        release.set()
+        assert writer.flush()
+        writer.stop()
+        assert not writer.status()['running']
+
+
+class TestHttpSessions:
+    """Test cases for the pooled per-provider HTTP sessions."""
+
+    def test_session_reused_per_provider(self):
+        """Test that the same provider always gets the same session."""
+        first = get_http_session("CoinGecko")
+        second = get_http_session("CoinGecko")
+        other = get_http_session("Binance")
+
+        assert first is second
+        assert first is not other
+        assert first.headers['Connection'] == 'keep-alive'
+
+    def test_pool_configuration(self):
+        """Test that pool size overrides are applied to new sessions."""
+        try:
+            configure_http_pool(pool_maxsize=42, api_name="PoolTestAPI")
+            session = get_http_session("PoolTestAPI")
+            adapter = session.get_adapter("https://api.example.com")
+            assert adapter._pool_maxsize == 42
+        finally:
+            close_http_sessions("PoolTestAPI")
+
+    def test_safe_api_call_uses_session(self):
+        """Test that safe_api_call goes through the provider session."""
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+        with requests_mock.Mocker() as m:
+            url = "https://api.example.com/session"
+            m.get(url, json={"ok": True})
+
+            with patch.object(get_http_session("TestAPI"), 'get', wraps=get_http_session("TestAPI").get) as spy:
+                assert safe_api_call(url, "TestAPI") == {"ok": True}
+                spy.assert_called_once()
+
+
+class TestAsyncApiCall:
+    """Test cases for the asyncio HTTP core."""
+
+    def test_async_successful_call_is_cached(self):
+        """Test that async calls return data and share the sync cache."""
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+        with requests_mock.Mocker() as m:
+            url = "https://api.example.com/async"
+            m.get(url, json={"price": 1})
+
+            result = asyncio.run(async_safe_api_call(url, "TestAPI"))
+
+            assert result == {"price": 1}
+            assert get_cached_data(url) == {"price": 1}
+
+    def test_async_error_hierarchy(self):
+        """Test that async calls raise the same exception types."""
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+        with requests_mock.Mocker() as m:
+            url = "https://api.example.com/async-limited"
+            m.get(url, status_code=429)
+
+            with pytest.raises(APIRateLimitError):
+                asyncio.run(async_safe_api_call(url, "TestAPI"))
+
+    def test_async_calls_overlap(self):
+        """Test that concurrent async calls do not run one after another."""
+        def slow_call(url, api_name, timeout=10, use_cache=True, json_body=None):
+            time.sleep(0.3)
+            return {"url": url}
+
+        async def run_all():
+            return await asyncio.gather(*(
+                async_safe_api_call(f"https://api.example.com/slow/{i}", "TestAPI", use_cache=False)
+                for i in range(4)
+            ))
+
+        with patch('crypto_mcp.safe_api_call', side_effect=slow_call):
+            started = time.time()
+            results = asyncio.run(run_all())
+            elapsed = time.time() - started
+
+        assert len(results) == 4
+        assert elapsed < 1.0
+
+
+class TestHedgedFallback:
+    """Test cases for the hedged provider fallback chain."""
+
+    COINGECKO_URL = "https://api.coingecko.com/api/v3/simple/price?ids=hedgecoin&vs_currencies=usd"
+    COINSTATS_URL = "https://api.coinstats.app/public/v1/coins/hedgecoin"
+    COINPAPRIKA_URL = "https://api.coinpaprika.com/v1/tickers/hedgecoin-bitcoin"
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def _fake_api_call(self, url, api_name, timeout=10, use_cache=True, json_body=None):
+        # requests_mock serializes requests across threads, so concurrency is simulated here
+        if api_name == "CoinGecko":
+            time.sleep(1.5)
+            return {"hedgecoin": {"usd": 1.0}}
+        if api_name == "CoinStats":
+            return {"coin": {"price": 2.0}}
+        raise APINetworkError("Connection failed", api_name)
+
+    def test_hedged_returns_fastest_healthy_provider(self):
+        """Test that a slow first provider does not hold up the answer."""
+        with patch('crypto_mcp.safe_api_call', side_effect=self._fake_api_call):
+            started = time.time()
+            result = get_crypto_price_with_fallback("hedgecoin", hedged=True, hedge_delay=0.1)
+            elapsed = time.time() - started
+
+        assert "via CoinStats" in result
+        assert elapsed < 1.0
+
+    def test_sequential_mode_waits_for_first_provider(self):
+        """Test that hedging can be disabled to keep the strict provider order."""
+        with requests_mock.Mocker() as m:
+            m.get(self.COINGECKO_URL, json={"hedgecoin": {"usd": 1.0}})
+            m.get(self.COINSTATS_URL, json={"coin": {"price": 2.0}})
+
+            result = get_crypto_price_with_fallback("hedgecoin", hedged=False)
+
+        assert "via CoinGecko" in result
+        assert m.call_count == 1
+
+    def test_hedged_all_providers_fail(self):
+        """Test the error message when every provider fails."""
+        with requests_mock.Mocker() as m:
+            m.get(self.COINGECKO_URL, status_code=500)
+            m.get(self.COINSTATS_URL, status_code=500)
+            m.get(self.COINPAPRIKA_URL, status_code=500)
+
+            result = get_crypto_price_with_fallback("hedgecoin", hedged=True, hedge_delay=0.1)
+
+        assert result.startswith("Unable to fetch price for hedgecoin")
+
+    def test_async_hedged_returns_fastest_healthy_provider(self):
+        """Test the async hedged chain."""
+        with patch('crypto_mcp.safe_api_call', side_effect=self._fake_api_call):
+            started = time.time()
+            result = asyncio.run(async_get_crypto_price_with_fallback("hedgecoin", hedged=True, hedge_delay=0.1))
+            elapsed = time.time() - started
+
+        assert "via CoinStats" in result
+        assert elapsed < 1.0
+
+
+class TestSingleFlight:
+    """Test cases for in-flight request coalescing."""
+
+    def setup_method(self):
+        from crypto_mcp import price_cache
+        price_cache.clear()
+
+    def _call_concurrently(self, url, count=5, **kwargs):
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(safe_api_call(url, "TestAPI", **kwargs))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def test_concurrent_identical_calls_share_one_fetch(self):
+        """Test that concurrent callers for the same URL trigger one upstream request."""
+        def slow_response(request, context):
+            time.sleep(0.3)
+            return {"price": 42}
+
+        with requests_mock.Mocker() as m:
+            url = "https://api.example.com/single-flight"
+            m.get(url, json=slow_response)
+
+            results, errors = self._call_concurrently(url)
+
+        assert not errors
+        assert results == [{"price": 42}] * 5
+        assert m.call_count == 1
+
+    def test_followers_receive_leader_error(self):
+        """Test that a failed shared fetch raises the same error for every caller."""
+        def slow_failure(request, context):
+            time.sleep(0.3)
+            context.status_code = 429
+            return "Rate limit exceeded"
+
+        with requests_mock.Mocker() as m:
+            url = "https://api.example.com/single-flight-error"
+            m.get(url, text=slow_failure)
+
+            results, errors = self._call_concurrently(url, count=3)
+
+        assert not results
+        assert len(errors) == 3
+        assert all(isinstance(e, APIRateLimitError) for e in errors)
+        assert m.call_count == 1
+
+    def test_post_body_is_part_of_key(self):
+        """Test that POST requests are cached per body."""
+        with requests_mock.Mocker() as m:
+            url = "https://api.example.com/graphql"
+            m.post(url, [{'json': {"data": 1}}, {'json': {"data": 2}}])
+
+            first = safe_api_call(url, "TestAPI", json_body={"query": "a"})
+            second = safe_api_call(url, "TestAPI", json_body={"query": "b"})
+            again = safe_api_call(url, "TestAPI", json_body={"query": "a"})
+
+        assert first == again == {"data": 1}
+        assert second == {"data": 2}
+        assert m.call_count == 2
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file